@@ -1,20 +1,32 @@
 # -*- coding: utf-8 -*-
 """
-AI MVP 
-ģ黯ƣάչ
+AI秘书 MVP 后端
+模块化设计，易于维护和扩展
 """
 
 from flask import Flask, render_template, request, jsonify
 from flask_socketio import SocketIO
 from flask_cors import CORS
-import sqlite3
 import os
-import requests
 import json
+import time
+import uuid
 from datetime import datetime, timedelta
 from dateutil import parser as dateparser
 from apscheduler.schedulers.background import BackgroundScheduler
 from dotenv import load_dotenv
+from database import Database, TASK_UPDATABLE_FIELDS
+from models import duration_to_minutes
+from engine import Problem, place_in_order, solve, STRATEGIES
+from intervals import FreeIntervals
+from scheduler import Scheduler
+from batch import BatchPlanner
+from llm import LLMClient, LLMError
+from llm_cache import ResponseCache, rebase_deadline
+from enrichment import TaskEnricher
+from task_parser import quick_parse, stats as parser_stats
+from occupancy import OccupancyGrid
+import recurrence
 import pytesseract
 from PIL import Image
 import io
@@ -22,7 +34,6 @@ import base64
 
 load_dotenv()
 DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY")
-DEEPSEEK_API_URL = "https://api.deepseek.com/v1/chat/completions"
 
 app = Flask(__name__)
 CORS(app)
@@ -30,116 +41,91 @@ socketio = SocketIO(app, cors_allowed_origins="*")
 
 DB_FILE = "tasks.db"
 
-# ===========================
-# ݿʼ
-# ===========================
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # 
-    c.execute('''CREATE TABLE IF NOT EXISTS tasks (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        content TEXT NOT NULL,
-        category TEXT,
-        priority TEXT CHECK(priority IN ('high','medium','low')),
-        estimated_duration TEXT,
-        deadline TEXT,
-        scheduled_start TEXT,
-        scheduled_end TEXT,
-        status TEXT DEFAULT 'pending',
-        created_at TEXT,
-        completed_at TEXT
-    )''')
-    
-    # ̶ճ̱
-    c.execute('''CREATE TABLE IF NOT EXISTS fixed_schedules (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        title TEXT NOT NULL,
-        day_of_week INTEGER,
-        start_time TEXT,
-        end_time TEXT,
-        recurrence TEXT DEFAULT 'weekly',
-        location TEXT,
-        source TEXT DEFAULT 'manual'
-    )''')
-    
-    # ûƫ
-    c.execute('''CREATE TABLE IF NOT EXISTS user_preferences (
-        id INTEGER PRIMARY KEY CHECK(id = 1),
-        work_start_time TEXT DEFAULT '09:00',
-        work_end_time TEXT DEFAULT '18:00',
-        break_duration TEXT DEFAULT '15m',
-        focus_time_preference TEXT,
-        enable_main_chat INTEGER DEFAULT 1,
-        sleep_reminder_time TEXT DEFAULT '22:00',
-        auto_reschedule_on_drag INTEGER DEFAULT 0
-    )''')
-    
-    # Իʷ
-    c.execute('''CREATE TABLE IF NOT EXISTS chat_history (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        role TEXT,
-        content TEXT,
-        timestamp TEXT
-    )''')
-    
-    # ʼûƫãڣ
-    c.execute("INSERT OR IGNORE INTO user_preferences (id) VALUES (1)")
-    
-    conn.commit()
-    conn.close()
-
-init_db()
-
-# ===========================
-# ߺDeepSeek API
-# ===========================
-def call_deepseek(prompt, system_prompt=None, temperature=0.0):
-    """ͳһDeepSeek API"""
-    headers = {"Authorization": f"Bearer {DEEPSEEK_API_KEY}"}
-    messages = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": prompt})
-    
-    data = {
-        "model": "deepseek-chat",
-        "messages": messages,
-        "temperature": temperature
-    }
-    
-    try:
-        resp = requests.post(DEEPSEEK_API_URL, headers=headers, json=data, timeout=15)
-        content = resp.json()["choices"][0]["message"]["content"].strip()
-        return content
-    except Exception as e:
-        return f"APIʧ: {str(e)}"
+# 对话历史热窗口：chat_history 只保留最近这么多条，更早的由定时任务归档
+CHAT_HOT_WINDOW = int(os.getenv("CHAT_HOT_WINDOW", "1000"))
+# 删除墓碑保留天数：比这更久没同步的客户端拿不到增量，改为全量（full=true）
+SYNC_TOMBSTONE_DAYS = int(os.getenv("SYNC_TOMBSTONE_DAYS", "30"))
+
+# 统一数据访问层：所有路由和定时任务共用同一个 Database（内部带连接池）
+db = Database(DB_FILE)
+# 所有 LLM 调用共用一个带连接池的客户端（keep-alive、限流/5xx 重试）
+llm = LLMClient(DEEPSEEK_API_KEY)
+# 任务解析、课表 OCR 这类确定性调用的结果缓存（内存 LRU + SQLite）
+llm_cache = ResponseCache(db)
+planner = Scheduler(db, llm=llm)
+# 多天批量排期：单日作业分发到进程池
+batch_planner = BatchPlanner(db)
+# 每晚规划明天所用的策略
+BATCH_STRATEGY = os.getenv("BATCH_STRATEGY", "local")
 
 # ===========================
-# AIģ飺
+# 工具函数：DeepSeek API调用
 # ===========================
-def analyze_task(text):
+def call_deepseek(prompt, system_prompt=None, temperature=0.0, endpoint="chat"):
     """
-    AI񣺷ࡢȼԤʱֹ
+    统一的DeepSeek API调用，endpoint 决定超时（parse/chat/schedule，见 llm.TIMEOUTS）
+    失败时抛出 llm.LLMError（不再把错误信息当作回复内容返回）
     """
-    prompt = f"""
-뽫ûΪJSONʽֶΣ
-- task: 
-- category: ࣨ/ѧϰ//
-- priority: ȼhigh/medium/low
-- estimated_duration: Ԥʱʽ30m  2h
-- deadline: ֹڣISOʽnull
+    return llm.complete(prompt, system_prompt, temperature=temperature, endpoint=endpoint)
 
-û룺{text}
+# ===========================
+# AI模块：任务解析
+# ===========================
+def task_prompt(text):
+    """任务解析的提示词（不含当前时间，同时用作缓存键）"""
+    return f"""
+请将以下用户输入解析为JSON格式，包含以下字段：
+- task: 任务简短描述
+- category: 分类（工作/学习/生活/其他）
+- priority: 优先级（high/medium/low）
+- estimated_duration: 预计时长（格式：30m 或 2h）
+- deadline: 截止日期（ISO格式或null）
+
+用户输入：{text}
 
-JSONҪ˵
+仅返回JSON，不要其他说明。
 """
+
+def cached_task_analysis(text, now=None):
+    """缓存里已有的解析结果（相对日期的截止时间按现在重新换算），没有时返回 None"""
+    text = " ".join(text.split())
+    cached = llm_cache.get(llm_cache.key(task_prompt(text), llm.model, 0.0))
+    if not cached:
+        return None
+    parsed = json.loads(cached.response)
+    # 模型原样给出的 deadline 和换算后的 deadline_iso 都是缓存当时的日期，两个都要平移
+    for field in ("deadline", "deadline_iso"):
+        if parsed.get(field):
+            parsed[field] = rebase_deadline(text, parsed[field], cached.created_at, now)
+    return parsed
+
+def analyze_task(text, use_rules=True):
+    """
+    AI解析任务：分类、优先级、预计时长、截止日期
+    先用规则解析（task_parser），置信度够高时直接返回，不调用 LLM；
+    相同（规范化后）的输入直接用缓存结果，其中相对日期的截止时间按现在重新换算
+    """
+    now = datetime.now()
+    text = " ".join(text.split())
+    if use_rules:
+        parsed = quick_parse(text, now)
+        if parsed["fast_path"]:
+            return parsed
+    parsed = cached_task_analysis(text, now)
+    if parsed:
+        return parsed
     
-    result = call_deepseek(prompt)
-    
+    # 缓存键不含当前时间（否则每分钟都不同）
+    prompt = task_prompt(text)
+    key = llm_cache.key(prompt, llm.model, 0.0)
     try:
-        # ܵmarkdown
+        # 告诉模型现在的时间，"明天"、"周五前"才能解析成正确的日期
+        weekday = recurrence.WEEKDAY_NAMES[recurrence.day_of_week(now)]
+        started = time.perf_counter()
+        result = call_deepseek(f"当前时间：{now:%Y-%m-%d %H:%M}（{weekday}）\n{prompt}", endpoint="parse")
+        parser_stats.record_llm(time.perf_counter() - started)
+        
+        # 清理可能的markdown代码块
         if result.startswith("```"):
             result = result.split("```")[1]
             if result.startswith("json"):
@@ -147,7 +133,7 @@ def analyze_task(text):
         
         parsed = json.loads(result.strip())
         
-        # deadline
+        # 解析deadline
         if parsed.get("deadline"):
             try:
                 dt = dateparser.parse(parsed["deadline"])
@@ -156,12 +142,13 @@ def analyze_task(text):
                 parsed["deadline_iso"] = None
         else:
             parsed["deadline_iso"] = None
-            
+        
+        llm_cache.put(key, json.dumps(parsed, ensure_ascii=False))
         return parsed
     except Exception as e:
         return {
             "task": text,
-            "category": "δ",
+            "category": "未分类",
             "priority": "medium",
             "estimated_duration": "1h",
             "deadline_iso": None,
@@ -169,173 +156,117 @@ def analyze_task(text):
         }
 
 # ===========================
-# AIģ飺OCRʶα
+# AI模块：OCR识别课表
 # ===========================
 def ocr_schedule_image(image_data):
     """
-    ʹTesseract OCRʶαͼƬ
-    ʶıAIΪṹ
+    使用Tesseract OCR识别课表图片
+    返回识别的文本，再用AI解析为结构化数据
     """
     try:
-        # base64ͼƬ
+        # 解码base64图片
         image_bytes = base64.b64decode(image_data.split(',')[1])
         image = Image.open(io.BytesIO(image_bytes))
         
-        # OCRʶ
+        # OCR识别
         text = pytesseract.image_to_string(image, lang='chi_sim+eng')
         
-        # AIΪṹα
+        # AI解析为结构化课表
         prompt = f"""
-ǿαOCRʶΪJSON飬ÿγ̰
-- title: γ
-- day_of_week: ڼ0=գ1=һ...6=
-- start_time: ʼʱ䣨HH:MMʽ
-- end_time: ʱ䣨HH:MMʽ
-- location: ص㣨У
-
-OCRı
+以下是课表OCR识别结果，请解析为JSON数组，每个课程包含：
+- title: 课程名称
+- day_of_week: 星期几（0=周日，1=周一...6=周六）
+- start_time: 开始时间（HH:MM格式）
+- end_time: 结束时间（HH:MM格式）
+- location: 地点（如果有）
+
+OCR文本：
 {text}
 
-JSONʽ
+返回JSON数组格式。
 """
-        result = call_deepseek(prompt)
+        # 重复上传同一张课表时 OCR 文本相同，直接用缓存结果
+        key = llm_cache.key(prompt, llm.model, 0.0)
+        cached = llm_cache.get(key)
+        if cached:
+            return {"success": True, "schedules": json.loads(cached.response), "raw_text": text}
+        
+        result = call_deepseek(prompt, endpoint="parse")
         
-        # 
+        # 清理并解析
         if result.startswith("```"):
             result = result.split("```")[1]
             if result.startswith("json"):
                 result = result[4:]
         
         schedules = json.loads(result.strip())
+        llm_cache.put(key, json.dumps(schedules, ensure_ascii=False))
         return {"success": True, "schedules": schedules, "raw_text": text}
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
 # ===========================
-# 㷨̰㷨
+# 排期算法：本地贪心算法
 # ===========================
-def greedy_schedule(tasks, fixed_schedules, work_start, work_end):
-    """
-    ̰㷨ȼͽֹҿʱ
+def greedy_schedule(tasks, fixed_schedules, work_start, work_end, strategy="greedy"):
     """
-    # ʱ
-    work_start_minutes = time_to_minutes(work_start)
-    work_end_minutes = time_to_minutes(work_end)
+    当天排期：默认贪心（按优先级和截止日期排序，依次找可用时段），策略见 engine.STRATEGIES
     
-    # ȡ
-    today = datetime.now().date()
-    
-    # ȼͽֹ
-    priority_map = {"high": 3, "medium": 2, "low": 1}
-    sorted_tasks = sorted(
-        tasks,
-        key=lambda t: (
-            -priority_map.get(t.get("priority", "medium"), 2),
-            t.get("deadline") or "9999-12-31"
-        )
-    )
-    
-    # ռʱΣ̶ճ̣
-    occupied = []
-    for fs in fixed_schedules:
-        if fs.get("day_of_week") == today.weekday():
-            start_min = time_to_minutes(fs["start_time"])
-            end_min = time_to_minutes(fs["end_time"])
-            occupied.append((start_min, end_min))
-    
-    occupied.sort()
-    
-    # Ϊÿʱ
-    scheduled = []
-    current_time = work_start_minutes
+    fixed_schedules 为当天的固定日程（db.get_fixed_occurrences_for_date 的结果）；
+    返回的开始/结束时间为 ISO 时间（YYYY-MM-DDTHH:MM:SS），与其他排期入口一致
+    """
+    busy = [(time_to_minutes(fs["start_time"]), time_to_minutes(fs["end_time"]))
+            for fs in fixed_schedules]
+    problem = Problem(tasks, busy, time_to_minutes(work_start), time_to_minutes(work_end))
+    solution = solve(problem, strategy)
     
-    for task in sorted_tasks:
-        duration = duration_to_minutes(task.get("estimated_duration", "1h"))
-        
-        # Ѱҿʱ
-        task_start = find_available_slot(current_time, duration, work_end_minutes, occupied)
-        
-        if task_start is not None:
-            task_end = task_start + duration
-            scheduled.append({
-                "id": task["id"],
-                "scheduled_start": minutes_to_time(task_start),
-                "scheduled_end": minutes_to_time(task_end)
-            })
-            occupied.append((task_start, task_end))
-            occupied.sort()
-            current_time = task_end
-    
-    return scheduled
+    return [problem.slot(i, start) for i, start in solution.placements]
 
 def time_to_minutes(time_str):
-    """HH:MMתΪ"""
+    """将HH:MM转为分钟数"""
     h, m = map(int, time_str.split(':'))
     return h * 60 + m
 
 def minutes_to_time(minutes):
-    """תΪHH:MM"""
+    """将分钟数转为HH:MM"""
     h = minutes // 60
     m = minutes % 60
     return f"{h:02d}:{m:02d}"
 
-def duration_to_minutes(duration_str):
-    """1h30mתΪ"""
-    if 'h' in duration_str:
-        return int(duration_str.replace('h', '')) * 60
-    elif 'm' in duration_str:
-        return int(duration_str.replace('m', ''))
-    return 60
-
-def find_available_slot(start, duration, end, occupied):
-    """occupiedʱҵõdurationȵʱ"""
-    current = start
-    
-    for occ_start, occ_end in occupied:
-        if current + duration <= occ_start:
-            return current
-        if current < occ_end:
-            current = occ_end
-    
-    if current + duration <= end:
-        return current
-    
-    return None
-
 # ===========================
-# AIŻ
+# AI排期优化
 # ===========================
 def ai_optimize_schedule(tasks, fixed_schedules, user_prefs):
     """
-    AIŻ
+    调用AI进行智能排期优化
     """
     prompt = f"""
-һʱרңΪûŽ
+你是一个时间管理专家，请为用户安排今日任务。
 
-ʱ䣺{user_prefs['work_start_time']} - {user_prefs['work_end_time']}
+工作时间：{user_prefs['work_start_time']} - {user_prefs['work_end_time']}
 
-̶ճ̣ռã
+固定日程（不可占用）：
 {json.dumps(fixed_schedules, ensure_ascii=False, indent=2)}
 
-
+待安排任务：
 {json.dumps(tasks, ensure_ascii=False, indent=2)}
 
-ڹ
-1. ȼ
-2. ؽֹ
-3. ̶ܿճ
-4. Ͼã
-5. ͬţл
-
-JSON飬ÿԪذ
-- id: ID
-- scheduled_start: ʼʱ䣨HH:MM
-- scheduled_end: ʱ䣨HH:MM
-- reason: ɣ̣
+排期规则：
+1. 高优先级任务优先
+2. 尊重截止日期
+3. 避开固定日程
+4. 早上精力好，安排难任务
+5. 相同分类任务连续安排，减少切换
+
+返回JSON数组，每个元素包含：
+- id: 任务ID
+- scheduled_start: 开始时间（HH:MM）
+- scheduled_end: 结束时间（HH:MM）
+- reason: 安排理由（简短）
 """
     
-    result = call_deepseek(prompt, temperature=0.3)
+    result = call_deepseek(prompt, temperature=0.3, endpoint="schedule")
     
     try:
         if result.startswith("```"):
@@ -347,165 +278,313 @@ def ai_optimize_schedule(tasks, fixed_schedules, user_prefs):
         return []
 
 # ===========================
-# ·ɣҳ
+# 工具函数：条件GET（ETag）
+# ===========================
+def conditional_json(collection, build):
+    """
+    按集合校验值响应：If-None-Match 命中时直接返回304，不查询也不序列化数据行
+    build 为生成响应体的函数，只在需要时调用
+    """
+    etag = f"{request.path}:{db.get_collection_version(collection)}"
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+# ===========================
+# 工具函数：分页与流式响应
+# ===========================
+MAX_PAGE_SIZE = 500
+
+def page_limit(default=100):
+    """读取 limit 参数，限制在 1..MAX_PAGE_SIZE"""
+    limit = request.args.get("limit", default, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+def stream_json(key, items, **fields):
+    """
+    流式输出 {"success": true, ..., key: [...]}
+    items 为逐个产出数据行的生成器，每行序列化后立即写出，不在内存里拼整个列表
+    """
+    def generate():
+        head = json.dumps({"success": True, **fields}, ensure_ascii=False)
+        yield head[:-1] + f', "{key}": ['
+        for i, item in enumerate(items):
+            yield ("," if i else "") + json.dumps(item.to_dict(), ensure_ascii=False)
+        yield "]}"
+    return app.response_class(generate(), mimetype="application/json")
+
+# ===========================
+# 路由：首页
 # ===========================
 @app.route("/")
 def index():
     return render_template("index.html")
 
 # ===========================
-# ·ɣ̶ճ̹
+# 路由：固定日程管理
 # ===========================
 @app.route("/fixed_schedules", methods=["GET", "POST"])
 def fixed_schedules():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
     if request.method == "POST":
         data = request.json
-        c.execute("""
-            INSERT INTO fixed_schedules 
-            (title, day_of_week, start_time, end_time, recurrence, location, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
-            data.get("title"),
-            data.get("day_of_week"),
-            data.get("start_time"),
-            data.get("end_time"),
-            data.get("recurrence", "weekly"),
-            data.get("location"),
-            data.get("source", "manual")
-        ))
-        conn.commit()
-        conn.close()
+        db.add_fixed_schedule(
+            title=data.get("title"),
+            day_of_week=data.get("day_of_week"),
+            start_time=data.get("start_time"),
+            end_time=data.get("end_time"),
+            recurrence=data.get("recurrence", "weekly"),
+            location=data.get("location"),
+            source=data.get("source", "manual"),
+            start_date=data.get("start_date"),
+            end_date=data.get("end_date")
+        )
         socketio.emit("schedule_updated", {"status": "ok"})
         return jsonify({"status": "ok"})
     
     else:
-        c.execute("""
-            SELECT id, title, day_of_week, start_time, end_time, recurrence, location, source
-            FROM fixed_schedules ORDER BY day_of_week, start_time
-        """)
-        rows = c.fetchall()
-        conn.close()
-        return jsonify([{
-            "id": r[0],
-            "title": r[1],
-            "day_of_week": r[2],
-            "start_time": r[3],
-            "end_time": r[4],
-            "recurrence": r[5],
-            "location": r[6],
-            "source": r[7]
-        } for r in rows])
+        return conditional_json(
+            "fixed_schedules",
+            lambda: [fs.to_dict() for fs in db.get_all_fixed_schedules()]
+        )
+
+@app.route("/api/fixed_schedules", methods=["GET"])
+def api_get_fixed_schedules():
+    """
+    获取固定日程；带 since=<版本号> 时只返回该版本之后变化/删除的日程（删除记录已清理时同任务列表，full=true）
+    """
+    since = request.args.get("since", type=int)
+    if since is None:
+        return conditional_json("fixed_schedules", lambda: {
+            "success": True,
+            "version": db.get_sync_version(),
+            "schedules": [fs.to_dict() for fs in db.get_all_fixed_schedules()]
+        })
+    
+    changes = db.get_fixed_schedule_changes(since)
+    return jsonify({
+        "success": True,
+        "version": changes["version"],
+        "schedules": [fs.to_dict() for fs in changes["schedules"]],
+        "deleted": changes["deleted"],
+        "full": changes["full"]
+    })
 
 @app.route("/fixed_schedules/<int:schedule_id>", methods=["DELETE"])
 def delete_fixed_schedule(schedule_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM fixed_schedules WHERE id=?", (schedule_id,))
-    conn.commit()
-    conn.close()
+    db.delete_fixed_schedule(schedule_id)
     socketio.emit("schedule_updated", {"status": "ok"})
     return jsonify({"status": "ok"})
 
+@app.route("/fixed_schedules/<int:schedule_id>/exceptions", methods=["POST", "DELETE"])
+def fixed_schedule_exception(schedule_id):
+    """例外日期 {"date": "YYYY-MM-DD"}：POST 表示这天不上，DELETE 取消"""
+    data = request.get_json(silent=True) or {}
+    try:
+        day = datetime.strptime(data.get("date") or "", "%Y-%m-%d").date()
+    except ValueError:
+        return jsonify({"success": False, "message": "date 需为 YYYY-MM-DD"}), 400
+
+    if request.method == "POST":
+        db.add_fixed_schedule_exception(schedule_id, day)
+    else:
+        db.delete_fixed_schedule_exception(schedule_id, day)
+    socketio.emit("schedule_updated", {"status": "ok"})
+    return jsonify({"success": True})
+
+@app.route("/api/fixed_schedules/occurrences", methods=["GET"])
+def api_fixed_occurrences():
+    """
+    固定日程按重复规则展开后的具体发生：?start=YYYY-MM-DD（默认今天）&days=N（默认7）
+    """
+    days = max(1, min(request.args.get("days", 7, type=int), MAX_HORIZON_DAYS))
+    try:
+        start = datetime.strptime(request.args["start"], "%Y-%m-%d").date() \
+            if request.args.get("start") else datetime.now().date()
+    except ValueError:
+        return jsonify({"success": False, "message": "start 需为 YYYY-MM-DD"}), 400
+
+    end = start + timedelta(days=days)
+    occurrences = db.get_fixed_occurrences(start.isoformat(), end.isoformat())
+    return jsonify({"success": True, "occurrences": [o.to_dict() for o in occurrences]})
+
+@app.route("/api/daily_schedule", methods=["GET"])
+def api_daily_schedule():
+    """时间轴：某一天（?date=YYYY-MM-DD，默认今天）的固定日程和已排期任务"""
+    try:
+        day = datetime.strptime(request.args["date"], "%Y-%m-%d").date() \
+            if request.args.get("date") else datetime.now().date()
+    except ValueError:
+        return jsonify({"success": False, "message": "date 需为 YYYY-MM-DD"}), 400
+
+    next_day = day + timedelta(days=1)
+    fixed = [{**o.to_dict(), "id": o.schedule_id} for o in db.get_fixed_occurrences_for_date(day)]
+    tasks = db.get_tasks_scheduled_between(day.isoformat(), next_day.isoformat())
+    return jsonify({
+        "success": True,
+        "date": day.isoformat(),
+        "fixed_schedules": fixed,
+        "tasks": [t.to_dict() for t in tasks]
+    })
+
 @app.route("/ocr_schedule", methods=["POST"])
 def ocr_schedule():
-    """OCRʶαͼƬ"""
+    """OCR识别课表图片"""
     data = request.json
     image_data = data.get("image")
     result = ocr_schedule_image(image_data)
     return jsonify(result)
 
 # ===========================
-# ·ɣ
+# 路由：任务管理
 # ===========================
 @app.route("/tasks", methods=["GET"])
 def get_tasks():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT id, content, category, priority, estimated_duration, 
-               deadline, scheduled_start, scheduled_end, status, created_at
-        FROM tasks ORDER BY priority DESC, deadline
-    """)
-    rows = c.fetchall()
-    conn.close()
-    return jsonify([{
-        "id": r[0],
-        "content": r[1],
-        "category": r[2],
-        "priority": r[3],
-        "estimated_duration": r[4],
-        "deadline": r[5],
-        "scheduled_start": r[6],
-        "scheduled_end": r[7],
-        "status": r[8],
-        "created_at": r[9]
-    } for r in rows])
+    return conditional_json("tasks", lambda: [t.to_dict() for t in db.get_all_tasks()])
+
+@app.route("/api/tasks", methods=["GET"])
+def api_get_tasks():
+    """
+    获取任务列表；带 since=<版本号> 时只返回该版本之后变化的任务和被删除的 id，
+    轮询开销随变化量而不是表大小增长；该版本之后的删除记录已被清理时返回全部任务并带 full=true
+
+    分页：?after=<id>&limit=<n> 按 id 键集分页，next_after 为下一页游标（没有下一页时为 null）
+    流式：?stream=1[&after=<id>] 按 id 顺序逐行输出全部任务
+    """
+    if request.args.get("stream") == "1":
+        return stream_json("tasks", db.iter_tasks(request.args.get("after", 0, type=int)))
+    
+    if "after" in request.args or "limit" in request.args:
+        limit = page_limit()
+        tasks = db.get_tasks_page(request.args.get("after", 0, type=int), limit)
+        return jsonify({
+            "success": True,
+            "tasks": [t.to_dict() for t in tasks],
+            "next_after": tasks[-1].id if len(tasks) == limit else None
+        })
+    
+    since = request.args.get("since", type=int)
+    if since is None:
+        # 先取版本号再取数据，期间的并发修改会在下次增量中再次返回
+        return conditional_json("tasks", lambda: {
+            "success": True,
+            "version": db.get_sync_version(),
+            "tasks": [t.to_dict() for t in db.get_all_tasks()]
+        })
+    
+    changes = db.get_task_changes(since)
+    return jsonify({
+        "success": True,
+        "version": changes["version"],
+        "tasks": [t.to_dict() for t in changes["tasks"]],
+        "deleted": changes["deleted"],
+        "full": changes["full"]
+    })
+
+def on_task_enriched(task, changes, status):
+    """后台 AI 增强结束：推送 task_updated；已排期的任务时长变了，增量重排当天"""
+    socketio.emit("task_updated", dict(changes or {}, id=task.id, enrichment_status=status))
+    if not changes or changes.get("estimated_duration", task.estimated_duration) == task.estimated_duration:
+        return
+    try:
+        rescheduled = planner.reschedule_after_change(task.id, resize=True)
+    except (ValueError, TypeError):
+        app.logger.exception("任务 %s 增量重排失败", task.id)
+        return
+    if rescheduled:
+        socketio.emit("tasks_rescheduled", {"id": task.id, "changes": rescheduled})
+
+# 新任务的 AI 解析在有界线程池里后台完成（到这里的都是规则解析没把握的，直接交给 LLM）
+enricher = TaskEnricher(db, lambda text: analyze_task(text, use_rules=False), on_task_enriched)
 
 @app.route("/add_task", methods=["POST"])
 def add_task():
+    """
+    添加任务，不等待 AI：规则解析有把握或解析结果已在缓存里时直接使用，否则按临时解析
+    （原文，规则识别出的分类/优先级/时长/截止时间）立即插入并返回 id，
+    AI 解析在后台完成后写回，通过 task_updated 推送（enrichment_status 变为 done）
+    """
     data = request.json
-    text = data.get("text", "")
-    
-    # AI
-    parsed = analyze_task(text)
-    
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO tasks 
-        (content, category, priority, estimated_duration, deadline, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (
-        parsed.get("task", text),
-        parsed.get("category"),
-        parsed.get("priority"),
-        parsed.get("estimated_duration"),
-        parsed.get("deadline_iso"),
-        datetime.now().isoformat()
-    ))
-    task_id = c.lastrowid
-    conn.commit()
-    conn.close()
-    
-    socketio.emit("task_added", {"id": task_id})
-    return jsonify({"status": "ok", "task_id": task_id, "parsed": parsed})
+    text = " ".join(data.get("text", "").split())
+    
+    rules = quick_parse(text)
+    parsed = rules if rules["fast_path"] else cached_task_analysis(text)
+    if parsed:
+        status = "done"
+        task_id = db.add_task(
+            content=parsed.get("task", text),
+            category=parsed.get("category"),
+            priority=parsed.get("priority"),
+            estimated_duration=duration_to_minutes(parsed.get("estimated_duration")),
+            deadline=parsed.get("deadline_iso"),
+            enrichment_status=status
+        )
+    else:
+        status = "pending"
+        task_id = db.add_task(
+            content=text,
+            category=rules["category"],
+            priority=rules["priority"],
+            estimated_duration=duration_to_minutes(rules["estimated_duration"]),
+            deadline=rules["deadline_iso"],
+            enrichment_status=status
+        )
+        task = db.get_task(task_id)
+        parsed = dict(rules, task=task.content)
+        # 队列满时任务留在 pending，由定时的 enricher.resume 补做
+        enricher.submit(task)
+    
+    socketio.emit("task_added", {"id": task_id, "enrichment_status": status})
+    return jsonify({"status": "ok", "task_id": task_id, "parsed": parsed, "enrichment_status": status})
+
+def apply_task_update(task_id, data):
+    """
+    更新任务，只修改请求里给出的字段（未给出的字段保持原值）
+    时间或时长变化时，若请求带 reschedule=true 或用户开启了 auto_reschedule_on_drag，
+    增量重排当天受影响的任务，并推送变化的部分
+    
+    Returns:
+        因重排而变化的任务列表
+    """
+    changes = {key: data[key] for key in TASK_UPDATABLE_FIELDS if key in data}
+    db.update_task(task_id, **changes)
+    socketio.emit("task_updated", dict(data, id=task_id))
+    
+    timing = {"scheduled_start", "scheduled_end", "estimated_duration"} & changes.keys()
+    reschedule = data.get("reschedule", db.get_user_preferences().auto_reschedule_on_drag)
+    if not timing or not reschedule:
+        return []
+    
+    # 重排只是附带效果：偏好或任务里的时间格式不对时记录下来，不影响已经保存的修改
+    try:
+        rescheduled = planner.reschedule_after_change(task_id, resize="scheduled_end" not in changes)
+    except (ValueError, TypeError):
+        app.logger.exception("任务 %s 增量重排失败", task_id)
+        return []
+    if rescheduled:
+        socketio.emit("tasks_rescheduled", {"id": task_id, "changes": rescheduled})
+    return rescheduled
 
 @app.route("/update_task", methods=["POST"])
 def update_task():
     data = request.json
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        UPDATE tasks SET
-        content=?, category=?, priority=?, estimated_duration=?,
-        deadline=?, scheduled_start=?, scheduled_end=?, status=?
-        WHERE id=?
-    """, (
-        data.get("content"),
-        data.get("category"),
-        data.get("priority"),
-        data.get("estimated_duration"),
-        data.get("deadline"),
-        data.get("scheduled_start"),
-        data.get("scheduled_end"),
-        data.get("status"),
-        data.get("id")
-    ))
-    conn.commit()
-    conn.close()
-    socketio.emit("task_updated", data)
-    return jsonify({"status": "ok"})
+    rescheduled = apply_task_update(data.get("id"), data)
+    return jsonify({"status": "ok", "rescheduled": rescheduled})
+
+@app.route("/api/tasks/<int:task_id>", methods=["PUT"])
+def api_update_task(task_id):
+    """更新单个任务（时间轴拖拽、编辑、改状态），返回增量重排的结果"""
+    if db.get_task(task_id) is None:
+        return jsonify({"success": False, "message": "任务不存在"}), 404
+    rescheduled = apply_task_update(task_id, request.json or {})
+    return jsonify({"success": True, "rescheduled": rescheduled})
 
 @app.route("/delete_task/<int:task_id>", methods=["DELETE"])
 def delete_task(task_id):
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("DELETE FROM tasks WHERE id=?", (task_id,))
-    conn.commit()
-    conn.close()
+    db.delete_task(task_id)
     socketio.emit("task_deleted", {"id": task_id})
     return jsonify({"status": "ok"})
 
@@ -513,396 +592,485 @@ def delete_task(task_id):
 def complete_task():
     data = request.json
     task_id = data.get("id")
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        UPDATE tasks SET status='completed', completed_at=?
-        WHERE id=?
-    """, (datetime.now().isoformat(), task_id))
-    conn.commit()
-    conn.close()
+    db.complete_task(task_id)
     socketio.emit("task_completed", {"id": task_id})
     return jsonify({"status": "ok"})
 
+@app.route("/api/tasks/batch", methods=["PATCH"])
+def batch_update_tasks():
+    """
+    批量修改任务：一次请求、一个事务、一次推送
+    请求体：{"updates": [{"id": 1, "scheduled_start": null, ...}, ...]}
+    """
+    data = request.json or {}
+    updates = [u for u in data.get("updates", []) if u.get("id") is not None]
+    if not updates:
+        return jsonify({"success": False, "message": "updates 不能为空"}), 400
+    
+    updated = db.update_tasks_bulk(updates)
+    
+    socketio.emit("tasks_updated", {"ids": [u["id"] for u in updates]})
+    return jsonify({"success": True, "updated": updated})
+
 # ===========================
-# ·ɣԶ
+# 路由：自动排期
 # ===========================
 @app.route("/auto_schedule", methods=["POST"])
 def auto_schedule():
-    """̰㷨"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # ȡ
-    c.execute("""
-        SELECT id, content, category, priority, estimated_duration, deadline
-        FROM tasks WHERE status='pending' AND scheduled_start IS NULL
-    """)
-    tasks = [{
-        "id": r[0], "content": r[1], "category": r[2],
-        "priority": r[3], "estimated_duration": r[4], "deadline": r[5]
-    } for r in c.fetchall()]
-    
-    # ȡ̶ճ
-    today = datetime.now().weekday()
-    c.execute("""
-        SELECT title, start_time, end_time, day_of_week
-        FROM fixed_schedules WHERE day_of_week=?
-    """, (today,))
-    fixed = [{
-        "title": r[0], "start_time": r[1],
-        "end_time": r[2], "day_of_week": r[3]
-    } for r in c.fetchall()]
-    
-    # ȡûƫ
-    c.execute("SELECT work_start_time, work_end_time FROM user_preferences WHERE id=1")
-    prefs = c.fetchone()
-    work_start = prefs[0] if prefs else "09:00"
-    work_end = prefs[1] if prefs else "18:00"
-    
-    # ִ
-    scheduled = greedy_schedule(tasks, fixed, work_start, work_end)
-    
-    # ݿ
-    for s in scheduled:
-        c.execute("""
-            UPDATE tasks SET scheduled_start=?, scheduled_end=?
-            WHERE id=?
-        """, (s["scheduled_start"], s["scheduled_end"], s["id"]))
-    
-    conn.commit()
-    conn.close()
+    """本地排期：?strategy=greedy|edf|batch（默认贪心）"""
+    strategy = request.args.get("strategy", "greedy")
+    if strategy not in STRATEGIES or strategy == "local":
+        return jsonify({"status": "error", "message": f"不支持的排期策略: {strategy}"}), 400
+    
+    # 获取固定日程
+    today = datetime.now().date()
+    fixed = [fs.to_dict() for fs in db.get_fixed_occurrences_for_date(today)]
+    
+    # 获取用户偏好
+    prefs = db.get_user_preferences()
+    
+    # 执行排期
+    if strategy == "greedy":
+        # 贪心直接消费数据库按优先级、截止时间流式读出的未排期任务，放不下的在索引里跳过，排满即停
+        work_start = time_to_minutes(prefs.work_start_time)
+        free = FreeIntervals(work_start, time_to_minutes(prefs.work_end_time),
+                             [(time_to_minutes(fs["start_time"]), time_to_minutes(fs["end_time"]))
+                              for fs in fixed])
+        scheduled = [{
+            "id": task.id,
+            "scheduled_start": f"{today}T{minutes_to_time(start)}:00",
+            "scheduled_end": f"{today}T{minutes_to_time(end)}:00"
+        } for task, start, end in place_in_order(
+            db.iter_unscheduled_tasks(max_duration=free.longest), free, work_start)]
+    else:
+        tasks = [t.to_dict() for t in db.get_pending_unscheduled_tasks()]
+        scheduled = greedy_schedule(tasks, fixed, prefs.work_start_time, prefs.work_end_time, strategy)
+    
+    # 更新数据库
+    db.update_task_schedules(scheduled)
     
     socketio.emit("schedule_updated", {"status": "ok"})
     return jsonify({"status": "ok", "scheduled": scheduled})
 
+# 多日排期最多规划的天数
+MAX_HORIZON_DAYS = 31
+
+@app.route("/api/schedule/greedy", methods=["POST"])
+def api_greedy_horizon():
+    """
+    多日贪心排期：?days=N（默认7）&start=YYYY-MM-DD（默认今天）
+    也接受 JSON 请求体 {"date": 起始日期, "days": N}（前端"自动排期"按钮只传正在查看的 date），
+    请求体没给 days 时只排这一天；查询参数优先
+    一次加载、单遍放置、一个事务写回；放不下的任务 id 在 unscheduled 中返回
+    """
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    elif not isinstance(body, dict):
+        return jsonify({"success": False, "message": "请求体需为 JSON 对象"}), 400
+    days = request.args.get("days", type=int)
+    if days is None:
+        try:
+            days = int(body.get("days", 1 if body else 7))
+        except (TypeError, ValueError):
+            return jsonify({"success": False, "message": "days 需为整数"}), 400
+    days = max(1, min(days, MAX_HORIZON_DAYS))
+    start = request.args.get("start") or body.get("date")
+    try:
+        if start is not None and not isinstance(start, str):
+            raise TypeError(start)
+        if start:
+            datetime.strptime(start, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "message": "start 需为 YYYY-MM-DD"}), 400
+    
+    result = planner.horizon_schedule(days=days, start_date=start)
+    
+    socketio.emit("schedule_updated", {"status": "ok"})
+    return jsonify({
+        "success": True,
+        "days": days,
+        "scheduled": result["scheduled"],
+        "unscheduled": result["unscheduled"]
+    })
+
+@app.route("/api/schedule/batch", methods=["POST"])
+def api_batch_schedule():
+    """
+    批量排期：?start=YYYY-MM-DD（默认明天）&days=N（默认1）&strategy=greedy|edf|batch|local
+    &budget_ms=（local 每天的搜索时间）&preview=1（只返回结果，不写库）
+    每天一个作业，在进程池中并行求解
+    """
+    days = max(1, min(request.args.get("days", 1, type=int), MAX_HORIZON_DAYS))
+    strategy = request.args.get("strategy", "greedy")
+    preview = request.args.get("preview", "0") in ("1", "true")
+    try:
+        start = datetime.strptime(request.args["start"], "%Y-%m-%d").date() \
+            if request.args.get("start") else datetime.now().date() + timedelta(days=1)
+    except ValueError:
+        return jsonify({"success": False, "message": "start 需为 YYYY-MM-DD"}), 400
+    
+    options = {}
+    if strategy == "local":
+        budget_ms = request.args.get("budget_ms", OPTIMIZER_BUDGET_MS, type=float)
+        options["budget_ms"] = max(1, min(budget_ms, 1000))
+    
+    dates = [(start + timedelta(days=i)).isoformat() for i in range(days)]
+    try:
+        results = batch_planner.run(dates, strategy=strategy, write=not preview, **options)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    if not preview:
+        socketio.emit("schedule_updated", {"status": "ok"})
+    return jsonify({"success": True, "preview": preview, "days": results})
+
+# 排期优化方式：local 为本地限时优化（无网络调用），ai 为调用 DeepSeek
+OPTIMIZER_MODE = os.getenv("SCHEDULE_OPTIMIZER", "local")
+# 本地优化的搜索时间上限（毫秒）
+OPTIMIZER_BUDGET_MS = 150
+
+@app.route("/api/schedule/occupancy", methods=["GET"])
+def api_schedule_occupancy():
+    """
+    占用情况：?days=N（默认7）&start=YYYY-MM-DD（默认今天）&min_duration=分钟（默认30）
+    按天返回工作时间内的占用分钟数、利用率和可用空档
+    """
+    days = max(1, min(request.args.get("days", 7, type=int), MAX_HORIZON_DAYS))
+    min_duration = max(1, request.args.get("min_duration", 30, type=int))
+    try:
+        start = datetime.strptime(request.args["start"], "%Y-%m-%d").date() \
+            if request.args.get("start") else datetime.now().date()
+    except ValueError:
+        return jsonify({"success": False, "message": "start 需为 YYYY-MM-DD"}), 400
+    
+    prefs = db.get_user_preferences()
+    grid = OccupancyGrid.from_database(db, start, days)
+    summary = grid.summary(prefs.work_start_time, prefs.work_end_time, min_duration)
+    return jsonify({"success": True, "start": start.isoformat(), "days": summary["days"]})
+
 @app.route("/ai_optimize_schedule", methods=["POST"])
 def ai_optimize():
-    """AIŻ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # ȡݣͬϣ
-    c.execute("""
-        SELECT id, content, category, priority, estimated_duration, deadline
-        FROM tasks WHERE status='pending'
-    """)
-    tasks = [{
-        "id": r[0], "content": r[1], "category": r[2],
-        "priority": r[3], "estimated_duration": r[4], "deadline": r[5]
-    } for r in c.fetchall()]
+    """
+    优化排期：?mode=local|ai（默认见 SCHEDULE_OPTIMIZER）
+    local 模式在 budget_ms（默认150，最多1000）内本地搜索，不调用 AI
+    """
+    data = request.get_json(silent=True) or {}
+    mode = request.args.get("mode") or data.get("mode") or OPTIMIZER_MODE
+    if mode == "local":
+        budget_ms = request.args.get("budget_ms", data.get("budget_ms", OPTIMIZER_BUDGET_MS), type=float)
+        result = planner.local_optimize_schedule(budget_ms=max(1, min(budget_ms, 1000)))
+        socketio.emit("schedule_updated", {"status": "ok"})
+        return jsonify({"status": "ok", "mode": "local", "scheduled": result["tasks"],
+                        "unscheduled": result["unscheduled"]})
     
-    today = datetime.now().weekday()
-    c.execute("""
-        SELECT title, start_time, end_time FROM fixed_schedules WHERE day_of_week=?
-    """, (today,))
-    fixed = [{"title": r[0], "start_time": r[1], "end_time": r[2]} for r in c.fetchall()]
+    # 获取数据（同上）
+    tasks = [{
+        "id": t.id, "content": t.content, "category": t.category,
+        "priority": t.priority, "estimated_duration": t.estimated_duration, "deadline": t.deadline
+    } for t in db.get_all_tasks(status="pending")]
     
-    c.execute("SELECT work_start_time, work_end_time FROM user_preferences WHERE id=1")
-    prefs = c.fetchone()
-    user_prefs = {"work_start_time": prefs[0], "work_end_time": prefs[1]}
+    fixed = [{"title": fs.title, "start_time": fs.start_time, "end_time": fs.end_time}
+             for fs in db.get_fixed_occurrences_for_date(datetime.now().date())]
     
-    # AIŻ
-    scheduled = ai_optimize_schedule(tasks, fixed, user_prefs)
+    prefs = db.get_user_preferences()
+    user_prefs = {"work_start_time": prefs.work_start_time, "work_end_time": prefs.work_end_time}
     
-    # ݿ
-    for s in scheduled:
-        c.execute("""
-            UPDATE tasks SET scheduled_start=?, scheduled_end=?
-            WHERE id=?
-        """, (s["scheduled_start"], s["scheduled_end"], s["id"]))
+    # AI优化
+    try:
+        scheduled = ai_optimize_schedule(tasks, fixed, user_prefs)
+    except LLMError as e:
+        return jsonify({"status": "error", "message": f"AI优化失败: {e}"}), 502
     
-    conn.commit()
-    conn.close()
+    # 更新数据库
+    db.update_task_schedules(scheduled)
     
     socketio.emit("schedule_updated", {"status": "ok"})
     return jsonify({"status": "ok", "scheduled": scheduled})
 
 # ===========================
-# ·ɣAI
+# 路由：AI聊天
 # ===========================
+def chat_system_prompt():
+    """对话的 System Prompt：当前时间和今日待办"""
+    tasks = [{"content": t.content, "priority": t.priority, "status": t.status}
+             for t in db.get_top_pending_tasks(5)]
+    return f"""
+你是一个温柔、鼓励的AI秘书，帮助低精力用户管理日程。
+当前时间：{datetime.now().strftime('%Y-%m-%d %H:%M')}
+用户今日待办任务：{json.dumps(tasks, ensure_ascii=False)}
+
+性格特点：
+- 温柔体贴，不说教
+- 给予鼓励和支持
+- 主动关怀用户状态
+- 提供实用建议
+"""
+
+def stream_chat_reply(message_id, user_msg, system_prompt):
+    """
+    后台线程：流式调用 LLM，每收到一段推送 chat_delta {id, index, delta}，
+    结束时推送 chat_done {id, reply, first_token_ms, total_ms} 并把完整回复写入对话历史（只写一次）；
+    失败时 chat_done 带 error 和已收到的部分，不写入对话历史；回复完整但写入历史失败时也带 error。
+    任何异常都会推送 chat_done，客户端不会一直等待
+    """
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_msg}]
+    started = time.perf_counter()
+    first_token = None
+    parts = []
+    try:
+        for delta in llm.stream_chat(messages, temperature=0.7):
+            if first_token is None:
+                first_token = time.perf_counter() - started
+            socketio.emit("chat_delta", {"id": message_id, "index": len(parts), "delta": delta})
+            parts.append(delta)
+    except LLMError as e:
+        socketio.emit("chat_done", {"id": message_id, "reply": "".join(parts), "error": str(e)})
+        return
+    except Exception as e:
+        app.logger.exception("对话 %s 流式回复失败", message_id)
+        socketio.emit("chat_done", {"id": message_id, "reply": "".join(parts), "error": str(e)})
+        return
+    
+    reply = "".join(parts).strip()
+    done = {
+        "id": message_id,
+        "reply": reply,
+        "first_token_ms": round(first_token * 1000) if first_token is not None else None,
+        "total_ms": round((time.perf_counter() - started) * 1000)
+    }
+    try:
+        now = datetime.now().isoformat()
+        db.add_chat_message("user", user_msg, now)
+        db.add_chat_message("assistant", reply, now)
+    except Exception as e:
+        app.logger.exception("对话 %s 写入历史失败", message_id)
+        done["error"] = f"对话记录保存失败: {e}"
+    socketio.emit("chat_done", done)
+
 @app.route("/chat", methods=["POST"])
 def chat():
+    """
+    对话；请求带 stream=true 时立即返回 202 和 message_id，
+    回复通过 Socket.IO 的 chat_delta / chat_done 事件逐段推送（见 stream_chat_reply）
+    """
     data = request.json
     user_msg = data.get("message")
     
-    # ȡԻʷ
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT role, content FROM chat_history 
-        ORDER BY timestamp DESC LIMIT 10
-    """)
-    history = [{"role": r[0], "content": r[1]} for r in c.fetchall()]
-    history.reverse()
-    
-    # ȡǰ
-    c.execute("""
-        SELECT content, priority, status FROM tasks 
-        WHERE status='pending' ORDER BY priority DESC LIMIT 5
-    """)
-    tasks = [{"content": r[0], "priority": r[1], "status": r[2]} for r in c.fetchall()]
-    
-    # System Prompt
-    system_prompt = f"""
-һᡢAI飬;ûճ̡
-ǰʱ䣺{datetime.now().strftime('%Y-%m-%d %H:%M')}
-ûմ{json.dumps(tasks, ensure_ascii=False)}
-
-Ըص㣺
-- ˵
-- ֧
-- ػû״̬
-- ṩʵý
-"""
+    # 获取对话历史
+    history = [{"role": m.role, "content": m.content} for m in db.get_chat_history(10)]
+    
+    # 构建System Prompt（含当前任务上下文）
+    system_prompt = chat_system_prompt()
+    
+    if data.get("stream"):
+        message_id = uuid.uuid4().hex
+        socketio.start_background_task(stream_chat_reply, message_id, user_msg, system_prompt)
+        return jsonify({"message_id": message_id, "stream": True}), 202
     
-    # AI
-    reply = call_deepseek(user_msg, system_prompt, temperature=0.7)
+    # 调用AI（失败时不写入对话历史）
+    try:
+        reply = call_deepseek(user_msg, system_prompt, temperature=0.7)
+    except LLMError as e:
+        return jsonify({"reply": "抱歉，我暂时连不上，请稍后再试", "error": str(e)}), 502
     
-    # Իʷ
+    # 保存对话历史
     now = datetime.now().isoformat()
-    c.execute("INSERT INTO chat_history (role, content, timestamp) VALUES (?, ?, ?)",
-              ("user", user_msg, now))
-    c.execute("INSERT INTO chat_history (role, content, timestamp) VALUES (?, ?, ?)",
-              ("assistant", reply, now))
-    conn.commit()
-    conn.close()
+    db.add_chat_message("user", user_msg, now)
+    db.add_chat_message("assistant", reply, now)
     
     return jsonify({"reply": reply})
 
+@app.route("/api/chat/history", methods=["GET"])
+def api_chat_history():
+    """
+    对话历史分页：?before=<时间戳>&before_id=<id>&limit=<n>，按 (timestamp, id) 键集向前翻页
+    本页按时间正序放在 history 中（前端 loadChatHistory 读这个键），
+    next_before / next_before_id 为更早一页的游标（没有时为 null）
+    ?stream=1 时从游标处由新到旧逐行输出全部消息
+    """
+    before = request.args.get("before")
+    before_id = request.args.get("before_id", type=int)
+    if request.args.get("stream") == "1":
+        return stream_json("history", db.iter_chat_history(before, before_id))
+    
+    limit = page_limit(50)
+    messages = db.get_chat_page(before, before_id, limit)
+    has_more = len(messages) == limit
+    return jsonify({
+        "success": True,
+        "history": [m.to_dict() for m in messages],
+        "next_before": messages[0].timestamp if has_more else None,
+        "next_before_id": messages[0].id if has_more else None
+    })
+
 # ===========================
-# ·ɣûƫ
+# 路由：用户偏好
 # ===========================
 @app.route("/preferences", methods=["GET", "POST"])
 def preferences():
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
     if request.method == "POST":
         data = request.json
-        c.execute("""
-            UPDATE user_preferences SET
-            work_start_time=?, work_end_time=?, sleep_reminder_time=?,
-            auto_reschedule_on_drag=?, enable_main_chat=?
-            WHERE id=1
-        """, (
-            data.get("work_start_time"),
-            data.get("work_end_time"),
-            data.get("sleep_reminder_time"),
-            data.get("auto_reschedule_on_drag"),
-            data.get("enable_main_chat")
-        ))
-        conn.commit()
-        conn.close()
+        db.update_user_preferences(
+            work_start_time=data.get("work_start_time"),
+            work_end_time=data.get("work_end_time"),
+            sleep_reminder_time=data.get("sleep_reminder_time"),
+            auto_reschedule_on_drag=data.get("auto_reschedule_on_drag"),
+            enable_main_chat=data.get("enable_main_chat")
+        )
         return jsonify({"status": "ok"})
     
     else:
-        c.execute("SELECT * FROM user_preferences WHERE id=1")
-        row = c.fetchone()
-        conn.close()
-        if row:
-            return jsonify({
-                "work_start_time": row[1],
-                "work_end_time": row[2],
-                "break_duration": row[3],
-                "focus_time_preference": row[4],
-                "enable_main_chat": row[5],
-                "sleep_reminder_time": row[6],
-                "auto_reschedule_on_drag": row[7]
-            })
-        return jsonify({})
-
-# ===========================
-# ·ɣAIԻAPI
+        def build():
+            prefs = db.get_user_preferences().to_dict()
+            prefs.pop("id", None)
+            prefs.pop("row_version", None)
+            return prefs
+        return conditional_json("preferences", build)
+
+# ===========================
+# 路由：数据库监控
+# ===========================
+@app.route("/api/db/pool_stats", methods=["GET"])
+def pool_stats():
+    """连接池统计：取连接次数、等待次数与等待耗时"""
+    return jsonify(db.pool_stats())
+
+@app.route("/api/db/query_stats", methods=["GET"])
+def query_stats():
+    """按语句统计的查询次数与耗时"""
+    return jsonify(db.query_stats())
+
+@app.route("/api/db/prefs_cache", methods=["GET"])
+def prefs_cache_stats():
+    """用户偏好缓存命中统计"""
+    return jsonify(db.preferences_cache_stats())
+
+@app.route("/api/llm/cache_stats", methods=["GET"])
+def llm_cache_stats():
+    """LLM 响应缓存命中统计"""
+    return jsonify(llm_cache.stats())
+
+@app.route("/api/llm/enrichment_stats", methods=["GET"])
+def enrichment_stats():
+    """后台任务增强统计：提交、完成、跳过、失败、因队列满推迟的次数与在途数"""
+    return jsonify(enricher.stats())
+
+@app.route("/api/llm/parser_stats", methods=["GET"])
+def parser_stats_api():
+    """规则快速解析统计：命中率、解析耗时、LLM 平均耗时、按天省下的调用次数和秒数"""
+    return jsonify(parser_stats.stats())
+
+# ===========================
+# 路由：AI主动对话API
 # ===========================
 @app.route("/api/ai/greeting/morning", methods=["GET"])
 def get_morning_greeting():
-    """ȡ糿ʺ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # ȡ
-    c.execute("SELECT COUNT(*) FROM tasks WHERE status='pending'")
-    count = c.fetchone()[0]
-    
-    # ȡȼ
-    c.execute("""
-        SELECT content FROM tasks 
-        WHERE status='pending' AND priority='high'
-        LIMIT 3
-    """)
-    high_tasks = [r[0] for r in c.fetchall()]
-    
-    # ȡûƫ
-    c.execute("SELECT enable_main_chat FROM user_preferences WHERE id=1")
-    enable_chat = c.fetchone()[0]
-    conn.close()
-    
-    # Իؿ
-    if not enable_chat:
+    """获取早晨问候"""
+    # 如果禁用了主动对话，返回空内容
+    if not db.get_user_preferences().enable_main_chat:
         return jsonify({"content": ""})
     
-    # ʺ
-    message = f"Ϻã{count}"
+    # 获取待办任务数量
+    count = db.count_tasks("pending")
+    
+    # 获取高优先级任务
+    high_tasks = [t.content for t in db.get_high_priority_pending_tasks(3)]
+    
+    # 构建问候语
+    message = f"早上好！今天有{count}个待办任务"
     if high_tasks:
-        message += f"Ҫǣ{high_tasks[0]}"
-    message += "ףһ˳"
+        message += f"，最重要的是：{high_tasks[0]}"
+    message += "。祝你今天一切顺利！"
     
     return jsonify({"content": message})
 
 @app.route("/api/ai/greeting/sleep", methods=["GET"])
 def get_sleep_greeting():
-    """ȡ˯ǰ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # ȡ
-    c.execute("""
-        SELECT COUNT(*) FROM tasks 
-        WHERE status='completed' AND DATE(completed_at)=DATE('now')
-    """)
-    completed = c.fetchone()[0]
-    
-    # ȡ
-    c.execute("SELECT COUNT(*) FROM tasks WHERE status='pending'")
-    pending = c.fetchone()[0]
-    
-    # ȡûƫ
-    c.execute("SELECT enable_main_chat FROM user_preferences WHERE id=1")
-    enable_chat = c.fetchone()[0]
-    conn.close()
-    
-    # Իؿ
-    if not enable_chat:
+    """获取睡前复盘"""
+    # 如果禁用了主动对话，返回空内容
+    if not db.get_user_preferences().enable_main_chat:
         return jsonify({"content": ""})
     
-    # Ϣ
-    message = f"{completed}񣬻{pending}졣"
-    message += "һ죬Ϣͣ"
+    # 获取今日完成任务数
+    completed = db.count_completed_today()
+    
+    # 获取待办任务数
+    pending = db.count_tasks("pending")
+    
+    # 构建复盘消息
+    message = f"今天完成了{completed}个任务，还有{pending}个待办。"
+    message += "辛苦了一天，早点休息，明天继续加油！"
     
     return jsonify({"content": message})
 
 @app.route("/api/ai/reminders/task_start", methods=["GET"])
 def get_task_start_reminders():
-    """ȡʼ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    
-    # ȡǰʱ
-    now = datetime.now()
-    now_str = now.isoformat()
-    
-    # ȡδ5Ҫʼ
-    c.execute("""
-        SELECT content, scheduled_start 
-        FROM tasks 
-        WHERE status='pending' 
-        AND scheduled_start IS NOT NULL
-        AND scheduled_start BETWEEN ? AND ?
-    """, (now_str, (now + timedelta(minutes=5)).isoformat()))
-    upcoming_tasks = c.fetchall()
-    
-    # ȡûƫ
-    c.execute("SELECT enable_main_chat FROM user_preferences WHERE id=1")
-    enable_chat = c.fetchone()[0]
-    conn.close()
-    
+    """获取即将开始的任务提醒"""
     reminders = []
     
-    # Իؿ
-    if not enable_chat:
+    # 如果禁用了主动对话，返回空提醒
+    if not db.get_user_preferences().enable_main_chat:
         return jsonify({"reminders": reminders})
     
-    # Ϣ
-    for task_content, start_time in upcoming_tasks:
-        reminders.append(f"쵽ʱˣ׼ʼ'" + task_content + "'ɣ")
+    # 获取未来5分钟内要开始的任务
+    now = datetime.now()
+    upcoming_tasks = db.get_tasks_starting_between(
+        now.isoformat(), (now + timedelta(minutes=5)).isoformat())
+    
+    # 构建提醒消息
+    for task in upcoming_tasks:
+        reminders.append(f"快到时间了，准备开始'" + task.content + "'吧！")
     
     return jsonify({"reminders": reminders})
 
 @app.route("/api/ai/schedule/optimize", methods=["POST"])
 def api_ai_optimize_schedule():
-    """AIŻAPI"""
+    """AI优化排期API"""
     try:
         data = request.json
         date_str = data.get("date")
         target_date = datetime.fromisoformat(date_str)
         
-        conn = sqlite3.connect(DB_FILE)
-        c = conn.cursor()
-        
-        # ȡĹ̶ճ
-        day_of_week = target_date.weekday() + 1  # 1-7ʾһ
-        c.execute("""
-            SELECT title, start_time, end_time 
-            FROM fixed_schedules 
-            WHERE day_of_week=?
-        """, (day_of_week,))
-        fixed_schedules = c.fetchall()
-        
-        # ȡŵ
-        c.execute("""
-            SELECT id, content, category, priority, estimated_duration 
-            FROM tasks 
-            WHERE status='pending' 
-            AND scheduled_start IS NULL
-            ORDER BY 
-                CASE priority 
-                    WHEN 'high' THEN 1 
-                    WHEN 'medium' THEN 2 
-                    WHEN 'low' THEN 3 
-                END
-        """)
-        tasks = c.fetchall()
+        # 获取当天的固定日程
+        day_of_week = recurrence.day_of_week(target_date)  # 0=周日
+        fixed_schedules = [{
+            "title": fs.title,
+            "start_time": fs.start_time,
+            "end_time": fs.end_time
+        } for fs in db.get_fixed_occurrences_for_date(target_date.date())]
         
-        # ȡûƫ
-        c.execute("SELECT work_start_time, work_end_time FROM user_preferences WHERE id=1")
-        prefs = c.fetchone()
-        work_start = datetime.strptime(prefs[0], "%H:%M").time()
-        work_end = datetime.strptime(prefs[1], "%H:%M").time()
+        # 获取待安排的任务
+        tasks_data = [{
+            "id": t.id,
+            "content": t.content,
+            "category": t.category,
+            "priority": t.priority,
+            "estimated_duration": t.estimated_duration
+        } for t in db.get_pending_unscheduled_tasks()]
         
-        # ͹̶ճ
-        tasks_data = []
-        for task in tasks:
-            tasks_data.append({
-                "id": task[0],
-                "content": task[1],
-                "category": task[2],
-                "priority": task[3],
-                "estimated_duration": task[4]
-            })
+        # 获取用户偏好
+        prefs = db.get_user_preferences()
         
-        # תΪAIĸʽ
+        # 转换为AI可理解的格式
         context = {
             "date": target_date.strftime("%Y-%m-%d"),
             "day_of_week": day_of_week,
+            "work_start_time": prefs.work_start_time,
+            "work_end_time": prefs.work_end_time,
             "work_hours": {
-                "start": prefs[0],
-                "end": prefs[1]
+                "start": prefs.work_start_time,
+                "end": prefs.work_end_time
             },
-            "fixed_schedules": [
-                {
-                    "title": fs[0],
-                    "start_time": fs[1],
-                    "end_time": fs[2]
-                } for fs in fixed_schedules
-            ],
+            "fixed_schedules": fixed_schedules,
             "tasks": tasks_data
         }
         
-        # AIŻ
+        # 调用AI优化排期
         optimized_schedule = ai_optimize_schedule(tasks_data, fixed_schedules, context)
         
-        # ݿ
-        for task in optimized_schedule:
-            c.execute("""
-                UPDATE tasks SET 
-                scheduled_start=?, 
-                scheduled_end=? 
-                WHERE id=?
-            """, (task["scheduled_start"], task["scheduled_end"], task["id"]))
-        
-        conn.commit()
-        conn.close()
+        # 更新数据库
+        db.update_task_schedules(optimized_schedule)
         
         return jsonify({
             "success": True,
@@ -910,60 +1078,71 @@ def api_ai_optimize_schedule():
         })
         
     except Exception as e:
-        print(f"Żʧ: {str(e)}")
+        print(f"优化排期失败: {str(e)}")
         return jsonify({
             "success": False,
             "message": str(e)
         })
 
 # ===========================
-# ʱԻ
+# 定时任务：主动对话
 # ===========================
 scheduler = BackgroundScheduler()
 
 def morning_greeting():
-    """糿ʺ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM tasks WHERE status='pending'")
-    count = c.fetchone()[0]
-    c.execute("""
-        SELECT content FROM tasks 
-        WHERE status='pending' AND priority='high'
-        LIMIT 3
-    """)
-    high_tasks = [r[0] for r in c.fetchall()]
-    conn.close()
-    
-    message = f"Ϻã{count}"
+    """早晨问候"""
+    count = db.count_tasks("pending")
+    high_tasks = [t.content for t in db.get_high_priority_pending_tasks(3)]
+    
+    message = f"早上好！今天有{count}个待办任务"
     if high_tasks:
-        message += f"Ҫǣ{high_tasks[0]}"
+        message += f"，最重要的是：{high_tasks[0]}"
     
     socketio.emit("ai_message", {"message": message, "type": "greeting"})
 
 def sleep_reminder():
-    """˯ǰ"""
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        SELECT COUNT(*) FROM tasks 
-        WHERE status='completed' AND DATE(completed_at)=DATE('now')
-    """)
-    completed = c.fetchone()[0]
-    c.execute("SELECT COUNT(*) FROM tasks WHERE status='pending'")
-    pending = c.fetchone()[0]
-    conn.close()
-    
-    message = f"{completed}񣬻{pending}졣Ϣͣ"
+    """睡前复盘"""
+    completed = db.count_completed_today()
+    pending = db.count_tasks("pending")
+    
+    message = f"今天完成了{completed}个任务，还有{pending}个待办。早点休息，明天继续加油！"
     socketio.emit("ai_message", {"message": message, "type": "sleep"})
 
-# עᶨʱ
+def plan_tomorrow():
+    """每晚规划明天：明天已有的任务重新排，未排期的任务尽量放进明天"""
+    try:
+        tomorrow = (datetime.now().date() + timedelta(days=1)).isoformat()
+        options = {"budget_ms": OPTIMIZER_BUDGET_MS} if BATCH_STRATEGY == "local" else {}
+        result = batch_planner.run([tomorrow], strategy=BATCH_STRATEGY, **options)
+        if result:
+            socketio.emit("schedule_updated", {"status": "ok"})
+            print(f"明日排期完成：{len(result[0]['scheduled'])} 个任务，"
+                  f"{len(result[0]['unscheduled'])} 个放不下")
+    except Exception as e:
+        print(f"明日排期失败: {str(e)}")
+
+def db_maintenance():
+    """对话历史归档 + 清理过期的删除墓碑 + 回收空闲页"""
+    try:
+        archived = db.archive_chat_history(keep=CHAT_HOT_WINDOW)
+        cutoff = (datetime.now() - timedelta(days=SYNC_TOMBSTONE_DAYS)).isoformat(timespec="seconds")
+        pruned = db.prune_tombstones(cutoff)
+        mode = db.vacuum()
+        print(f"对话历史归档 {archived} 条，清理墓碑 {pruned} 条，vacuum: {mode}")
+    except Exception as e:
+        print(f"数据库维护失败: {str(e)}")
+
+# 注册定时任务
 scheduler.add_job(morning_greeting, 'cron', hour=8, minute=0)
 scheduler.add_job(sleep_reminder, 'cron', hour=22, minute=0)
+scheduler.add_job(db_maintenance, 'cron', hour=3, minute=30)
+scheduler.add_job(plan_tomorrow, 'cron', hour=21, minute=30)
+# 启动时立即补做上次遗留的 AI 增强，之后每 5 分钟补交因队列满推迟的
+scheduler.add_job(enricher.resume, 'interval', minutes=5, next_run_time=datetime.now())
 scheduler.start()
 
 # ===========================
-# 
+# 启动服务
 # ===========================
 if __name__ == "__main__":
     socketio.run(app, host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
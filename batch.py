@@ -0,0 +1,216 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from engine import Problem, STRATEGIES, TASK_FIELDS, solve
+from intervals import FreeIntervals
+from occupancy import time_to_minutes
+
+# 工作进程数：BATCH_WORKERS 未设置时用全部 CPU
+MAX_WORKERS = int(os.getenv('BATCH_WORKERS', '0')) or os.cpu_count() or 1
+
+
+def solve_job(job: Tuple) -> Tuple:
+    """
+    求解一天的排期（在工作进程里运行，必须是模块级函数才能被 pickle）
+
+    Args:
+        job: (day, work_start, work_end, break_minutes, busy, rows, strategy, options)，
+             rows 为按 TASK_FIELDS 顺序的任务元组，全部是基本类型
+
+    Returns:
+        (day, [(id, scheduled_start, scheduled_end)], [放不下的任务 id], stats)
+    """
+    day, work_start, work_end, break_minutes, busy, rows, strategy, options = job
+    problem = Problem([dict(zip(TASK_FIELDS, row)) for row in rows], busy,
+                      work_start, work_end, day=day, break_minutes=break_minutes)
+    solution = solve(problem, strategy, **options)
+    slots = [problem.slot(i, start) for i, start in solution.placements]
+    return (day,
+            [(s['id'], s['scheduled_start'], s['scheduled_end']) for s in slots],
+            [problem.ids[i] for i in solution.unscheduled],
+            solution.stats)
+
+
+class BatchPlanner:
+    """
+    批量排期：多天的排期拆成互不相干的单日作业，分发到进程池并行求解，结果一次事务写回
+
+    数据在主进程一次加载。未排期任务先按截止时间优先在各天的空档里首次适配，预分到某一天
+    （一天也放不下的分给最后一天）；每个作业只含当天已排期的待办任务、预分到当天的任务、
+    当天的固定日程和工作时间，作业之间没有共享任务，可以任意并行。当天策略放不下的任务
+    顺延到下一天的作业重算，最后一天仍放不下的才算未排期。作业序列化成只含基本类型的
+    元组发给子进程，子进程只跑 engine，不碰数据库。
+    只规划明天及以后的日期：今天已经开始，交给交互式排期接口处理。
+    """
+
+    def __init__(self, db, max_workers: int = None):
+        self.db = db
+        self.max_workers = max_workers or MAX_WORKERS
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def run(self, dates: List[str], strategy: str = 'greedy', write: bool = True,
+            **options) -> List[Dict]:
+        """
+        规划多天
+
+        Args:
+            dates: 日期列表 YYYY-MM-DD（须晚于今天）
+            strategy: engine 中的排期策略
+            write: False 时只预览，不写数据库
+            options: 传给策略的参数（如 local 的 budget_ms）
+
+        Returns:
+            [{'date', 'scheduled': [{'id', 'scheduled_start', 'scheduled_end'}],
+              'unscheduled': [id], 'stats'}]，按日期排序
+
+        Raises:
+            ValueError: 日期不晚于今天、格式错误或未知策略
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError(f'未知排期策略: {strategy}')
+        dates = sorted(set(dates))
+        today = datetime.now().strftime('%Y-%m-%d')
+        for day in dates:
+            datetime.strptime(day, '%Y-%m-%d')
+            if day <= today:
+                raise ValueError(f'批量排期只规划明天及以后的日期: {day}')
+        if not dates:
+            return []
+
+        jobs, previous = self._build_jobs(dates, strategy, options)
+        pending = [job for job in jobs.values() if job[5]]
+        results = {result[0]: result for result in self._map(pending)}
+        results = self._carry_over(dates, jobs, results)
+
+        if write:
+            changes = []
+            for _, slots, unscheduled, _ in results:
+                changes.extend({'id': task_id, 'scheduled_start': start, 'scheduled_end': end}
+                               for task_id, start, end in slots
+                               if previous.get(task_id) != (start, end))
+                # 原本排在这几天、这次放不下的退回待排期
+                changes.extend({'id': task_id, 'scheduled_start': None, 'scheduled_end': None}
+                               for task_id in unscheduled if task_id in previous)
+            self.db.update_task_schedules(changes)
+
+        return [{
+            'date': day,
+            'scheduled': [{'id': task_id, 'scheduled_start': start, 'scheduled_end': end}
+                          for task_id, start, end in slots],
+            'unscheduled': unscheduled,
+            'stats': stats
+        } for day, slots, unscheduled, stats in results]
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    # ========== 作业 ==========
+
+    def _build_jobs(self, dates: List[str], strategy: str,
+                    options: Dict) -> Tuple[Dict[str, Tuple], Dict[int, Tuple[str, str]]]:
+        """返回 ({日期: 作业}（每个日期都有，没有任务的作业 rows 为空）, 原有排期 {任务 id: (开始, 结束)})"""
+        prefs = self.db.get_user_preferences()
+        work_start = time_to_minutes(prefs.work_start_time)
+        work_end = time_to_minutes(prefs.work_end_time)
+        first = dates[0]
+        end = (datetime.strptime(dates[-1], '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+        tasks_by_day = {}
+        previous = {}
+        for task in self.db.get_tasks_scheduled_between(first, end):
+            tasks_by_day.setdefault(task.scheduled_start[:10], []).append(task)
+            previous[task.id] = (task.scheduled_start, task.scheduled_end)
+
+        busy_by_day = {}
+        for occurrence in self.db.get_fixed_occurrences(first, end):
+            busy_by_day.setdefault(occurrence.date, []).append(
+                (time_to_minutes(occurrence.start_time), time_to_minutes(occurrence.end_time)))
+
+        assigned = self._assign(dates, self.db.get_pending_unscheduled_tasks(),
+                                tasks_by_day, busy_by_day, work_start, work_end)
+        jobs = {}
+        for day in dates:
+            rows = tuple((t.id, t.estimated_duration, t.priority, t.category, t.deadline)
+                         for t in tasks_by_day.get(day, []) + assigned[day])
+            jobs[day] = (day, work_start, work_end, prefs.break_duration,
+                         tuple(busy_by_day.get(day, ())), rows, strategy, options)
+        return jobs, previous
+
+    def _assign(self, dates: List[str], unscheduled: List, tasks_by_day: Dict[str, List],
+                busy_by_day: Dict[str, List], work_start: int, work_end: int) -> Dict[str, List]:
+        """
+        未排期任务预分到各天：按截止时间优先（同截止时间按优先级）的顺序，放进最早一天里
+        第一个放得下的空档（只用来决定哪天，具体时间由当天的作业求解）；哪天都放不下的分给最后一天
+        """
+        assigned = {day: [] for day in dates}
+        if not unscheduled:
+            return assigned
+
+        free = {}
+        for day in dates:
+            free[day] = FreeIntervals(work_start, work_end, busy_by_day.get(day, ()))
+            for task in tasks_by_day.get(day, ()):
+                free[day].reserve(time_to_minutes(task.scheduled_start[11:16]),
+                                  time_to_minutes(task.scheduled_end[11:16]) if task.scheduled_end else work_end)
+
+        problem = Problem(unscheduled, (), work_start, work_end, day=dates[0])
+        for i in sorted(range(len(problem)), key=lambda i: (problem.deadline_key(i), -problem.weights[i])):
+            duration = problem.durations[i]
+            for day in dates:
+                start = free[day].find(work_start, duration)
+                if start is not None:
+                    free[day].reserve(start, start + duration)
+                    break
+            else:
+                day = dates[-1]
+            assigned[day].append(unscheduled[i])
+        return assigned
+
+    def _carry_over(self, dates: List[str], jobs: Dict[str, Tuple],
+                    results: Dict[str, Tuple]) -> List[Tuple]:
+        """
+        预分配只是估算，当天的策略（按优先级排序、局部搜索留休息时间）可能放不下其中一些任务：
+        这些任务顺延到下一天的作业在当前进程重算（通常只涉及很少几天），最后一天仍放不下的才算未排期
+
+        Returns:
+            按日期排序的结果（没有任务的日期不出现）
+        """
+        rows = {row[0]: row for job in jobs.values() for row in job[5]}
+        carried = ()
+        for day in dates:
+            if carried:
+                job = jobs[day]
+                results[day] = solve_job(job[:5] + (job[5] + carried,) + job[6:])
+            if day not in results or day == dates[-1]:
+                continue
+            _, slots, unscheduled, stats = results[day]
+            carried = tuple(rows[task_id] for task_id in unscheduled)
+            results[day] = (day, slots, [], stats)
+        return [results[day] for day in dates if day in results]
+
+    def _map(self, jobs: List[Tuple]) -> List[Tuple]:
+        """一个作业或单进程时直接在当前进程算，省掉进程间传输"""
+        if len(jobs) <= 1 or self.max_workers <= 1:
+            return [solve_job(job) for job in jobs]
+        try:
+            return list(self._pool().map(solve_job, jobs))
+        except BrokenProcessPool:
+            # 工作进程异常退出：丢弃进程池，本次改为在当前进程计算
+            with self._lock:
+                self._executor = None
+            return [solve_job(job) for job in jobs]
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """进程池按需创建并复用，避免每次批量排期都重新启动进程"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
@@ -0,0 +1,6 @@
+"""
+排期热路径基准
+
+workload.py 生成可复现的任务集与固定日程，bench_scheduling.py 计时并与 JSON 基线比较，
+bench_free_intervals.py 单独对比空闲时段查找的新旧实现。
+"""
@@ -0,0 +1,96 @@
+"""
+空闲时段查找基准：旧的线性扫描 vs FreeIntervals
+
+用法：python benchmarks/bench_free_intervals.py [--sizes 100,1000,10000] [--legacy-max 10000]
+
+工作窗口按任务数放大（每个任务约 30 分钟），固定日程很密：每 45 分钟有 15 分钟被占用。
+旧实现每放一个任务都要 sort 占用列表并从头扫描，耗时随任务数平方增长；
+FreeIntervals 每次查找/占用都是 O(log M)。
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intervals import FreeIntervals
+
+
+def make_workload(n_tasks, seed=42):
+    """生成 (窗口起点, 窗口终点, 固定日程占用, 任务时长列表)"""
+    rng = random.Random(seed)
+    start = 9 * 60
+    end = start + n_tasks * 30
+    busy = [(t, t + 15) for t in range(start + 30, end, 45)]
+    durations = [rng.choice((15, 20, 30, 45, 60)) for _ in range(n_tasks)]
+    return start, end, busy, durations
+
+
+def legacy_schedule(start, end, busy, durations):
+    """重构前 app.greedy_schedule 的做法：线性扫描 + 每次放置后重新排序"""
+    def find_available_slot(current, duration, end, occupied):
+        for occ_start, occ_end in occupied:
+            if current + duration <= occ_start:
+                return current
+            if current < occ_end:
+                current = occ_end
+        if current + duration <= end:
+            return current
+        return None
+
+    occupied = sorted(busy)
+    placed = 0
+    current = start
+    for duration in durations:
+        slot = find_available_slot(current, duration, end, occupied)
+        if slot is not None:
+            occupied.append((slot, slot + duration))
+            occupied.sort()
+            current = slot + duration
+            placed += 1
+    return placed
+
+
+def interval_schedule(start, end, busy, durations):
+    free = FreeIntervals(start, end, busy)
+    placed = 0
+    current = start
+    for duration in durations:
+        slot = free.find(current, duration)
+        if slot is not None:
+            free.reserve(slot, slot + duration)
+            current = slot + duration
+            placed += 1
+    return placed
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    result = func(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    parser.add_argument('--legacy-max', type=int, default=10000,
+                        help='任务数超过该值时跳过旧实现（它是平方级的）')
+    args = parser.parse_args()
+
+    print(f"{'tasks':>8} {'busy':>8} {'placed':>8} {'legacy_ms':>12} {'intervals_ms':>14} {'speedup':>9}")
+    for n in (int(x) for x in args.sizes.split(',')):
+        workload = make_workload(n)
+        placed, fast_ms = timed(interval_schedule, *workload)
+        if n <= args.legacy_max:
+            legacy_placed, legacy_ms = timed(legacy_schedule, *workload)
+            assert legacy_placed == placed, (legacy_placed, placed)
+            legacy_col, speedup = f'{legacy_ms:12.1f}', f'{legacy_ms / fast_ms:8.1f}x'
+        else:
+            legacy_col, speedup = f"{'skipped':>12}", f"{'-':>9}"
+        print(f'{n:>8} {len(workload[2]):>8} {placed:>8} {legacy_col} {fast_ms:14.1f} {speedup}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+排期热路径基准：计时 + 内存峰值，结果存为 JSON 基线并可与旧基线比较
+
+用法：
+    python benchmarks/bench_scheduling.py [--sizes 10,100,1000,10000] [--rounds 5]
+        [--density normal] [--save benchmarks/baseline.json]
+        [--compare benchmarks/baseline.json] [--threshold 1.5]
+
+每个用例先预热一轮，再计时 rounds 轮（每轮前把数据恢复到同样的初始状态，恢复不计时），
+报告 min / median / mean / max / stddev；另跑一轮在 tracemalloc 下记录内存峰值。
+--compare 时最短耗时（比中位数更不受机器抖动影响）超过基线 threshold 倍（且慢了 1ms 以上）的用例视为退化，退出码为 1。
+
+app.py 在导入时就打开当前目录下的 tasks.db，所以基准先切到临时目录再导入 app。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_free_intervals import interval_schedule, make_workload
+from benchmarks.workload import DENSITIES, load, make_fixed_schedules, make_tasks, unschedule_all
+from engine import Problem, solve
+from recurrence import day_of_week
+
+NOISE_FLOOR_MS = 1.0
+
+
+def measure(func, setup=None, rounds=5, warmup=1):
+    """计时 rounds 轮并记录一轮的内存峰值，返回统计字典"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        func()
+
+    times = []
+    for _ in range(rounds):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - started) * 1000)
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'rounds': rounds,
+        'min_ms': round(min(times), 3),
+        'median_ms': round(statistics.median(times), 3),
+        'mean_ms': round(statistics.mean(times), 3),
+        'max_ms': round(max(times), 3),
+        'stddev_ms': round(statistics.stdev(times), 3) if len(times) > 1 else 0.0,
+        'peak_kb': round(peak / 1024, 1)
+    }
+
+
+def build_cases(app_module, n, density):
+    """[(用例名, 函数, 每轮前的恢复函数)]；数据库用例共用 app 的 Database"""
+    db = app_module.db
+    tasks = make_tasks(n)
+    fixed = make_fixed_schedules(density)
+    load(db, tasks, fixed)
+    interval_workload = make_workload(n)
+
+    today = day_of_week(datetime.now().date())
+    today_fixed = [s for s in fixed if s['day_of_week'] == today]
+    prefs = db.get_user_preferences()
+    client = app_module.app.test_client()
+    reset = lambda: unschedule_all(db)
+
+    # 引擎：问题只解析一次，各策略共用
+    to_minutes = app_module.time_to_minutes
+    busy = [(to_minutes(s['start_time']), to_minutes(s['end_time'])) for s in today_fixed]
+    window = (to_minutes(prefs.work_start_time), to_minutes(prefs.work_end_time))
+    problem = Problem(tasks, busy, *window)
+
+    return [
+        # 纯函数：不碰数据库，时长按原始的 '30m' / 整数混合格式传入
+        ('app.greedy_schedule',
+         lambda: app_module.greedy_schedule(tasks, today_fixed, prefs.work_start_time,
+                                            prefs.work_end_time),
+         None),
+        ('engine.Problem', lambda: Problem(tasks, busy, *window), None),
+        ('engine.greedy', lambda: solve(problem, 'greedy'), None),
+        ('engine.edf', lambda: solve(problem, 'edf'), None),
+        ('engine.batch', lambda: solve(problem, 'batch'), None),
+        # find_available_slot 已由 FreeIntervals 取代，这里测它的查找 + 占用
+        ('FreeIntervals.find', lambda: interval_schedule(*interval_workload), None),
+        ('Scheduler.greedy_schedule', lambda: app_module.planner.greedy_schedule(), reset),
+        ('Scheduler.horizon_schedule', lambda: app_module.planner.horizon_schedule(days=7), reset),
+        ('POST /auto_schedule', lambda: client.post('/auto_schedule'), reset),
+    ]
+
+
+def compare(results, baseline, threshold):
+    """返回退化列表 [(用例, 任务数, 基线最短耗时, 当前最短耗时)]"""
+    regressions = []
+    for case, by_size in results.items():
+        for size, stats in by_size.items():
+            old = baseline.get('results', {}).get(case, {}).get(size)
+            if not old:
+                continue
+            slower = stats['min_ms'] - old['min_ms']
+            if stats['min_ms'] > old['min_ms'] * threshold and slower > NOISE_FLOOR_MS:
+                regressions.append((case, size, old['min_ms'], stats['min_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--density', default='normal', choices=sorted(DENSITIES))
+    parser.add_argument('--save', help='把结果写成 JSON 基线')
+    parser.add_argument('--compare', help='与已有 JSON 基线比较')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='最短耗时超过基线多少倍算退化')
+    args = parser.parse_args()
+    # 下面要切换工作目录，先把路径转成绝对路径
+    save_path = args.save and os.path.abspath(args.save)
+    compare_path = args.compare and os.path.abspath(args.compare)
+
+    workdir = tempfile.mkdtemp(prefix='bench_scheduling_')
+    os.chdir(workdir)
+    import app as app_module
+
+    results = {}
+    try:
+        print(f"{'case':<28} {'tasks':>6} {'median_ms':>10} {'min_ms':>9} {'max_ms':>9} {'peak_kb':>9}")
+        for n in (int(x) for x in args.sizes.split(',')):
+            for name, func, setup in build_cases(app_module, n, args.density):
+                stats = measure(func, setup, rounds=args.rounds)
+                results.setdefault(name, {})[str(n)] = stats
+                print(f"{name:<28} {n:>6} {stats['median_ms']:>10.2f} {stats['min_ms']:>9.2f} "
+                      f"{stats['max_ms']:>9.2f} {stats['peak_kb']:>9.1f}")
+    finally:
+        app_module.scheduler.shutdown(wait=False)
+
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'density': args.density,
+            'rounds': args.rounds
+        },
+        'results': results
+    }
+    if save_path:
+        with open(save_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f'基线已保存到 {args.save}')
+
+    if compare_path:
+        with open(compare_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for case, size, old, new in regressions:
+            print(f'退化: {case} @ {size} 个任务: {old:.2f}ms -> {new:.2f}ms ({new / old:.1f}x)')
+        if regressions:
+            sys.exit(1)
+        print(f'与基线 {args.compare} 相比没有超过 {args.threshold}x 的退化')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""
+可复现的合成负载：任务集 + 固定日程
+
+同一个 seed 总是生成同样的数据。任务的时长一半是整数分钟、一半是 '30m' / '1.5h'
+这类字符串（两种历史格式都要走 duration_to_minutes），截止时间有的只有日期、
+有的带时刻、有的为空；固定日程按密度在每天 08:00-18:00 之间生成不重叠的课程块。
+"""
+import random
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+PRIORITIES = ('high', 'medium', 'low')
+PRIORITY_WEIGHTS = (2, 5, 3)
+CATEGORIES = ('工作', '学习', '生活', '其他')
+DURATION_MINUTES = (15, 20, 30, 45, 60, 90, 120)
+DURATION_STRINGS = ('15m', '30m', '45m', '1h', '1.5h', '2h')
+
+# 每天的固定日程块数
+DENSITIES = {'none': 0, 'sparse': 1, 'normal': 3, 'dense': 5}
+
+
+def make_tasks(n: int, seed: int = 42, today: Optional[date] = None) -> List[Dict]:
+    """生成 n 个待排期任务（字段同 add_tasks_bulk 的输入，另带从 1 开始的 id）"""
+    rng = random.Random(seed)
+    today = today or datetime.now().date()
+    tasks = []
+    for i in range(n):
+        if rng.random() < 0.5:
+            duration = rng.choice(DURATION_MINUTES)
+        else:
+            duration = rng.choice(DURATION_STRINGS)
+
+        roll = rng.random()
+        if roll < 0.3:
+            deadline = None
+        elif roll < 0.7:
+            deadline = (today + timedelta(days=rng.randint(0, 14))).isoformat()
+        else:
+            due = datetime.combine(today, datetime.min.time()) + timedelta(
+                days=rng.randint(0, 14), hours=rng.randint(9, 21))
+            deadline = due.isoformat(timespec='minutes')
+
+        tasks.append({
+            'id': i + 1,
+            'content': f'任务{i + 1}',
+            'category': rng.choice(CATEGORIES),
+            'priority': rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0],
+            'estimated_duration': duration,
+            'deadline': deadline
+        })
+    return tasks
+
+
+def make_fixed_schedules(density: str = 'normal', seed: int = 42) -> List[Dict]:
+    """生成一周的固定日程（day_of_week 0=周日），每天 DENSITIES[density] 块"""
+    rng = random.Random(seed)
+    per_day = DENSITIES[density]
+    schedules = []
+    for day in range(7):
+        cursor = 8 * 60
+        for block in range(per_day):
+            # 剩余时间平均分给剩下的块，块长 45-120 分钟
+            room = (18 * 60 - cursor) // (per_day - block)
+            length = min(rng.choice((45, 90, 100, 120)), room)
+            if length <= 0:
+                break
+            start = cursor + rng.randint(0, room - length)
+            schedules.append({
+                'title': f'课程{day}-{block + 1}',
+                'day_of_week': day,
+                'start_time': f'{start // 60:02d}:{start % 60:02d}',
+                'end_time': f'{(start + length) // 60:02d}:{(start + length) % 60:02d}',
+                'recurrence': 'weekly'
+            })
+            cursor = start + length
+    return schedules
+
+
+def load(db, tasks: List[Dict], fixed_schedules: List[Dict]):
+    """清空任务和固定日程后写入负载（任务一次批量插入）"""
+    conn = db.get_connection()
+    try:
+        with conn:
+            conn.execute('DELETE FROM tasks')
+            conn.execute('DELETE FROM fixed_schedules')
+    finally:
+        conn.close()
+    db.add_tasks_bulk(tasks)
+    for schedule in fixed_schedules:
+        db.add_fixed_schedule(**schedule)
+
+
+def unschedule_all(db):
+    """清空所有排期并截断 WAL，让下一轮从同样的初始状态开始（检查点不会落在计时区间里）"""
+    conn = db.get_connection()
+    try:
+        with conn:
+            conn.execute('UPDATE tasks SET scheduled_start = NULL, scheduled_end = NULL '
+                         'WHERE scheduled_start IS NOT NULL')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
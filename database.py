@@ -1,15 +1,717 @@
 import sqlite3
 import json
-from datetime import datetime
-from typing import List, Dict, Optional
+import queue
+import zlib
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterable, Iterator, Callable
+
+from models import (Task, FixedSchedule, FixedOccurrence, UserPreferences, ChatMessage,
+                    duration_to_minutes, normalize_deadline)
+from recurrence import expand, to_date
+
+
+class PooledConnection:
+    """
+    连接池中的连接代理
+    
+    用法与 sqlite3.Connection 相同，close() 不会真正关闭连接，而是归还到连接池。
+    """
+    
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self._pool = pool
+        self._conn = conn
+    
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError('连接已归还到连接池')
+        return getattr(self._conn, name)
+    
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+    
+    def close(self):
+        """归还连接（重复调用无副作用）"""
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+    
+    def __del__(self):
+        # 忘记 close() 时（例如异常路径）也要把连接还回去，避免连接池被耗尽
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """
+    SQLite 连接池（有界队列）
+    
+    连接只在首次需要时打开一次，之后在线程间复用；每个连接都设置为 WAL 模式、
+    synchronous=NORMAL，并调整页缓存与忙等待超时，读请求不再被写事务阻塞。
+    """
+    
+    def __init__(self, db_path: str, size: int = 8, timeout: float = 30.0,
+                 cache_size_kb: int = 8192, busy_timeout_ms: int = 5000,
+                 cached_statements: int = 256):
+        self.db_path = db_path
+        self.cached_statements = cached_statements
+        self.size = size
+        self.timeout = timeout
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle = queue.LifoQueue(maxsize=size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_total_ms': 0.0,
+            'wait_time_max_ms': 0.0,
+            'timeouts': 0
+        }
+    
+    def _open(self) -> sqlite3.Connection:
+        """打开一个新连接并设置 PRAGMA"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        # auto_vacuum 只能在建第一张表（切换 WAL 也会写入文件头）之前设置，否则要一次完整 VACUUM；
+        # 新库在这里直接启用增量 vacuum，已有的库由 vacuum() 首次运行时转换
+        if conn.execute('PRAGMA page_count').fetchone()[0] == 0:
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA busy_timeout={int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        return conn
+    
+    def acquire(self) -> PooledConnection:
+        """取出一个连接；连接池已满时等待其他线程归还"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = self._open()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                started = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise sqlite3.OperationalError(
+                        f'等待数据库连接超时（{self.timeout}s）')
+                waited = (time.perf_counter() - started) * 1000
+                with self._lock:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total_ms'] += waited
+                    self._stats['wait_time_max_ms'] = max(
+                        self._stats['wait_time_max_ms'], waited)
+        
+        with self._lock:
+            self._stats['checkouts'] += 1
+        return PooledConnection(self, conn)
+    
+    def release(self, conn: sqlite3.Connection):
+        """归还连接，未提交的事务会被回滚"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put_nowait(conn)
+    
+    def stats(self) -> Dict:
+        """连接池统计信息"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['in_use'] = stats['open'] - stats['idle']
+        stats['wait_time_avg_ms'] = (
+            stats['wait_time_total_ms'] / stats['waits'] if stats['waits'] else 0.0
+        )
+        return stats
+    
+    def close_all(self):
+        """关闭所有空闲连接"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._lock:
+                self._created -= 1
+
+
+# ========== 预编译语句 ==========
+# 所有读写都走这组固定的参数化语句：SQL 文本不变，sqlite3 会在每个连接上缓存
+# 编译结果；查询耗时也按语句名统计（见 Database.query_stats）。
+
+TASK_COLUMNS = ('id, content, category, priority, estimated_duration, deadline, '
+                'scheduled_start, scheduled_end, status, created_at, completed_at, row_version, '
+                'enrichment_status')
+FIXED_COLUMNS = ('id, title, day_of_week, start_time, end_time, recurrence, location, source, '
+                 'start_date, end_date, row_version')
+
+# 待排期任务的贪心顺序：优先级（未知按 medium）→ 截止时间（只有日期的视为次日 0 点，没有的排最后）
+# 与 engine.GreedyStrategy 一致；截止时间写入时已统一格式（models.normalize_deadline），按文本比较即按时间比较。
+# 迁移 11 的表达式索引使用同样的表达式，查询可以直接按索引顺序读取
+PRIORITY_RANK_SQL = "CASE priority WHEN 'high' THEN 1 WHEN 'low' THEN 3 ELSE 2 END"
+DEADLINE_KEY_SQL = ("COALESCE(CASE WHEN length(deadline) <= 10 THEN date(deadline, '+1 day') || 'T00:00:00' "
+                    "ELSE deadline END, '9999-12-31')")
+# iter_unscheduled_tasks 不限时长时的上限（分钟）
+MAX_DURATION = 2 ** 31
+
+STATEMENTS = {
+    # 任务
+    'tasks.insert': '''
+        INSERT INTO tasks (content, category, priority, estimated_duration, deadline, created_at,
+                           enrichment_status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''',
+    # AI 增强结果只在解析出的字段仍是临时值（用户没改过）时写回
+    'tasks.enrich': '''
+        UPDATE tasks SET content = ?, category = ?, priority = ?, estimated_duration = ?,
+                         deadline = ?, enrichment_status = 'done'
+        WHERE id = ? AND enrichment_status = 'pending'
+          AND content IS ? AND category IS ? AND priority IS ?
+          AND estimated_duration IS ? AND deadline IS ?
+    ''',
+    'tasks.set_enrichment_status': '''
+        UPDATE tasks SET enrichment_status = ? WHERE id = ? AND enrichment_status = 'pending'
+    ''',
+    'tasks.enrichment_pending': f'''
+        SELECT {TASK_COLUMNS} FROM tasks WHERE enrichment_status = 'pending' ORDER BY id LIMIT ?
+    ''',
+    'tasks.get': f'SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?',
+    'tasks.all': f'SELECT {TASK_COLUMNS} FROM tasks ORDER BY priority DESC, created_at DESC',
+    'tasks.page': f'SELECT {TASK_COLUMNS} FROM tasks WHERE id > ? ORDER BY id LIMIT ?',
+    'tasks.by_status': f'''
+        SELECT {TASK_COLUMNS} FROM tasks WHERE status = ?
+        ORDER BY priority DESC, created_at DESC
+    ''',
+    'tasks.pending_unscheduled': f'''
+        SELECT {TASK_COLUMNS} FROM tasks
+        WHERE status = 'pending' AND scheduled_start IS NULL
+        ORDER BY {PRIORITY_RANK_SQL}, {DEADLINE_KEY_SQL}, id
+    ''',
+    # 同一优先级内按 (截止时间, id) 键集翻页：优先级取等值、截止时间取范围才能在表达式索引上定位，
+    # (截止时间, id) 的行值比较不会走索引，所以拆成 >= 定位加 OR 过滤。
+    # 时长超过上限的直接在索引里跳过（早期以文本存的时长如 '30m' 交给调用方换算）
+    'tasks.unscheduled_page': f'''
+        SELECT {TASK_COLUMNS}, {DEADLINE_KEY_SQL} AS deadline_key
+        FROM tasks
+        WHERE status = 'pending' AND scheduled_start IS NULL
+          AND {PRIORITY_RANK_SQL} = ? AND {DEADLINE_KEY_SQL} >= ?
+          AND ({DEADLINE_KEY_SQL} > ? OR id > ?)
+          AND (typeof(estimated_duration) != 'integer' OR estimated_duration <= ?)
+        ORDER BY {DEADLINE_KEY_SQL}, id
+        LIMIT ?
+    ''',
+    'tasks.pending_top': f'''
+        SELECT {TASK_COLUMNS} FROM tasks WHERE status = 'pending'
+        ORDER BY priority DESC LIMIT ?
+    ''',
+    'tasks.pending_high': f'''
+        SELECT {TASK_COLUMNS} FROM tasks
+        WHERE status = 'pending' AND priority = 'high' LIMIT ?
+    ''',
+    'tasks.starting_between': '''
+        SELECT id, content, scheduled_start FROM tasks
+        WHERE status = 'pending' AND scheduled_start IS NOT NULL
+        AND scheduled_start BETWEEN ? AND ?
+    ''',
+    'tasks.scheduled_between': f'''
+        SELECT {TASK_COLUMNS} FROM tasks
+        WHERE status = 'pending' AND scheduled_start >= ? AND scheduled_start < ?
+        ORDER BY scheduled_start
+    ''',
+    'tasks.count_by_status': 'SELECT COUNT(*) FROM tasks WHERE status = ?',
+    'tasks.count_completed_between': '''
+        SELECT COUNT(*) FROM tasks
+        WHERE status = 'completed' AND completed_at >= ? AND completed_at < ?
+    ''',
+    'stats.get': 'SELECT count FROM task_stats WHERE stat = ? AND bucket = ?',
+    'tasks.set_schedule': 'UPDATE tasks SET scheduled_start = ?, scheduled_end = ? WHERE id = ?',
+    'tasks.complete': "UPDATE tasks SET status = 'completed', completed_at = ? WHERE id = ?",
+    'tasks.delete': 'DELETE FROM tasks WHERE id = ?',
+    
+    # 固定日程
+    'fixed.insert': '''
+        INSERT INTO fixed_schedules
+        (title, day_of_week, start_time, end_time, recurrence, location, source, start_date, end_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'fixed.all': f'''
+        SELECT {FIXED_COLUMNS}
+        FROM fixed_schedules ORDER BY day_of_week, start_time
+    ''',
+    'fixed.by_day': f'''
+        SELECT {FIXED_COLUMNS}
+        FROM fixed_schedules WHERE day_of_week = ? ORDER BY start_time
+    ''',
+    'fixed.delete': 'DELETE FROM fixed_schedules WHERE id = ?',
+    'fixed.exceptions': 'SELECT schedule_id, date FROM fixed_schedule_exceptions',
+    'fixed.exception_insert': 'INSERT OR IGNORE INTO fixed_schedule_exceptions (schedule_id, date) VALUES (?, ?)',
+    'fixed.exception_delete': 'DELETE FROM fixed_schedule_exceptions WHERE schedule_id = ? AND date = ?',
+    
+    # 固定日程展开缓存
+    'occ.days': 'SELECT date FROM fixed_occurrence_days WHERE date >= ? AND date < ?',
+    'occ.range': '''
+        SELECT schedule_id, date, start_time, end_time, title, location
+        FROM fixed_occurrences WHERE date >= ? AND date < ? ORDER BY date, start_time
+    ''',
+    'occ.insert': '''
+        INSERT OR IGNORE INTO fixed_occurrences
+        (schedule_id, date, start_time, end_time, title, location)
+        VALUES (:schedule_id, :date, :start_time, :end_time, :title, :location)
+    ''',
+    'occ.mark_day': 'INSERT OR IGNORE INTO fixed_occurrence_days (date) VALUES (?)',
+    
+    # 用户偏好
+    'prefs.get': 'SELECT * FROM user_preferences WHERE id = 1',
+    'prefs.version': 'SELECT row_version FROM user_preferences WHERE id = 1',
+    
+    # 对话历史
+    'chat.insert': 'INSERT INTO chat_history (role, content, timestamp) VALUES (?, ?, ?)',
+    'chat.recent': '''
+        SELECT id, role, content, timestamp FROM chat_history
+        ORDER BY timestamp DESC LIMIT ?
+    ''',
+    # (timestamp, id) 组合键翻页：同一时间戳的一问一答不会被页边界拆开或漏掉
+    'chat.page_before': '''
+        SELECT id, role, content, timestamp FROM chat_history
+        WHERE (timestamp, id) < (?, ?)
+        ORDER BY timestamp DESC, id DESC LIMIT ?
+    ''',
+    'chat.cutoff': 'SELECT timestamp FROM chat_history ORDER BY timestamp DESC LIMIT 1 OFFSET ?',
+    'chat.older_than': '''
+        SELECT id, role, content, timestamp FROM chat_history
+        WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+    ''',
+    'chat.delete': 'DELETE FROM chat_history WHERE id = ?',
+    'chat.archive_insert': '''
+        INSERT INTO chat_archive (first_timestamp, last_timestamp, message_count, payload)
+        VALUES (?, ?, ?, ?)
+    ''',
+    'chat.archive_all': 'SELECT payload FROM chat_archive ORDER BY first_timestamp',
+    
+    # LLM 响应缓存
+    'llm_cache.get': 'SELECT response, created_at FROM llm_cache WHERE key = ? AND created_at >= ?',
+    'llm_cache.put': '''
+        INSERT OR REPLACE INTO llm_cache (key, response, created_at, used_at) VALUES (?, ?, ?, ?)
+    ''',
+    'llm_cache.touch': 'UPDATE llm_cache SET used_at = ? WHERE key = ?',
+    'llm_cache.delete_expired': 'DELETE FROM llm_cache WHERE created_at < ?',
+    # 只保留最近使用的 n 条
+    'llm_cache.trim': '''
+        DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM llm_cache ORDER BY used_at DESC LIMIT -1 OFFSET ?
+        )
+    ''',
+    
+    # 增量同步
+    'sync.version': 'SELECT version FROM sync_version WHERE id = 1',
+    'tasks.changed_since': f'SELECT {TASK_COLUMNS} FROM tasks WHERE row_version > ? ORDER BY row_version',
+    'fixed.changed_since': f'SELECT {FIXED_COLUMNS} FROM fixed_schedules WHERE row_version > ? ORDER BY row_version',
+    'sync.deleted_since': '''
+        SELECT row_id FROM sync_tombstones WHERE version > ? AND table_name = ?
+    ''',
+    'sync.pruned_through': 'SELECT pruned_through FROM sync_version WHERE id = 1',
+    # 先记下要清理的最大版本号，再按主键范围删除：游标早于它的客户端需要全量同步
+    'sync.mark_pruned': '''
+        UPDATE sync_version SET pruned_through = MAX(pruned_through, COALESCE(
+            (SELECT MAX(version) FROM sync_tombstones WHERE deleted_at < ?), 0))
+        WHERE id = 1
+    ''',
+    'sync.prune_tombstones': '''
+        DELETE FROM sync_tombstones WHERE version <= (SELECT pruned_through FROM sync_version WHERE id = 1)
+    ''',
+    
+    # 集合校验值（ETag）：最大 row_version + 最近一次删除的版本号，走索引，不读数据行
+    'tasks.max_version': 'SELECT MAX(row_version) FROM tasks',
+    'fixed.max_version': 'SELECT MAX(row_version) FROM fixed_schedules',
+    'prefs.max_version': 'SELECT MAX(row_version) FROM user_preferences',
+    'sync.last_deleted': 'SELECT MAX(version) FROM sync_tombstones WHERE table_name = ?',
+}
+
+# 集合名 -> (表名, 最大版本语句)
+COLLECTIONS = {
+    'tasks': ('tasks', 'tasks.max_version'),
+    'fixed_schedules': ('fixed_schedules', 'fixed.max_version'),
+    'preferences': ('user_preferences', 'prefs.max_version'),
+}
+
+def _row_version_sql(table: str) -> List[str]:
+    """
+    为表加上 row_version 列及维护它的触发器
+    
+    sync_version 是全库单调递增的版本号：每次插入/修改都把行的 row_version 设为新版本，
+    删除则写入 sync_tombstones，客户端凭上次拿到的版本号即可取回增量。
+    """
+    bump = "UPDATE sync_version SET version = version + 1 WHERE id = 1;"
+    current = '(SELECT version FROM sync_version WHERE id = 1)'
+    return [
+        f'ALTER TABLE {table} ADD COLUMN row_version INTEGER NOT NULL DEFAULT 0',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_row_version ON {table}(row_version)',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_version_insert AFTER INSERT ON {table}
+            BEGIN
+                {bump}
+                UPDATE {table} SET row_version = {current} WHERE id = NEW.id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_version_update AFTER UPDATE ON {table}
+            WHEN NEW.row_version = OLD.row_version
+            BEGIN
+                {bump}
+                UPDATE {table} SET row_version = {current} WHERE id = NEW.id;
+            END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{table}_version_delete AFTER DELETE ON {table}
+            BEGIN
+                {bump}
+                INSERT INTO sync_tombstones (version, table_name, row_id)
+                VALUES ({current}, '{table}', OLD.id);
+            END''',
+    ]
+
+
+def _tombstone_trigger_sql(table: str) -> List[str]:
+    """删除触发器：墓碑带上删除时间（本地时间 ISO 字符串），按时间清理"""
+    return [
+        f'DROP TRIGGER IF EXISTS trg_{table}_version_delete',
+        f'''CREATE TRIGGER trg_{table}_version_delete AFTER DELETE ON {table}
+            BEGIN
+                UPDATE sync_version SET version = version + 1 WHERE id = 1;
+                INSERT INTO sync_tombstones (version, table_name, row_id, deleted_at)
+                VALUES ((SELECT version FROM sync_version WHERE id = 1), '{table}', OLD.id,
+                        strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'));
+            END''',
+    ]
+
+
+def _task_stats_sql() -> List[str]:
+    """
+    task_stats 计数表及维护它的触发器
+    
+    (stat, bucket) -> count：
+      status/<状态>          各状态任务数
+      completed_day/<日期>   当天完成数（按 completed_at 的本地日期分桶）
+    问候/提醒接口读计数只查一行，不再随任务历史增长而变慢。
+    """
+    def bump(row: str, sign: str) -> List[str]:
+        return [
+            f"""INSERT INTO task_stats (stat, bucket, count)
+                VALUES ('status', COALESCE({row}.status, ''), {sign}1)
+                ON CONFLICT(stat, bucket) DO UPDATE SET count = count + excluded.count;""",
+            f"""INSERT INTO task_stats (stat, bucket, count)
+                SELECT 'completed_day', substr({row}.completed_at, 1, 10), {sign}1
+                WHERE {row}.status = 'completed' AND {row}.completed_at IS NOT NULL
+                ON CONFLICT(stat, bucket) DO UPDATE SET count = count + excluded.count;""",
+        ]
+    
+    def trigger(name: str, event: str, statements: List[str], when: str = '') -> str:
+        body = '\n                '.join(statements)
+        return f"""CREATE TRIGGER IF NOT EXISTS trg_tasks_stats_{name} AFTER {event} ON tasks
+            {when}
+            BEGIN
+                {body}
+            END"""
+    
+    return [
+        '''CREATE TABLE IF NOT EXISTS task_stats (
+               stat TEXT NOT NULL,
+               bucket TEXT NOT NULL,
+               count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (stat, bucket)
+           ) WITHOUT ROWID''',
+        # 回填已有数据
+        'DELETE FROM task_stats',
+        """INSERT INTO task_stats (stat, bucket, count)
+           SELECT 'status', COALESCE(status, ''), COUNT(*) FROM tasks
+           GROUP BY COALESCE(status, '')""",
+        """INSERT INTO task_stats (stat, bucket, count)
+           SELECT 'completed_day', substr(completed_at, 1, 10), COUNT(*) FROM tasks
+           WHERE status = 'completed' AND completed_at IS NOT NULL
+           GROUP BY substr(completed_at, 1, 10)""",
+        trigger('insert', 'INSERT', bump('NEW', '+')),
+        # 只有 status / completed_at 变化才需要调整计数
+        trigger('update', 'UPDATE OF status, completed_at', bump('OLD', '-') + bump('NEW', '+'),
+                when='WHEN OLD.status IS NOT NEW.status OR OLD.completed_at IS NOT NEW.completed_at'),
+        trigger('delete', 'DELETE', bump('OLD', '-')),
+    ]
+
+
+def _fixed_occurrences_sql() -> List[str]:
+    """
+    固定日程的有效期、例外日期，以及按日期缓存的展开结果
+    
+    fixed_occurrences 存放 recurrence.expand() 的结果，fixed_occurrence_days 记录
+    哪些日期已经展开过（当天没有课也要记一笔）。固定日程或例外日期有任何
+    增删改，触发器清空两张缓存表，下次查询时按需重新展开。
+    """
+    clear = '''DELETE FROM fixed_occurrences;
+                DELETE FROM fixed_occurrence_days;'''
+    
+    def trigger(name: str, event: str, extra: str = '') -> str:
+        return f'''CREATE TRIGGER IF NOT EXISTS trg_{name}_occurrences AFTER {event}
+            BEGIN
+                {extra}{clear}
+            END'''
+    
+    return [
+        'ALTER TABLE fixed_schedules ADD COLUMN start_date TEXT',
+        'ALTER TABLE fixed_schedules ADD COLUMN end_date TEXT',
+        '''CREATE TABLE IF NOT EXISTS fixed_schedule_exceptions (
+               schedule_id INTEGER NOT NULL,
+               date TEXT NOT NULL,
+               PRIMARY KEY (schedule_id, date)
+           ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS fixed_occurrences (
+               date TEXT NOT NULL,
+               start_time TEXT NOT NULL,
+               schedule_id INTEGER NOT NULL,
+               end_time TEXT NOT NULL,
+               title TEXT,
+               location TEXT,
+               PRIMARY KEY (date, start_time, schedule_id)
+           ) WITHOUT ROWID''',
+        '''CREATE TABLE IF NOT EXISTS fixed_occurrence_days (
+               date TEXT PRIMARY KEY
+           ) WITHOUT ROWID''',
+        trigger('fixed_insert', 'INSERT ON fixed_schedules'),
+        trigger('fixed_update', 'UPDATE ON fixed_schedules'),
+        trigger('fixed_delete', 'DELETE ON fixed_schedules',
+                'DELETE FROM fixed_schedule_exceptions WHERE schedule_id = OLD.id;\n                '),
+        trigger('exception_insert', 'INSERT ON fixed_schedule_exceptions'),
+        trigger('exception_delete', 'DELETE ON fixed_schedule_exceptions'),
+    ]
+
+
+# ========== 迁移 ==========
+# (版本号, 说明, 语句列表)，按 PRAGMA user_version 依次执行，每个版本只执行一次。
+# 没有 sqlite_stat1 统计时，查询规划器只认以 status 开头的索引，
+# 所以热点索引都以 status 为首列（部分索引的 WHERE 与查询条件一致）。
+
+MIGRATIONS = [
+    (1, '热点查询索引', [
+        # 待排期 / 提醒窗口：status='pending' 的部分索引，提醒查询可直接覆盖
+        """CREATE INDEX IF NOT EXISTS idx_tasks_pending_start
+           ON tasks(status, scheduled_start, content) WHERE status = 'pending'""",
+        # 今日完成数：completed_at 范围查询（替代 DATE(completed_at)=DATE('now')）
+        """CREATE INDEX IF NOT EXISTS idx_tasks_completed_at
+           ON tasks(status, completed_at) WHERE status = 'completed'""",
+        # 按状态计数 / 高优先级待办
+        'CREATE INDEX IF NOT EXISTS idx_tasks_status_priority ON tasks(status, priority)',
+        'CREATE INDEX IF NOT EXISTS idx_chat_history_timestamp ON chat_history(timestamp)',
+        '''CREATE INDEX IF NOT EXISTS idx_fixed_schedules_day
+           ON fixed_schedules(day_of_week, start_time)''',
+    ]),
+    (2, '增量同步：row_version 与删除墓碑', [
+        '''CREATE TABLE IF NOT EXISTS sync_version (
+               id INTEGER PRIMARY KEY CHECK(id = 1),
+               version INTEGER NOT NULL DEFAULT 0
+           )''',
+        'INSERT OR IGNORE INTO sync_version (id, version) VALUES (1, 0)',
+        '''CREATE TABLE IF NOT EXISTS sync_tombstones (
+               version INTEGER PRIMARY KEY,
+               table_name TEXT NOT NULL,
+               row_id INTEGER NOT NULL
+           )''',
+        *_row_version_sql('tasks'),
+        *_row_version_sql('fixed_schedules'),
+    ]),
+    (3, 'ETag：偏好版本号与墓碑索引', [
+        *_row_version_sql('user_preferences'),
+        '''CREATE INDEX IF NOT EXISTS idx_sync_tombstones_table
+           ON sync_tombstones(table_name, version)''',
+    ]),
+    (4, '任务计数表 task_stats（触发器维护）', _task_stats_sql()),
+    (5, '对话历史归档表', [
+        # 每行是一批旧消息，payload 为 zlib 压缩的 JSON 数组
+        '''CREATE TABLE IF NOT EXISTS chat_archive (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               first_timestamp TEXT,
+               last_timestamp TEXT,
+               message_count INTEGER NOT NULL,
+               payload BLOB NOT NULL
+           )''',
+    ]),
+    (6, '固定日程重复规则与展开缓存', _fixed_occurrences_sql()),
+    (7, '待排期任务的贪心顺序索引', [
+        # 部分索引的 WHERE 与查询条件一致，status 之后的列与 ORDER BY 一致，按索引顺序读取不用排序；
+        # 带上时长，翻页时的时长过滤不用回表
+        f'''CREATE INDEX IF NOT EXISTS idx_tasks_unscheduled_order
+            ON tasks(status, {PRIORITY_RANK_SQL}, {DEADLINE_KEY_SQL}, id, estimated_duration)
+            WHERE status = 'pending' AND scheduled_start IS NULL''',
+    ]),
+    (8, 'LLM 响应缓存', [
+        # key 为规范化提示词 + 模型 + 温度的哈希；时间为 ISO 字符串
+        '''CREATE TABLE IF NOT EXISTS llm_cache (
+               key TEXT PRIMARY KEY,
+               response TEXT NOT NULL,
+               created_at TEXT NOT NULL,
+               used_at TEXT NOT NULL
+           ) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_llm_cache_used ON llm_cache(used_at)',
+    ]),
+    (9, '任务的 AI 增强状态', [
+        # NULL：未经后台增强；pending / done / skipped（用户先改过）/ failed
+        'ALTER TABLE tasks ADD COLUMN enrichment_status TEXT',
+        """CREATE INDEX IF NOT EXISTS idx_tasks_enrichment_pending
+           ON tasks(enrichment_status) WHERE enrichment_status = 'pending'""",
+    ]),
+    (10, '墓碑删除时间与清理水位', [
+        'ALTER TABLE sync_tombstones ADD COLUMN deleted_at TEXT',
+        # 已有的墓碑没有删除时间，按迁移时间算，保留期过后再清理
+        """UPDATE sync_tombstones SET deleted_at = strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime')
+           WHERE deleted_at IS NULL""",
+        # 已清理的最大墓碑版本号
+        'ALTER TABLE sync_version ADD COLUMN pruned_through INTEGER NOT NULL DEFAULT 0',
+        *_tombstone_trigger_sql('tasks'),
+        *_tombstone_trigger_sql('fixed_schedules'),
+        *_tombstone_trigger_sql('user_preferences'),
+    ]),
+    (11, '截止时间统一格式，重建贪心顺序索引', [
+        # 与 models.normalize_deadline 一致：'YYYY-MM-DD HH:MM[:SS][时区]' → 'YYYY-MM-DDTHH:MM:00'
+        """UPDATE tasks SET deadline = substr(deadline, 1, 10) || 'T' || substr(deadline, 12, 5) || ':00'
+           WHERE deadline GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9][ T][0-9][0-9]:[0-9][0-9]*'
+             AND deadline != substr(deadline, 1, 10) || 'T' || substr(deadline, 12, 5) || ':00'""",
+        # 剩下无法解析的截止时间 engine 视为没有
+        """UPDATE tasks SET deadline = NULL
+           WHERE deadline IS NOT NULL AND (length(deadline) NOT IN (10, 19) OR date(deadline) IS NULL)""",
+        'DROP INDEX IF EXISTS idx_tasks_unscheduled_order',
+        f'''CREATE INDEX idx_tasks_unscheduled_order
+            ON tasks(status, {PRIORITY_RANK_SQL}, {DEADLINE_KEY_SQL}, id, estimated_duration)
+            WHERE status = 'pending' AND scheduled_start IS NULL''',
+    ]),
+]
+
+# 热点查询及示例参数：full_scan_queries() 用 EXPLAIN QUERY PLAN 检查它们没有退化成全表扫描
+HOT_QUERIES = {
+    'tasks.pending_unscheduled': (),
+    'tasks.starting_between': ('2025-01-01T09:00:00', '2025-01-01T09:05:00'),
+    'tasks.scheduled_between': ('2025-01-01', '2025-01-02'),
+    'tasks.count_completed_between': ('2025-01-01', '2025-01-02'),
+    'tasks.count_by_status': ('pending',),
+    'stats.get': ('status', 'pending'),
+    'tasks.pending_high': (3,),
+    'chat.recent': (10,),
+    'tasks.page': (0, 100),
+    'tasks.unscheduled_page': (1, '', '', 0, 60, 200),
+    'llm_cache.get': ('0' * 64, '2025-01-01T00:00:00'),
+    'tasks.enrichment_pending': (100,),
+    'chat.page_before': ('2025-01-01', 0, 50),
+    'chat.cutoff': (999,),
+    'chat.older_than': ('2025-01-01', 500),
+    'fixed.by_day': (0,),
+    'occ.days': ('2025-01-01', '2025-01-08'),
+    'occ.range': ('2025-01-01', '2025-01-08'),
+    'tasks.changed_since': (0,),
+    'sync.deleted_since': (0, 'tasks'),
+    'tasks.max_version': (),
+    'sync.last_deleted': ('tasks',),
+}
+
+# update_task / update_user_preferences 允许修改的列（按固定顺序拼 SQL，语句变体有限）
+TASK_UPDATABLE_FIELDS = ('content', 'category', 'priority', 'estimated_duration',
+                         'deadline', 'scheduled_start', 'scheduled_end', 'status', 'completed_at')
+# 后台 AI 增强会改写的字段（顺序与 tasks.enrich 一致）
+ENRICHED_FIELDS = ('content', 'category', 'priority', 'estimated_duration', 'deadline')
+PREFERENCE_FIELDS = ('work_start_time', 'work_end_time', 'break_duration',
+                     'focus_time_preference', 'enable_main_chat', 'sleep_reminder_time',
+                     'auto_reschedule_on_drag', 'do_not_disturb_start', 'do_not_disturb_end')
+
 
 class Database:
-    def __init__(self, db_path='ai_secretary.db'):
+    def __init__(self, db_path='ai_secretary.db', pool_size: int = 8,
+                 prefs_revalidate_seconds: float = 5.0):
         self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        self._stats_lock = threading.Lock()
+        self._query_stats = {}
+        # 用户偏好缓存：(偏好, 上次校验时间)；超过 prefs_revalidate_seconds 才去库里比对 row_version
+        self.prefs_revalidate_seconds = prefs_revalidate_seconds
+        self._prefs_lock = threading.Lock()
+        self._prefs_cache = None
+        self._prefs_stats = {'hits': 0, 'revalidations': 0, 'loads': 0}
         self.init_db()
     
-    def get_connection(self):
-        return sqlite3.connect(self.db_path)
+    def get_connection(self) -> PooledConnection:
+        """从连接池取出连接，用完调用 close() 归还"""
+        return self.pool.acquire()
+    
+    def pool_stats(self) -> Dict:
+        """连接池统计（用于观察取连接的等待情况）"""
+        return self.pool.stats()
+    
+    def query_stats(self) -> Dict:
+        """按语句名统计的调用次数与耗时（毫秒）"""
+        with self._stats_lock:
+            return {
+                name: {
+                    'calls': calls,
+                    'total_ms': round(total, 3),
+                    'avg_ms': round(total / calls, 3),
+                    'max_ms': round(worst, 3)
+                }
+                for name, (calls, total, worst) in self._query_stats.items()
+            }
+    
+    # ========== 语句执行 ==========
+    
+    def _record(self, name: str, started: float):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            calls, total, worst = self._query_stats.get(name, (0, 0.0, 0.0))
+            self._query_stats[name] = (calls + 1, total + elapsed, max(worst, elapsed))
+    
+    def _fetchall(self, name: str, params: Iterable = (), sql: str = None) -> List[sqlite3.Row]:
+        conn = self.get_connection()
+        try:
+            started = time.perf_counter()
+            rows = conn.execute(sql or STATEMENTS[name], tuple(params)).fetchall()
+            self._record(name, started)
+            return rows
+        finally:
+            conn.close()
+    
+    def _fetchone(self, name: str, params: Iterable = (), sql: str = None) -> Optional[sqlite3.Row]:
+        rows = self._fetchall(name, params, sql)
+        return rows[0] if rows else None
+    
+    def _execute(self, name: str, params: Iterable = (), sql: str = None) -> sqlite3.Cursor:
+        """执行单条写语句并提交"""
+        conn = self.get_connection()
+        try:
+            started = time.perf_counter()
+            with conn:
+                cursor = conn.execute(sql or STATEMENTS[name], tuple(params))
+            self._record(name, started)
+            return cursor
+        finally:
+            conn.close()
     
     def init_db(self):
         """初始化数据库表"""
@@ -58,10 +760,20 @@ class Database:
                 focus_time_preference TEXT DEFAULT 'morning',
                 enable_main_chat INTEGER DEFAULT 1,
                 do_not_disturb_start TEXT DEFAULT '13:00',
-                do_not_disturb_end TEXT DEFAULT '14:00'
+                do_not_disturb_end TEXT DEFAULT '14:00',
+                sleep_reminder_time TEXT DEFAULT '22:00',
+                auto_reschedule_on_drag INTEGER DEFAULT 0
             )
         ''')
         
+        # 旧版 app.py 建的库缺少部分偏好列，补齐
+        self._ensure_columns(cursor, 'user_preferences', {
+            'do_not_disturb_start': "TEXT DEFAULT '13:00'",
+            'do_not_disturb_end': "TEXT DEFAULT '14:00'",
+            'sleep_reminder_time': "TEXT DEFAULT '22:00'",
+            'auto_reschedule_on_drag': 'INTEGER DEFAULT 0'
+        })
+        
         # 插入默认偏好
         cursor.execute('SELECT COUNT(*) FROM user_preferences')
         if cursor.fetchone()[0] == 0:
@@ -79,168 +791,661 @@ class Database:
             )
         ''')
         
+        self._migrate(cursor)
+        
         conn.commit()
         conn.close()
     
+    def _migrate(self, cursor):
+        """按 user_version 执行尚未应用的迁移"""
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        for target, _description, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f'PRAGMA user_version = {int(target)}')
+    
+    def explain(self, name: str, params: Iterable = ()) -> List[str]:
+        """返回某条语句的 EXPLAIN QUERY PLAN 明细"""
+        conn = self.get_connection()
+        try:
+            rows = conn.execute('EXPLAIN QUERY PLAN ' + STATEMENTS[name], tuple(params)).fetchall()
+            return [row[3] for row in rows]
+        finally:
+            conn.close()
+    
+    def full_scan_queries(self) -> Dict[str, List[str]]:
+        """找出退化为全表扫描的热点查询 {语句名: 查询计划}"""
+        offenders = {}
+        for name, params in HOT_QUERIES.items():
+            plan = self.explain(name, params)
+            if any(step.startswith('SCAN ') and 'INDEX' not in step for step in plan):
+                offenders[name] = plan
+        return offenders
+    
+    def _ensure_columns(self, cursor, table: str, columns: Dict[str, str]):
+        """为已存在的表补充缺失的列"""
+        existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+        for column, definition in columns.items():
+            if column not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    
     # ========== 任务管理 ==========
     
     def add_task(self, content: str, category: str = '工作', 
                  priority: str = 'medium', estimated_duration: int = 60,
-                 deadline: str = None) -> int:
-        """添加新任务"""
+                 deadline: str = None, enrichment_status: str = None) -> int:
+        """添加新任务（enrichment_status='pending' 表示字段是临时解析，等待后台 AI 增强）"""
+        cursor = self._execute('tasks.insert', (
+            content, category, priority, duration_to_minutes(estimated_duration),
+            normalize_deadline(deadline), datetime.now().isoformat(), enrichment_status
+        ))
+        return cursor.lastrowid
+    
+    def add_tasks_bulk(self, tasks: List[Dict]) -> List[int]:
+        """
+        批量添加任务：一个事务内 executemany
+        
+        Args:
+            tasks: [{'content', 'category', 'priority', 'estimated_duration', 'deadline'}]
+        
+        Returns:
+            新任务 id 列表（与输入顺序一致）
+        """
+        if not tasks:
+            return []
+        now = datetime.now().isoformat()
+        rows = [(
+            t['content'],
+            t.get('category', '工作'),
+            t.get('priority', 'medium'),
+            duration_to_minutes(t.get('estimated_duration')),
+            normalize_deadline(t.get('deadline')),
+            now,
+            t.get('enrichment_status')
+        ) for t in tasks]
+        
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO tasks (content, category, priority, estimated_duration, deadline)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (content, category, priority, estimated_duration, deadline))
-        task_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return task_id
+        try:
+            started = time.perf_counter()
+            with conn:
+                conn.executemany(STATEMENTS['tasks.insert'], rows)
+                # 同一写事务内自增 id 连续
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            self._record('tasks.insert_bulk', started)
+        finally:
+            conn.close()
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def get_task(self, task_id: int) -> Optional[Task]:
+        """获取单个任务"""
+        row = self._fetchone('tasks.get', (task_id,))
+        return Task.from_row(row) if row else None
     
-    def get_all_tasks(self, status: str = None) -> List[Dict]:
+    def get_all_tasks(self, status: str = None) -> List[Task]:
         """获取所有任务"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
         if status:
-            cursor.execute('SELECT * FROM tasks WHERE status = ? ORDER BY priority DESC, created_at DESC', (status,))
+            rows = self._fetchall('tasks.by_status', (status,))
         else:
-            cursor.execute('SELECT * FROM tasks ORDER BY priority DESC, created_at DESC')
+            rows = self._fetchall('tasks.all')
+        return [Task.from_row(row) for row in rows]
+    
+    def get_tasks_page(self, after: int = 0, limit: int = 100) -> List[Task]:
+        """按 id 键集分页：返回 id > after 的前 limit 个任务（不用 OFFSET，翻到多深都一样快）"""
+        return [Task.from_row(row) for row in self._fetchall('tasks.page', (after, limit))]
+    
+    def iter_tasks(self, after: int = 0, batch_size: int = 500) -> Iterator[Task]:
+        """
+        逐个产出 id > after 的任务
         
-        columns = [col[0] for col in cursor.description]
-        tasks = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        conn.close()
-        return tasks
+        内部按 batch_size 键集分页，每批查完立刻归还连接：
+        内存占用只与 batch_size 有关，消费方再慢也不会长期占着连接。
+        """
+        while True:
+            page = self.get_tasks_page(after, batch_size)
+            yield from page
+            if len(page) < batch_size:
+                return
+            after = page[-1].id
+    
+    def get_pending_unscheduled_tasks(self) -> List[Task]:
+        """获取待排期任务（按优先级、截止日期排序）"""
+        return [Task.from_row(row) for row in self._fetchall('tasks.pending_unscheduled')]
+    
+    def iter_unscheduled_tasks(self, batch_size: int = 200,
+                               max_duration: Callable[[], int] = None) -> Iterator[Task]:
+        """
+        按贪心顺序（优先级、截止时间）逐个产出待排期任务
+        
+        走 idx_tasks_unscheduled_order 索引，逐个优先级按 (截止时间, id) 键集分页，不排序；
+        每批查完立刻归还连接。消费方提前停止时后面的任务不会被读取，已排期的任务从不出现在结果里。
+        
+        Args:
+            batch_size: 每页行数
+            max_duration: 每页查询前调用，返回当前还放得下的最长时长（分钟），
+                          更长的任务在索引里直接跳过；上限只能越来越小（如 FreeIntervals.longest）
+        """
+        for rank in (1, 2, 3):
+            deadline, after = '', 0
+            while True:
+                limit = max_duration() if max_duration else MAX_DURATION
+                rows = self._fetchall('tasks.unscheduled_page',
+                                      (rank, deadline, deadline, after, limit, batch_size))
+                yield from (Task.from_row(row) for row in rows)
+                if len(rows) < batch_size:
+                    break
+                deadline, after = rows[-1]['deadline_key'], rows[-1]['id']
+    
+    def get_top_pending_tasks(self, limit: int = 5) -> List[Task]:
+        """获取若干条待办任务（对话上下文用）"""
+        return [Task.from_row(row) for row in self._fetchall('tasks.pending_top', (limit,))]
+    
+    def get_high_priority_pending_tasks(self, limit: int = 3) -> List[Task]:
+        """获取高优先级待办任务"""
+        return [Task.from_row(row) for row in self._fetchall('tasks.pending_high', (limit,))]
+    
+    def get_tasks_starting_between(self, start: str, end: str) -> List[Task]:
+        """获取计划开始时间落在 [start, end] 内的待办任务（只含 id/content/scheduled_start）"""
+        rows = self._fetchall('tasks.starting_between', (start, end))
+        return [Task.from_row(row) for row in rows]
+    
+    def get_tasks_scheduled_between(self, start: str, end: str) -> List[Task]:
+        """获取计划开始时间落在 [start, end) 内的待办任务（按开始时间排序）"""
+        rows = self._fetchall('tasks.scheduled_between', (start, end))
+        return [Task.from_row(row) for row in rows]
+    
+    def _task_stat(self, stat: str, bucket: str) -> int:
+        """读 task_stats 中的一个计数，没有该桶视为 0"""
+        row = self._fetchone('stats.get', (stat, bucket))
+        return row[0] if row else 0
+    
+    def count_tasks(self, status: str = 'pending') -> int:
+        """按状态统计任务数（task_stats 单行查询）"""
+        return self._task_stat('status', status)
+    
+    def count_completed_today(self) -> int:
+        """统计今天完成的任务数（task_stats 单行查询）"""
+        return self._task_stat('completed_day', datetime.now().date().isoformat())
+    
+    def recount_task_stats(self) -> Dict[str, int]:
+        """
+        直接 COUNT(*) 统计，用于与 task_stats 对账
+    
+        Returns:
+            {'pending': n, 'completed_today': n}
+        """
+        today = datetime.now().date()
+        tomorrow = today + timedelta(days=1)
+        return {
+            'pending': self._fetchone('tasks.count_by_status', ('pending',))[0],
+            'completed_today': self._fetchone('tasks.count_completed_between',
+                                              (today.isoformat(), tomorrow.isoformat()))[0],
+        }
     
     def update_task(self, task_id: int, **kwargs):
         """更新任务"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        fields, values = self._task_changes(kwargs)
+        if not fields:
+            return
+        values.append(task_id)
+        self._execute('tasks.update', values, sql=self._task_update_sql(fields))
+    
+    def update_tasks_bulk(self, updates: List[Dict]) -> int:
+        """
+        批量更新任务：一个事务、按修改列分组 executemany
         
-        allowed_fields = ['content', 'category', 'priority', 'estimated_duration', 
-                         'deadline', 'scheduled_start', 'scheduled_end', 'status', 'completed_at']
-        updates = []
-        values = []
+        Args:
+            updates: [{'id': 1, 'scheduled_start': ..., ...}]，未知字段忽略
+        
+        Returns:
+            实际提交的更新条数
+        """
+        groups = {}
+        for item in updates:
+            fields, values = self._task_changes(item)
+            if not fields:
+                continue
+            values.append(item['id'])
+            groups.setdefault(fields, []).append(tuple(values))
+        if not groups:
+            return 0
         
-        for key, value in kwargs.items():
-            if key in allowed_fields:
-                updates.append(f"{key} = ?")
-                values.append(value)
+        conn = self.get_connection()
+        try:
+            started = time.perf_counter()
+            with conn:
+                for fields, rows in groups.items():
+                    conn.executemany(self._task_update_sql(fields), rows)
+            self._record('tasks.update_bulk', started)
+        finally:
+            conn.close()
+        return sum(len(rows) for rows in groups.values())
+    
+    def update_task_schedules(self, schedules: List[Dict]) -> int:
+        """在一个事务中写入多条排期结果 [{'id', 'scheduled_start', 'scheduled_end'}]"""
+        return self.update_tasks_bulk([{
+            'id': item['id'],
+            'scheduled_start': item['scheduled_start'],
+            'scheduled_end': item['scheduled_end']
+        } for item in schedules])
+    
+    def apply_task_enrichment(self, task: Task, changes: Dict) -> bool:
+        """
+        把后台 AI 解析的结果写回仍在等待增强的任务
         
-        if updates:
-            values.append(task_id)
-            query = f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, values)
-            conn.commit()
+        只有 content / category / priority / estimated_duration / deadline 仍等于插入时的临时值才覆盖；
+        用户在此期间改过的任务不动，状态记为 skipped。
         
-        conn.close()
+        Args:
+            task: 插入时的任务（临时值）
+            changes: 解析结果，键同上
+        
+        Returns:
+            是否写回
+        """
+        values = [changes.get(key, getattr(task, key)) for key in ENRICHED_FIELDS]
+        values[3] = duration_to_minutes(values[3])
+        values[4] = normalize_deadline(values[4])
+        cursor = self._execute('tasks.enrich', (
+            *values, task.id, *(getattr(task, key) for key in ENRICHED_FIELDS)
+        ))
+        if cursor.rowcount:
+            return True
+        self.set_enrichment_status(task.id, 'skipped')
+        return False
+    
+    def set_enrichment_status(self, task_id: int, status: str):
+        """结束等待中的增强（failed / skipped），已结束的不变"""
+        self._execute('tasks.set_enrichment_status', (status, task_id))
+    
+    def get_tasks_pending_enrichment(self, limit: int = 100) -> List[Task]:
+        """等待 AI 增强的任务（按 id 顺序）"""
+        return [Task.from_row(row) for row in self._fetchall('tasks.enrichment_pending', (limit,))]
+    
+    def _task_changes(self, changes: Dict) -> tuple:
+        """按固定列顺序取出可更新字段，返回 (列名元组, 值列表)"""
+        fields = tuple(key for key in TASK_UPDATABLE_FIELDS if key in changes)
+        values = []
+        for key in fields:
+            value = changes[key]
+            if key == 'estimated_duration' and value is not None:
+                value = duration_to_minutes(value)
+            elif key == 'deadline':
+                value = normalize_deadline(value)
+            values.append(value)
+        return fields, values
+    
+    def _task_update_sql(self, fields: tuple) -> str:
+        return f"UPDATE tasks SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?"
     
     def delete_task(self, task_id: int):
         """删除任务"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-        conn.commit()
-        conn.close()
+        self._execute('tasks.delete', (task_id,))
     
     def complete_task(self, task_id: int):
         """完成任务"""
-        self.update_task(task_id, status='completed', completed_at=datetime.now().isoformat())
+        self._execute('tasks.complete', (datetime.now().isoformat(), task_id))
     
     # ========== 固定日程管理 ==========
     
     def add_fixed_schedule(self, title: str, day_of_week: int, 
                           start_time: str, end_time: str,
                           recurrence: str = 'weekly', location: str = None,
-                          source: str = 'manual') -> int:
-        """添加固定日程"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO fixed_schedules 
-            (title, day_of_week, start_time, end_time, recurrence, location, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (title, day_of_week, start_time, end_time, recurrence, location, source))
-        schedule_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
-        return schedule_id
+                          source: str = 'manual', start_date: str = None,
+                          end_date: str = None) -> int:
+        """
+        添加固定日程
+        
+        Args:
+            day_of_week: 0=周日 … 6=周六（见 recurrence.day_of_week）
+            recurrence: 'weekly' / 'biweekly' / 'once'
+            start_date / end_date: 有效期（含），如学期起止；biweekly 以 start_date 所在周为单周
+        """
+        cursor = self._execute('fixed.insert', (
+            title, day_of_week, start_time, end_time, recurrence, location, source,
+            start_date, end_date
+        ))
+        return cursor.lastrowid
     
-    def get_all_fixed_schedules(self) -> List[Dict]:
+    def get_all_fixed_schedules(self) -> List[FixedSchedule]:
         """获取所有固定日程"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM fixed_schedules ORDER BY day_of_week, start_time')
-        
-        columns = [col[0] for col in cursor.description]
-        schedules = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        conn.close()
-        return schedules
+        return [FixedSchedule.from_row(row) for row in self._fetchall('fixed.all')]
+    
+    def get_fixed_schedules_for_day(self, day_of_week: int) -> List[FixedSchedule]:
+        """获取某个星期几（0=周日）登记的固定日程，不考虑重复规则；排期请用 get_fixed_occurrences"""
+        rows = self._fetchall('fixed.by_day', (day_of_week,))
+        return [FixedSchedule.from_row(row) for row in rows]
     
     def delete_fixed_schedule(self, schedule_id: int):
         """删除固定日程"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM fixed_schedules WHERE id = ?', (schedule_id,))
-        conn.commit()
-        conn.close()
+        self._execute('fixed.delete', (schedule_id,))
     
-    # ========== 用户偏好 ==========
+    def add_fixed_schedule_exception(self, schedule_id: int, date: str):
+        """某一天不上（放假、调课）"""
+        self._execute('fixed.exception_insert', (schedule_id, to_date(date).isoformat()))
+    
+    def delete_fixed_schedule_exception(self, schedule_id: int, date: str):
+        """取消例外日期"""
+        self._execute('fixed.exception_delete', (schedule_id, to_date(date).isoformat()))
+    
+    def get_fixed_occurrences(self, start_date: str, end_date: str) -> List[FixedOccurrence]:
+        """
+        [start_date, end_date) 内固定日程的具体发生，按日期、开始时间排序
+        
+        展开结果缓存在 fixed_occurrences 表：已展开过的日期只是一次按日期的范围查询，
+        只有没展开过的日期才读取固定日程按 recurrence 规则计算。
+        """
+        start, end = to_date(start_date), to_date(end_date)
+        params = (start.isoformat(), end.isoformat())
+        if len(self._fetchall('occ.days', params)) < (end - start).days:
+            self._expand_occurrences(start, end)
+        rows = self._fetchall('occ.range', params)
+        return [FixedOccurrence.from_row(row) for row in rows]
     
-    def get_user_preferences(self) -> Dict:
-        """获取用户偏好"""
+    def get_fixed_occurrences_for_date(self, date) -> List[FixedOccurrence]:
+        """某一天的固定日程（date 可以是 date 或 'YYYY-MM-DD'）"""
+        day = to_date(date)
+        return self.get_fixed_occurrences(day.isoformat(), (day + timedelta(days=1)).isoformat())
+    
+    def _expand_occurrences(self, start, end):
+        """展开 [start, end) 中尚未缓存的日期并写入缓存表"""
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM user_preferences WHERE id = 1')
-        columns = [col[0] for col in cursor.description]
-        prefs = dict(zip(columns, cursor.fetchone()))
-        conn.close()
-        return prefs
+        try:
+            started = time.perf_counter()
+            # 读日程和写缓存放在同一个写事务里：期间有人修改日程，触发器的清空不会被旧结果覆盖
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                schedules = [FixedSchedule.from_row(row) for row in conn.execute(STATEMENTS['fixed.all'])]
+                exceptions = {}
+                for schedule_id, day in conn.execute(STATEMENTS['fixed.exceptions']):
+                    exceptions.setdefault(schedule_id, set()).add(day)
+                done = {row[0] for row in conn.execute(STATEMENTS['occ.days'],
+                                                       (start.isoformat(), end.isoformat()))}
+                
+                missing = []
+                day = start
+                while day < end:
+                    if day.isoformat() not in done:
+                        missing.append(day)
+                    day += timedelta(days=1)
+                
+                for day in missing:
+                    conn.executemany(STATEMENTS['occ.insert'],
+                                     expand(schedules, exceptions, day, day + timedelta(days=1)))
+                conn.executemany(STATEMENTS['occ.mark_day'], [(day.isoformat(),) for day in missing])
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            self._record('occ.expand', started)
+        finally:
+            conn.close()
     
-    def update_user_preferences(self, **kwargs):
-        """更新用户偏好"""
+    # ========== 增量同步 ==========
+    
+    def get_sync_version(self) -> int:
+        """当前全库版本号"""
+        return self._fetchone('sync.version')[0]
+    
+    def get_collection_version(self, collection: str) -> str:
+        """
+        集合的校验值，任一行插入/修改/删除都会改变它
+        
+        Args:
+            collection: 'tasks' / 'fixed_schedules' / 'preferences'
+        """
+        table, statement = COLLECTIONS[collection]
+        latest = self._fetchone(statement)[0] or 0
+        deleted = self._fetchone('sync.last_deleted', (table,))[0] or 0
+        return f'{collection}-{latest}-{deleted}'
+    
+    def get_task_changes(self, since: int) -> Dict:
+        """
+        获取 since 版本之后变化的任务
+        
+        Returns:
+            {'version': int, 'tasks': List[Task], 'deleted': List[int], 'full': bool}；
+            since 之后的删除墓碑已被清理时 full=True，tasks 为全部任务，客户端应整体替换
+        """
+        # 先读版本号再读数据：并发写入最多导致下次重复返回同一行，不会漏
+        version = self.get_sync_version()
+        if self._tombstones_pruned_after(since):
+            return {'version': version, 'tasks': self.get_all_tasks(), 'deleted': [], 'full': True}
+        tasks = [Task.from_row(row) for row in self._fetchall('tasks.changed_since', (since,))]
+        deleted = [row[0] for row in self._fetchall('sync.deleted_since', (since, 'tasks'))]
+        return {'version': version, 'tasks': tasks, 'deleted': deleted, 'full': False}
+    
+    def get_fixed_schedule_changes(self, since: int) -> Dict:
+        """获取 since 版本之后变化的固定日程，结构同 get_task_changes"""
+        version = self.get_sync_version()
+        if self._tombstones_pruned_after(since):
+            return {'version': version, 'schedules': self.get_all_fixed_schedules(),
+                    'deleted': [], 'full': True}
+        rows = self._fetchall('fixed.changed_since', (since,))
+        deleted = [row[0] for row in self._fetchall('sync.deleted_since', (since, 'fixed_schedules'))]
+        return {
+            'version': version,
+            'schedules': [FixedSchedule.from_row(row) for row in rows],
+            'deleted': deleted,
+            'full': False
+        }
+    
+    def _tombstones_pruned_after(self, since: int) -> bool:
+        """since 之后的删除记录是否已被清理（是则增量不可靠，需返回全量）"""
+        return since < self._fetchone('sync.pruned_through')[0]
+    
+    def prune_tombstones(self, older_than: str) -> int:
+        """
+        清理 older_than（ISO 时间）之前的删除墓碑
+        
+        游标早于清理水位的客户端拿不到这些删除，get_task_changes / get_fixed_schedule_changes
+        会对它们返回全量（full=True）。
+        
+        Returns:
+            清理的条数
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
+        try:
+            started = time.perf_counter()
+            with conn:
+                conn.execute(STATEMENTS['sync.mark_pruned'], (older_than,))
+                removed = conn.execute(STATEMENTS['sync.prune_tombstones']).rowcount
+            self._record('sync.prune_tombstones', started)
+            return removed
+        finally:
+            conn.close()
+    
+    # ========== 用户偏好 ==========
+    
+    def get_user_preferences(self) -> UserPreferences:
+        """
+        获取用户偏好（读穿透缓存）
         
-        updates = []
-        values = []
-        for key, value in kwargs.items():
-            updates.append(f"{key} = ?")
-            values.append(value)
+        本进程的写入会直接失效缓存；其他进程的写入通过 row_version 发现，
+        每 prefs_revalidate_seconds 秒最多比对一次，期间的读取不访问 SQLite。
+        返回副本，调用方修改不会污染缓存。
+        """
+        now = time.monotonic()
+        with self._prefs_lock:
+            cached = self._prefs_cache
+            if cached and now - cached[1] < self.prefs_revalidate_seconds:
+                self._prefs_stats['hits'] += 1
+                return replace(cached[0])
         
-        if updates:
-            values.append(1)
-            query = f"UPDATE user_preferences SET {', '.join(updates)} WHERE id = ?"
-            cursor.execute(query, values)
-            conn.commit()
+        if cached:
+            row = self._fetchone('prefs.version')
+            if row and row[0] == cached[0].row_version:
+                with self._prefs_lock:
+                    if self._prefs_cache is cached:
+                        self._prefs_cache = (cached[0], now)
+                    self._prefs_stats['revalidations'] += 1
+                return replace(cached[0])
         
-        conn.close()
+        row = self._fetchone('prefs.get')
+        prefs = UserPreferences.from_row(row) if row else UserPreferences()
+        with self._prefs_lock:
+            self._prefs_cache = (prefs, now) if row else None
+            self._prefs_stats['loads'] += 1
+        return replace(prefs)
+    
+    def invalidate_user_preferences(self):
+        """丢弃偏好缓存，下次读取重新加载"""
+        with self._prefs_lock:
+            self._prefs_cache = None
+    
+    def preferences_cache_stats(self) -> Dict:
+        """偏好缓存命中统计"""
+        with self._prefs_lock:
+            return dict(self._prefs_stats, cached=self._prefs_cache is not None)
+    
+    def update_user_preferences(self, **kwargs):
+        """更新用户偏好（同时失效偏好缓存）；值为 None 的字段视为未提供，保持原值"""
+        updates = [key for key in PREFERENCE_FIELDS if kwargs.get(key) is not None]
+        if not updates:
+            return
+        
+        values = [kwargs[key] for key in updates]
+        values.append(1)
+        query = f"UPDATE user_preferences SET {', '.join(f'{key} = ?' for key in updates)} WHERE id = ?"
+        try:
+            self._execute('prefs.update', values, sql=query)
+        finally:
+            self.invalidate_user_preferences()
     
     # ========== 对话历史 ==========
     
-    def add_chat_message(self, role: str, content: str):
+    def add_chat_message(self, role: str, content: str, timestamp: str = None):
         """添加对话消息"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO chat_history (role, content)
-            VALUES (?, ?)
-        ''', (role, content))
-        conn.commit()
-        conn.close()
+        self._execute('chat.insert', (role, content, timestamp or datetime.now().isoformat()))
     
-    def get_chat_history(self, limit: int = 50) -> List[Dict]:
+    def get_chat_history(self, limit: int = 50) -> List[ChatMessage]:
         """获取对话历史"""
+        messages = [ChatMessage.from_row(row) for row in self._fetchall('chat.recent', (limit,))]
+        return list(reversed(messages))  # 反转为时间正序
+    
+    def get_chat_page(self, before: str = None, before_id: int = None,
+                      limit: int = 50) -> List[ChatMessage]:
+        """
+        键集分页取游标 (before, before_id) 之前的 limit 条消息，按时间正序返回
+        
+        before 为空时从最新一条开始；只给 before 时取该时间戳之前的消息。
+        下一页用本页第一条的 (timestamp, id) 作为游标。
+        """
+        if before is None:
+            before = '\uffff'  # 大于任何 ISO 时间戳
+        if before_id is None:
+            before_id = -1
+        rows = self._fetchall('chat.page_before', (before, before_id, limit))
+        return [ChatMessage.from_row(row) for row in reversed(rows)]
+    
+    def iter_chat_history(self, before: str = None, before_id: int = None,
+                          batch_size: int = 500) -> Iterator[ChatMessage]:
+        """从新到旧逐条产出消息（键集分页，每批归还连接）"""
+        while True:
+            page = self.get_chat_page(before, before_id, batch_size)
+            yield from reversed(page)
+            if len(page) < batch_size:
+                return
+            before, before_id = page[0].timestamp, page[0].id
+    
+    def archive_chat_history(self, keep: int = 1000, batch_size: int = 500) -> int:
+        """
+        把热窗口之外的旧消息分批压缩搬到 chat_archive
+        
+        chat_history 只保留最近 keep 条（时间戳相同的消息一起保留），
+        每批一个短事务，不会长时间占住写锁。
+        
+        Returns:
+            归档的消息条数
+        """
+        row = self._fetchone('chat.cutoff', (max(keep - 1, 0),))
+        if not row:
+            return 0
+        cutoff = row[0]
+        
+        archived = 0
+        while True:
+            conn = self.get_connection()
+            try:
+                started = time.perf_counter()
+                with conn:
+                    rows = conn.execute(STATEMENTS['chat.older_than'], (cutoff, batch_size)).fetchall()
+                    if not rows:
+                        break
+                    messages = [ChatMessage.from_row(r).to_dict() for r in rows]
+                    payload = zlib.compress(json.dumps(messages, ensure_ascii=False).encode('utf-8'))
+                    conn.execute(STATEMENTS['chat.archive_insert'],
+                                 (messages[0]['timestamp'], messages[-1]['timestamp'],
+                                  len(messages), payload))
+                    conn.executemany(STATEMENTS['chat.delete'], [(m['id'],) for m in messages])
+                self._record('chat.archive_batch', started)
+            finally:
+                conn.close()
+            archived += len(rows)
+        return archived
+    
+    def get_archived_chat_messages(self) -> List[ChatMessage]:
+        """解压全部归档消息（时间正序），用于导出"""
+        messages = []
+        for row in self._fetchall('chat.archive_all'):
+            messages.extend(ChatMessage(**m) for m in json.loads(zlib.decompress(row[0])))
+        return messages
+    
+    # ========== LLM 响应缓存 ==========
+    
+    def get_llm_response(self, key: str, created_after: str) -> Optional[sqlite3.Row]:
+        """缓存的响应 (response, created_at)；不存在或早于 created_after（已过期）时返回 None"""
+        return self._fetchone('llm_cache.get', (key, created_after))
+    
+    def put_llm_response(self, key: str, response: str, created_at: str):
+        """写入（覆盖）一条缓存"""
+        self._execute('llm_cache.put', (key, response, created_at, created_at))
+    
+    def touch_llm_response(self, key: str, used_at: str):
+        """记录最近使用时间（按它淘汰超量的条目）"""
+        self._execute('llm_cache.touch', (used_at, key))
+    
+    def prune_llm_cache(self, max_entries: int, created_after: str) -> int:
+        """
+        删除过期（早于 created_after）的缓存，再只保留最近使用的 max_entries 条
+        
+        Returns:
+            删除的条数
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM chat_history 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        ''', (limit,))
+        try:
+            started = time.perf_counter()
+            with conn:
+                removed = conn.execute(STATEMENTS['llm_cache.delete_expired'], (created_after,)).rowcount
+                removed += conn.execute(STATEMENTS['llm_cache.trim'], (max_entries,)).rowcount
+            self._record('llm_cache.prune', started)
+            return removed
+        finally:
+            conn.close()
+    
+    def vacuum(self, pages: int = 1000) -> str:
+        """
+        回收空闲页
         
-        columns = [col[0] for col in cursor.description]
-        messages = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        conn.close()
-        return list(reversed(messages))  # 反转为时间正序
\ No newline at end of file
+        首次运行时把库转换为 auto_vacuum=INCREMENTAL（需要一次完整 VACUUM），
+        之后每次只做 incremental_vacuum(pages)，再截断 WAL 文件。
+        
+        Returns:
+            'full' 或 'incremental'
+        """
+        conn = self.get_connection()
+        try:
+            started = time.perf_counter()
+            if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+                conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                conn.execute('VACUUM')
+                mode = 'full'
+            else:
+                conn.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+                mode = 'incremental'
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+            self._record(f'maintenance.vacuum_{mode}', started)
+            return mode
+        finally:
+            conn.close()
@@ -0,0 +1,244 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from operator import attrgetter, itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from intervals import FreeIntervals
+from models import duration_to_minutes
+from optimizer import LocalOptimizer, PRIORITY_WEIGHTS
+
+
+# Problem 读取的任务字段（顺序与 __init__ 中的解包一致）
+TASK_FIELDS = ('id', 'estimated_duration', 'priority', 'category', 'deadline')
+
+
+class Problem:
+    """
+    预处理好的排期问题
+
+    任务的时长、优先级权重、分类、截止时间只在这里解析一次，存成按任务下标对齐的列表；
+    时间统一为相对 day 0 点的分钟数（多日排期时可以超过 1440）。各策略都只读这些列表，
+    不再各自解析 '30m' / '2h'、比较截止时间字符串。
+    """
+
+    def __init__(self, tasks: List[Dict], busy: Iterable[Tuple[int, int]],
+                 work_start: int, work_end: int, day: str = None,
+                 break_minutes: int = 0, earliest: Optional[int] = None):
+        """
+        Args:
+            tasks: 任务字典（须包含 TASK_FIELDS 中的键）或 models.Task 列表
+            busy: 已占用时段（分钟）
+            work_start / work_end: 可排期窗口（分钟）
+            day: 分钟数的基准日期 YYYY-MM-DD，默认今天
+            break_minutes: 休息时长（局部搜索用）
+            earliest: 不早于这个分钟数开始（例如从现在起排），默认 work_start
+        """
+        self.tasks = tasks
+        self.day = day or datetime.now().strftime('%Y-%m-%d')
+        self.base = datetime.strptime(self.day, '%Y-%m-%d')
+        self.work_start = work_start
+        self.work_end = work_end
+        self.earliest = work_start if earliest is None else max(earliest, work_start)
+        self.break_minutes = break_minutes
+        self.busy = sorted(busy)
+
+        # 任务可以是字典，也可以是 models.Task（省去整表 to_dict 的开销）；
+        # 截止时间、时长的取值重复很多，同一个值只解析一次
+        getter = itemgetter if tasks and isinstance(tasks[0], dict) else attrgetter
+        rows = list(map(getter(*TASK_FIELDS), tasks))
+        durations, deadlines = {}, {}
+        for _, duration, _, _, deadline in rows:
+            if duration not in durations:
+                durations[duration] = max(duration_to_minutes(duration), 0)
+            if deadline not in deadlines:
+                deadlines[deadline] = self._deadline_minutes(deadline)
+
+        default_weight = PRIORITY_WEIGHTS['medium']
+        self.ids = [row[0] for row in rows]
+        self.durations = [durations[row[1]] for row in rows]
+        self.weights = [PRIORITY_WEIGHTS.get(row[2], default_weight) for row in rows]
+        self.categories = [row[3] for row in rows]
+        self.deadlines = [deadlines[row[4]] for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def free_intervals(self) -> FreeIntervals:
+        """新的空闲时段索引（窗口扣掉已占用时段和 earliest 之前的部分）"""
+        free = FreeIntervals(self.work_start, self.work_end, self.busy)
+        free.reserve(self.work_start, self.earliest)
+        return free
+
+    def deadline_key(self, i: int) -> float:
+        """排序用的截止时间，没有截止时间的排最后"""
+        return self.deadlines[i] if self.deadlines[i] is not None else float('inf')
+
+    # ========== 结果格式 ==========
+
+    def iso(self, minutes: int) -> str:
+        """分钟数 -> ISO 时间（相对 day 0 点，可以跨天）"""
+        return (self.base + timedelta(minutes=minutes)).strftime('%Y-%m-%dT%H:%M:%S')
+
+    def slot(self, i: int, start: int) -> Dict:
+        """{'id', 'scheduled_start', 'scheduled_end'}（ISO 时间）"""
+        return {
+            'id': self.ids[i],
+            'scheduled_start': self.iso(start),
+            'scheduled_end': self.iso(start + self.durations[i])
+        }
+
+    def _deadline_minutes(self, deadline: Optional[str]) -> Optional[int]:
+        """截止时间换算为相对 day 0 点的分钟数；只有日期的视为当天结束"""
+        if not deadline:
+            return None
+        try:
+            value = datetime.fromisoformat(deadline).replace(tzinfo=None)
+        except ValueError:
+            return None
+        if len(deadline) <= 10:
+            value += timedelta(days=1)
+        return int((value - self.base).total_seconds() // 60)
+
+
+@dataclass
+class Solution:
+    """策略的输出：placements 为 [(任务下标, 开始分钟)]，按放置顺序；unscheduled 为放不下的下标"""
+    placements: List[Tuple[int, int]] = field(default_factory=list)
+    unscheduled: List[int] = field(default_factory=list)
+    stats: Dict = field(default_factory=dict)
+
+
+# ========== 策略 ==========
+
+class Strategy:
+    """
+    排期策略：给出放置顺序，再按顺序放进空档
+
+    sequential 为 True 时每个任务不早于上一个任务结束（保持顺序，不回填前面的空档），
+    否则每个任务都放进最早放得下的空档（earliest 之前已在索引里标记为占用）。
+    """
+    name = None
+    sequential = True
+
+    def order(self, problem: Problem) -> List[int]:
+        raise NotImplementedError
+
+    def solve(self, problem: Problem) -> Solution:
+        free = problem.free_intervals()
+        solution = Solution()
+        cursor = problem.work_start
+        for i in self.order(problem):
+            duration = problem.durations[i]
+            start = free.find(cursor, duration)
+            if start is None:
+                solution.unscheduled.append(i)
+                continue
+            free.reserve(start, start + duration)
+            solution.placements.append((i, start))
+            if self.sequential:
+                cursor = start + duration
+        return solution
+
+
+class GreedyStrategy(Strategy):
+    """优先级高在前，其次截止时间早在前，依次往后排"""
+    name = 'greedy'
+
+    def order(self, problem: Problem) -> List[int]:
+        return sorted(range(len(problem)),
+                      key=lambda i: (-problem.weights[i], problem.deadline_key(i)))
+
+
+class EDFStrategy(Strategy):
+    """最早截止时间优先（同截止时间按优先级），每个任务放进最早的空档"""
+    name = 'edf'
+    sequential = False
+
+    def order(self, problem: Problem) -> List[int]:
+        return sorted(range(len(problem)),
+                      key=lambda i: (problem.deadline_key(i), -problem.weights[i]))
+
+
+class CategoryBatchStrategy(Strategy):
+    """同分类的任务排在一起减少切换：分类按其中最高优先级、最早截止时间排序，组内同贪心"""
+    name = 'batch'
+
+    def order(self, problem: Problem) -> List[int]:
+        groups = {}
+        for i in GreedyStrategy().order(problem):
+            groups.setdefault(problem.categories[i], []).append(i)
+        # 组内已按贪心顺序排好，第一个任务就是该组的代表
+        return [i for group in sorted(groups.values(), key=lambda g: (
+            -problem.weights[g[0]], min(problem.deadline_key(i) for i in g)
+        )) for i in group]
+
+
+class LocalSearchStrategy(Strategy):
+    """贪心顺序作初始解，在 budget_ms 内局部搜索，见 optimizer.LocalOptimizer"""
+    name = 'local'
+
+    def __init__(self, budget_ms: float = 150, seed: int = 0):
+        self.budget_ms = budget_ms
+        self.seed = seed
+
+    def solve(self, problem: Problem) -> Solution:
+        result = LocalOptimizer(problem, seed=self.seed).optimize(
+            self.budget_ms, initial_order=GreedyStrategy().order(problem))
+        return Solution(result['placements'], result['unscheduled'],
+                        {'cost': result['cost'], 'iterations': result['iterations']})
+
+
+STRATEGIES = {cls.name: cls for cls in (GreedyStrategy, EDFStrategy,
+                                        CategoryBatchStrategy, LocalSearchStrategy)}
+
+
+def solve(problem: Problem, strategy: str = 'greedy', **options) -> Solution:
+    """
+    用指定策略求解
+
+    Args:
+        strategy: 'greedy' / 'edf' / 'batch' / 'local'
+        options: 传给策略的参数（如 local 的 budget_ms、seed）
+
+    Raises:
+        ValueError: 未知策略
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'未知排期策略: {strategy}（可选 {", ".join(STRATEGIES)}）')
+    return STRATEGIES[strategy](**options).solve(problem)
+
+
+def place_in_order(tasks: Iterable, free: FreeIntervals,
+                   cursor: int) -> Iterator[Tuple[object, int, int]]:
+    """
+    流式的贪心放置：tasks 已经按放置顺序排好（例如数据库按优先级、截止时间的索引顺序），
+    逐个读取、依次往后放，与 GreedyStrategy 的结果一致
+
+    顺序放置不会回填 cursor 之前的空档，所以这部分直接在 free 中标记为占用：
+    此后 free.longest() 就是还能放下的最长任务，比它长的任务 find 直接返回 None。
+    tasks 可以是惰性迭代器（可以借 free.longest() 在数据源里过滤掉放不下的任务）；
+    窗口排满后立即停止读取，后面的任务不会被加载，也不需要整体排序。
+
+    Args:
+        tasks: models.Task（或带 estimated_duration 属性的对象）
+        free: 空闲时段索引，放置后会被标记为占用
+        cursor: 从这个分钟数开始往后排
+
+    Yields:
+        (任务, 开始分钟, 结束分钟)
+    """
+    durations = {}
+    free.reserve(free.start, cursor)
+    for task in tasks:
+        raw = task.estimated_duration
+        if raw not in durations:
+            durations[raw] = max(duration_to_minutes(raw), 0)
+        duration = durations[raw]
+        start = free.find(cursor, duration)
+        if start is None:
+            continue
+        free.reserve(free.start, start + duration)
+        cursor = start + duration
+        yield task, start, cursor
+        if not free.longest():
+            return
@@ -0,0 +1,113 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from models import Task, duration_to_minutes
+
+# 同时进行的 AI 解析数（受 LLM 连接池和限流约束，不宜太大）
+ENRICH_WORKERS = int(os.getenv('ENRICH_WORKERS', '2'))
+# 排队加在途的上限：超出的任务保持 pending，由 resume() 稍后补做
+ENRICH_QUEUE = int(os.getenv('ENRICH_QUEUE', '100'))
+
+# 解析结果里写回任务的字段：解析结果键 -> 任务列
+RESULT_FIELDS = {
+    'task': 'content',
+    'category': 'category',
+    'priority': 'priority',
+    'estimated_duration': 'estimated_duration',
+    'deadline_iso': 'deadline'
+}
+
+
+class TaskEnricher:
+    """
+    后台任务增强：任务先按临时解析插入（enrichment_status='pending'），
+    AI 解析在有界线程池里完成后写回，再通过 on_done 通知（推送 task_updated）
+
+    在途任务数有上限，队列满时 submit() 返回 False，任务留在 pending 状态，
+    由 resume()（启动时和定时任务）补交；同一个任务不会重复提交。
+    用户在增强完成前改过任务时不覆盖，状态记为 skipped。
+    """
+
+    def __init__(self, db, analyze: Callable[[str], Dict],
+                 on_done: Callable[[Task, Optional[Dict], str], None] = None,
+                 max_workers: int = ENRICH_WORKERS, max_pending: int = ENRICH_QUEUE):
+        """
+        Args:
+            analyze: 文本 -> 解析结果（同 app.analyze_task；带 'error' 键表示解析失败）
+            on_done: 完成回调 (插入时的任务, 写回的字段或 None, 状态)
+        """
+        self.db = db
+        self.analyze = analyze
+        self.on_done = on_done
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='enrich')
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._stats = {'submitted': 0, 'done': 0, 'skipped': 0, 'failed': 0, 'deferred': 0}
+
+    def submit(self, task: Task) -> bool:
+        """提交一个待增强的任务；队列已满或已在处理时返回 False"""
+        with self._lock:
+            if task.id in self._in_flight:
+                return False
+            if len(self._in_flight) >= self.max_pending:
+                self._stats['deferred'] += 1
+                return False
+            self._in_flight.add(task.id)
+            self._stats['submitted'] += 1
+        try:
+            self._executor.submit(self._run, task)
+        except RuntimeError:
+            # 线程池已关闭（进程退出中）：留在 pending，下次启动时补做
+            with self._lock:
+                self._in_flight.discard(task.id)
+            return False
+        return True
+
+    def resume(self) -> int:
+        """补交仍处于 pending 的任务（进程重启、队列满时遗留的），返回提交数"""
+        with self._lock:
+            room = self.max_pending - len(self._in_flight)
+        if room <= 0:
+            return 0
+        return sum(self.submit(task) for task in self.db.get_tasks_pending_enrichment(room))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._in_flight))
+
+    def shutdown(self, wait: bool = False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, task: Task):
+        changes, status = None, 'failed'
+        try:
+            parsed = self.analyze(task.content)
+            if 'error' in parsed:
+                self.db.set_enrichment_status(task.id, 'failed')
+            else:
+                changes = {column: parsed[key] for key, column in RESULT_FIELDS.items()
+                           if parsed.get(key) is not None}
+                if 'estimated_duration' in changes:
+                    changes['estimated_duration'] = duration_to_minutes(changes['estimated_duration'])
+                if self.db.apply_task_enrichment(task, changes):
+                    status = 'done'
+                else:
+                    changes, status = None, 'skipped'
+        except Exception as e:
+            print(f"任务 {task.id} AI 增强失败: {str(e)}")
+            changes = None
+            self.db.set_enrichment_status(task.id, 'failed')
+        finally:
+            with self._lock:
+                self._in_flight.discard(task.id)
+                self._stats[status] += 1
+            # 上面记录失败状态本身也可能抛异常，回调放在 finally 里保证总会通知
+            if self.on_done:
+                try:
+                    self.on_done(task, changes, status)
+                except Exception as e:
+                    print(f"任务 {task.id} 增强结果推送失败: {str(e)}")
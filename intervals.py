@@ -0,0 +1,149 @@
+from typing import Iterable, Optional, Tuple
+
+
+class FreeIntervals:
+    """
+    空闲时段索引：回答"after 之后第一个长度 ≥ duration 的空档从几点开始"
+
+    以分钟为单位在 [start, end) 上建线段树，每个节点记录最长空闲段 best、
+    左端连续空闲 pre、右端连续空闲 suf。查询、占用、释放都是 O(log M)
+    （M 为窗口分钟数），与已占用时段的数量无关；排期时每放下一个任务
+    调用 reserve() 增量更新，不再对占用列表反复排序和从头扫描。
+    """
+
+    def __init__(self, start: int, end: int, busy: Iterable[Tuple[int, int]] = ()):
+        self.start = start
+        self.end = max(start, end)
+        self._n = self.end - self.start
+
+        size = 1
+        while size < self._n:
+            size *= 2
+        self._size = size
+
+        # 根节点整体标记为空闲（子节点靠懒标记按需展开），
+        # 补齐到 2 的幂的部分标记为占用，空闲段不会越过 end；建树只需 O(log M)
+        self._pre = [0] * (2 * size)
+        self._suf = [0] * (2 * size)
+        self._best = [0] * (2 * size)
+        self._lazy = [None] * (2 * size)
+        self._apply(1, True)
+        if self._n < size:
+            self._update(1, 0, size, self._n, size, False)
+
+        for busy_start, busy_end in busy:
+            self.reserve(busy_start, busy_end)
+
+    # ========== 查询 ==========
+
+    def find(self, after: int, duration: int) -> Optional[int]:
+        """after（含）之后第一个能放下 duration 分钟的起点，放不下返回 None"""
+        offset = max(int(after), self.start) - self.start
+        if offset > self._n:
+            return None
+        if duration <= 0:
+            return offset + self.start
+        if self._best[1] < duration:
+            return None  # 整个窗口都没有这么长的空档
+        pos, _ = self._find(1, 0, self._size, offset, duration, 0)
+        return None if pos is None else pos + self.start
+
+    def is_free(self, start: int, end: int) -> bool:
+        """[start, end) 是否整段空闲"""
+        return start >= self.start and end <= self.end and (
+            end <= start or self.find(start, end - start) == start)
+
+    def longest(self) -> int:
+        """窗口内最长空档的分钟数（O(1)）"""
+        return self._best[1]
+
+    def free_minutes(self) -> int:
+        """窗口内剩余空闲分钟数"""
+        return self._count_free(1, 0, self._size)
+
+    # ========== 更新 ==========
+
+    def reserve(self, start: int, end: int):
+        """把 [start, end) 标记为占用（超出窗口的部分忽略）"""
+        self._assign(start, end, False)
+
+    def release(self, start: int, end: int):
+        """把 [start, end) 重新标记为空闲"""
+        self._assign(start, end, True)
+
+    # ========== 线段树 ==========
+
+    def _assign(self, start: int, end: int, free: bool):
+        lo = max(int(start), self.start) - self.start
+        hi = min(int(end), self.end) - self.start
+        if lo < hi:
+            self._update(1, 0, self._size, lo, hi, free)
+
+    def _length(self, node: int) -> int:
+        return self._size >> (node.bit_length() - 1)
+
+    def _apply(self, node: int, free: bool):
+        value = self._length(node) if free else 0
+        self._pre[node] = self._suf[node] = self._best[node] = value
+        self._lazy[node] = free
+
+    def _push(self, node: int):
+        if self._lazy[node] is not None:
+            self._apply(2 * node, self._lazy[node])
+            self._apply(2 * node + 1, self._lazy[node])
+            self._lazy[node] = None
+
+    def _pull(self, node: int):
+        left, right = 2 * node, 2 * node + 1
+        half = self._length(left)
+        self._pre[node] = self._pre[left] if self._pre[left] < half else half + self._pre[right]
+        self._suf[node] = self._suf[right] if self._suf[right] < half else half + self._suf[left]
+        self._best[node] = max(self._best[left], self._best[right],
+                               self._suf[left] + self._pre[right])
+
+    def _update(self, node: int, lo: int, hi: int, start: int, end: int, free: bool):
+        if end <= lo or hi <= start:
+            return
+        if start <= lo and hi <= end:
+            self._apply(node, free)
+            return
+        self._push(node)
+        mid = (lo + hi) // 2
+        self._update(2 * node, lo, mid, start, end, free)
+        self._update(2 * node + 1, mid, hi, start, end, free)
+        self._pull(node)
+
+    def _find(self, node: int, lo: int, hi: int, after: int, need: int,
+              carry: int) -> Tuple[Optional[int], int]:
+        """
+        在 [lo, hi) 中找起点 ≥ after、长度 ≥ need 的最左空闲段
+
+        carry 为紧贴 lo 左侧、起点 ≥ after 的空闲段长度；
+        返回 (起点或 None, 延续到 hi 的空闲段长度)
+        """
+        if hi <= after:
+            return None, 0
+        if lo >= after:
+            if carry + self._pre[node] >= need:
+                return lo - carry, 0
+            if self._best[node] < need:
+                length = hi - lo
+                if self._pre[node] == length:
+                    return None, carry + length
+                return None, self._suf[node]
+
+        self._push(node)
+        mid = (lo + hi) // 2
+        pos, carry = self._find(2 * node, lo, mid, after, need, carry)
+        if pos is not None:
+            return pos, 0
+        return self._find(2 * node + 1, mid, hi, after, need, carry)
+
+    def _count_free(self, node: int, lo: int, hi: int) -> int:
+        if self._best[node] == 0:
+            return 0
+        if self._best[node] == hi - lo:
+            return hi - lo
+        self._push(node)
+        mid = (lo + hi) // 2
+        return self._count_free(2 * node, lo, mid) + self._count_free(2 * node + 1, mid, hi)
@@ -0,0 +1,261 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEEPSEEK_API_URL = 'https://api.deepseek.com/v1/chat/completions'
+DEFAULT_MODEL = 'deepseek-chat'
+
+# 连接池大小：同时在途的 LLM 请求数上限，超出的请求排队等空闲连接
+POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '4'))
+# 429 / 5xx / 连接失败时的最多重试次数
+MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+# 各调用场景的 (连接超时, 读取超时) 秒：解析任务要快，聊天和排期生成的内容长
+TIMEOUTS = {
+    'parse': (3.05, 10),
+    'chat': (3.05, 15),
+    'schedule': (3.05, 20),
+}
+
+# 指数退避：第 n 次重试前等待 [0, min(BACKOFF_CAP, BACKOFF_BASE * 2^n)) 内的随机时长
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 4.0
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# ========== 错误 ==========
+
+class LLMError(Exception):
+    """LLM 调用失败的基类；status 为 HTTP 状态码（没有响应时为 None）"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class LLMConfigError(LLMError):
+    """没有配置 API 密钥"""
+
+
+class LLMTimeoutError(LLMError):
+    """连接或读取超时"""
+
+
+class LLMConnectionError(LLMError):
+    """连不上服务（重试后仍失败）"""
+
+
+class LLMRateLimitError(LLMError):
+    """429 限流（重试后仍失败）"""
+
+
+class LLMServerError(LLMError):
+    """5xx（重试后仍失败）"""
+
+
+class LLMRequestError(LLMError):
+    """其他 4xx：密钥错误、参数错误等，不重试"""
+
+
+class LLMResponseError(LLMError):
+    """响应不是预期的 JSON 结构"""
+
+
+# ========== 客户端 ==========
+
+class LLMClient:
+    """
+    共享的 DeepSeek 客户端
+
+    所有调用复用同一个 requests.Session：连接 keep-alive，省掉每次的 DNS 解析和 TCP/TLS 握手；
+    连接池大小有上限（pool_block，超出时排队而不是新建连接）。429 / 5xx / 连接失败时按带抖动的
+    指数退避重试（429 优先遵循 Retry-After），失败抛出 LLMError 的子类，不再把错误当作回复内容返回。
+    Session 在多个线程间共享是安全的（每个请求从池中取独立的连接）。
+    """
+
+    def __init__(self, api_key: Optional[str] = None, url: str = DEEPSEEK_API_URL,
+                 model: str = DEFAULT_MODEL, pool_size: int = POOL_SIZE,
+                 max_retries: int = MAX_RETRIES):
+        self.api_key = api_key
+        self.url = url
+        self.model = model
+        self.max_retries = max_retries
+        self._pool_size = pool_size
+        self._session = None
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str, system_prompt: Optional[str] = None,
+                 temperature: float = 0.0, endpoint: str = 'chat', **options) -> str:
+        """单轮对话：可选的 system 提示 + 一条用户消息，返回回复文本"""
+        messages = []
+        if system_prompt:
+            messages.append({'role': 'system', 'content': system_prompt})
+        messages.append({'role': 'user', 'content': prompt})
+        return self.chat(messages, temperature=temperature, endpoint=endpoint, **options)
+
+    def chat(self, messages: List[Dict], temperature: float = 0.0, endpoint: str = 'chat',
+             api_key: Optional[str] = None, model: Optional[str] = None) -> str:
+        """
+        调用 chat completions，返回回复文本（去掉首尾空白）
+
+        Args:
+            messages: [{'role', 'content'}]
+            endpoint: 调用场景，决定超时，见 TIMEOUTS
+            api_key: 覆盖构造时的密钥（例如由调用方传入）
+
+        Raises:
+            LLMError: 见各子类
+        """
+        data = self.post({
+            'model': model or self.model,
+            'messages': messages,
+            'temperature': temperature
+        }, endpoint=endpoint, api_key=api_key)
+        try:
+            return data['choices'][0]['message']['content'].strip()
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise LLMResponseError(f'响应缺少回复内容: {e!r}') from e
+
+    def stream_chat(self, messages: List[Dict], temperature: float = 0.0, endpoint: str = 'chat',
+                    api_key: Optional[str] = None, model: Optional[str] = None) -> Iterator[str]:
+        """
+        以流式（stream=True，SSE）调用 chat completions，逐段产出回复文本
+
+        建立连接和拿到响应头之前的失败按 post() 的规则重试；开始产出后不再重试
+        （已经发给调用方的内容收不回来），中途断开或两段之间超过读取超时时抛出 LLMError。
+        生成器被提前关闭时释放连接。
+
+        Raises:
+            LLMError: 见各子类
+        """
+        response = self._send({
+            'model': model or self.model,
+            'messages': messages,
+            'temperature': temperature,
+            'stream': True
+        }, endpoint=endpoint, api_key=api_key, stream=True)
+        timeout = TIMEOUTS.get(endpoint, TIMEOUTS['chat'])
+        try:
+            # chunk_size=None：按服务端发来的分块（chunked）逐块读，不等凑满缓冲区（否则首段会被攒着不发）；
+            # text/event-stream 不带 charset 时 requests 会按 latin-1 解码，所以自己按 UTF-8 解
+            for line in response.iter_lines(chunk_size=None):
+                # SSE：只关心 "data: ..." 行，空行和 ": keep-alive" 注释跳过
+                if not line.startswith(b'data:'):
+                    continue
+                data = line[5:].decode('utf-8').strip()
+                if data == '[DONE]':
+                    return
+                try:
+                    delta = json.loads(data)['choices'][0].get('delta') or {}
+                except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                    raise LLMResponseError(f'流式响应格式错误: {data[:200]}') from e
+                if delta.get('content'):
+                    yield delta['content']
+        except requests.exceptions.ConnectionError as e:
+            # 流式读取中的读取超时由 urllib3 包装成 ConnectionError 抛出
+            if 'timed out' in str(e).lower():
+                raise LLMTimeoutError(f'读取超时（{timeout[1]}s 内没有新内容）') from e
+            raise LLMConnectionError(f'连接中断: {e}') from e
+        except requests.exceptions.RequestException as e:
+            raise LLMConnectionError(f'连接中断: {e}') from e
+        finally:
+            response.close()
+
+    def post(self, payload: Dict, endpoint: str = 'chat', api_key: Optional[str] = None) -> Dict:
+        """发送请求并按需重试，返回解析后的 JSON"""
+        response = self._send(payload, endpoint=endpoint, api_key=api_key)
+        try:
+            return response.json()
+        except ValueError as e:
+            raise LLMResponseError('响应不是 JSON', response.status_code) from e
+
+    def _send(self, payload: Dict, endpoint: str = 'chat', api_key: Optional[str] = None,
+              stream: bool = False) -> requests.Response:
+        """发送请求，429 / 5xx / 连接失败时重试，返回状态码为 200 的响应"""
+        key = api_key or self.api_key
+        if not key:
+            raise LLMConfigError('需要配置DeepSeek API密钥')
+        headers = {'Authorization': f'Bearer {key}'}
+        timeout = TIMEOUTS.get(endpoint, TIMEOUTS['chat'])
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.post(self.url, headers=headers, json=payload,
+                                             timeout=timeout, stream=stream)
+            except requests.exceptions.ConnectTimeout as e:
+                error, retry_after = LLMTimeoutError(f'连接超时: {e}'), None
+            except requests.exceptions.Timeout as e:
+                # 读取超时不重试：服务端可能仍在生成，重试只会让等待时间翻倍
+                raise LLMTimeoutError(f'读取超时（{timeout[1]}s）') from e
+            except requests.exceptions.ConnectionError as e:
+                error, retry_after = LLMConnectionError(f'连接失败: {e}'), None
+            else:
+                if response.status_code == 200:
+                    return response
+                error = _status_error(response)
+                response.close()
+                if response.status_code not in RETRY_STATUSES:
+                    raise error
+                retry_after = _retry_after(response)
+
+            if attempt >= self.max_retries:
+                raise error
+            time.sleep(self._backoff(attempt, retry_after))
+            attempt += 1
+
+    @property
+    def session(self) -> requests.Session:
+        """按需创建的共享 Session"""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size,
+                                      pool_block=True, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Content-Type'] = 'application/json'
+                self._session = session
+            return self._session
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        if retry_after is not None:
+            return min(retry_after, BACKOFF_CAP)
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def _status_error(response: requests.Response) -> LLMError:
+    """按状态码构造错误，附上服务端返回的错误信息"""
+    status = response.status_code
+    try:
+        detail = response.json().get('error', {}).get('message') or response.text
+    except (ValueError, AttributeError):
+        detail = response.text
+    message = f'HTTP {status}: {detail[:200]}'
+    if status == 429:
+        return LLMRateLimitError(message, status)
+    if status >= 500:
+        return LLMServerError(message, status)
+    return LLMRequestError(message, status)
+
+
+def _retry_after(response: requests.Response) -> Optional[float]:
+    """Retry-After 头（秒数形式），没有或无法解析时返回 None"""
+    value = response.headers.get('Retry-After')
+    try:
+        return max(float(value), 0.0) if value else None
+    except ValueError:
+        return None
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from task_parser import week_start
+
+# 内存中最多保留的条目数（LRU）
+MEMORY_ENTRIES = int(os.getenv('LLM_CACHE_MEMORY', '256'))
+# SQLite 中最多保留的条目数，超出时淘汰最久未使用的
+MAX_ENTRIES = int(os.getenv('LLM_CACHE_ENTRIES', '5000'))
+# 缓存有效期（天）
+TTL_DAYS = int(os.getenv('LLM_CACHE_TTL_DAYS', '30'))
+# 每写入这么多条清理一次 SQLite 中过期和超量的条目
+PRUNE_EVERY = 100
+
+_WHITESPACE = re.compile(r'\s+')
+
+# 相对日期：按天相对（今天、明天、3天后）和按周相对（周五前、下周三）
+DAY_RELATIVE = re.compile(
+    r'今天|今日|今晚|明天|明日|明早|明晚|大?后天|\d+\s*天[后内]|today|tonight|tomorrow|in\s+\d+\s+days?',
+    re.IGNORECASE)
+WEEK_RELATIVE = re.compile(
+    r'(?:周|星期|礼拜)[一二三四五六日天末]|[本这下]周|下个?星期|'
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend|next\s+week',
+    re.IGNORECASE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    """全角转半角、统一大小写、合并空白：只差这些的输入共用一条缓存"""
+    return _WHITESPACE.sub(' ', unicodedata.normalize('NFKC', prompt).casefold()).strip()
+
+
+def cache_key(prompt: str, model: str, temperature: float) -> str:
+    """规范化提示词 + 模型 + 温度的 SHA-256"""
+    raw = json.dumps([normalize_prompt(prompt), model, round(float(temperature), 3)],
+                     ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def rebase_deadline(text: str, deadline: Optional[str], resolved_at: datetime,
+                    now: Optional[datetime] = None) -> Optional[str]:
+    """
+    把缓存时解析出的截止时间换算到现在
+
+    缓存里的 deadline 是按 resolved_at 那天解析的绝对时间。输入里是按周相对的说法（周五前、下周三）
+    时按相差的整周平移，按天相对的（明天、3天后）按相差的天数平移，都没有（写了具体日期）时原样返回。
+    """
+    if not deadline:
+        return deadline
+    try:
+        value = datetime.fromisoformat(deadline)
+    except ValueError:
+        return deadline
+    now = now or datetime.now()
+    if WEEK_RELATIVE.search(text):
+        # 与 task_parser 一致按周一开始的周算，周日那天不会被算成下一周
+        shift = week_start(now.date()) - week_start(resolved_at.date())
+    elif DAY_RELATIVE.search(text):
+        shift = timedelta(days=(now.date() - resolved_at.date()).days)
+    else:
+        return deadline
+    if not shift:
+        return deadline
+    value += shift
+    # 只有日期的截止时间保持只有日期
+    return value.date().isoformat() if len(deadline) == 10 else value.isoformat()
+
+
+@dataclass
+class CachedResponse:
+    response: str
+    created_at: datetime
+
+
+class ResponseCache:
+    """
+    LLM 响应缓存：内存 LRU 在前，SQLite（llm_cache 表）在后
+
+    只用于确定性的解析类调用（温度 0）。键为规范化提示词 + 模型 + 温度的哈希；
+    条目超过 TTL 即失效，SQLite 中超过 max_entries 的按最近使用时间淘汰（每 PRUNE_EVERY 次写入清理一次）。
+    内存命中不碰数据库；数据库命中会提升到内存并刷新最近使用时间。
+    """
+
+    def __init__(self, db, memory_entries: int = MEMORY_ENTRIES,
+                 max_entries: int = MAX_ENTRIES, ttl_days: int = TTL_DAYS):
+        self.db = db
+        self.memory_entries = memory_entries
+        self.max_entries = max_entries
+        self.ttl = timedelta(days=ttl_days)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {'memory_hits': 0, 'db_hits': 0, 'misses': 0, 'writes': 0, 'pruned': 0}
+
+    key = staticmethod(cache_key)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """命中时返回 CachedResponse，未命中或已过期返回 None"""
+        now = datetime.now()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry.created_at < self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats['memory_hits'] += 1
+                    return entry
+                del self._memory[key]
+
+        row = self.db.get_llm_response(key, (now - self.ttl).isoformat(timespec='seconds'))
+        if row is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+
+        entry = CachedResponse(row['response'], datetime.fromisoformat(row['created_at']))
+        self.db.touch_llm_response(key, now.isoformat(timespec='seconds'))
+        with self._lock:
+            self._stats['db_hits'] += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key: str, response: str) -> CachedResponse:
+        """写入内存和 SQLite"""
+        now = datetime.now().replace(microsecond=0)
+        entry = CachedResponse(response, now)
+        self.db.put_llm_response(key, response, now.isoformat())
+        with self._lock:
+            self._remember(key, entry)
+            self._stats['writes'] += 1
+            self._writes += 1
+            prune = self._writes % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+        return entry
+
+    def prune(self) -> int:
+        """清理 SQLite 中过期和超量的条目"""
+        cutoff = (datetime.now() - self.ttl).isoformat(timespec='seconds')
+        removed = self.db.prune_llm_cache(self.max_entries, cutoff)
+        with self._lock:
+            self._stats['pruned'] += removed
+        return removed
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            lookups = self._stats['memory_hits'] + self._stats['db_hits'] + self._stats['misses']
+            hits = lookups - self._stats['misses']
+            return dict(self._stats, memory_entries=len(self._memory),
+                        hit_rate=round(hits / lookups, 3) if lookups else None)
+
+    def _remember(self, key: str, entry: CachedResponse):
+        """放进内存 LRU（调用方持有锁）"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
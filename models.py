@@ -0,0 +1,165 @@
+from dataclasses import dataclass, asdict, fields
+from datetime import datetime
+from typing import Dict, Optional, Union
+
+
+def duration_to_minutes(duration: Union[str, int, float, None], default: int = 60) -> int:
+    """
+    时长转分钟数，兼容整数分钟与 '30m' / '2h' / '1.5h' 字符串
+
+    两个历史数据库里 estimated_duration 既有 INTEGER 也有 TEXT，这里统一换算。
+    """
+    if duration is None or duration == '':
+        return default
+    if isinstance(duration, (int, float)):
+        return int(duration)
+
+    text = str(duration).strip().lower()
+    try:
+        if text.endswith('h'):
+            return int(float(text[:-1]) * 60)
+        if text.endswith('m'):
+            return int(float(text[:-1]))
+        return int(float(text))
+    except ValueError:
+        return default
+
+
+def normalize_deadline(deadline: Optional[str]) -> Optional[str]:
+    """
+    截止时间统一为 'YYYY-MM-DD' 或 'YYYY-MM-DDTHH:MM:00'（本地时间，去掉秒与时区）
+
+    数据库按文本顺序比较截止时间（贪心顺序索引），格式统一后才与 engine 按时间比较的结果一致；
+    无法解析的截止时间 engine 视为没有，这里存为 None。
+    """
+    if not deadline:
+        return None
+    text = str(deadline).strip()
+    try:
+        value = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if len(text) <= 10:
+        return value.date().isoformat()
+    return value.replace(second=0, microsecond=0, tzinfo=None).isoformat(timespec='seconds')
+
+
+def _from_row(cls, row):
+    """按列名构造数据类，缺失的列使用字段默认值"""
+    keys = set(row.keys())
+    return cls(**{f.name: row[f.name] for f in fields(cls) if f.name in keys})
+
+
+@dataclass
+class Task:
+    """任务行"""
+    id: int
+    content: str
+    category: Optional[str] = None
+    priority: Optional[str] = 'medium'
+    estimated_duration: int = 60
+    deadline: Optional[str] = None
+    scheduled_start: Optional[str] = None
+    scheduled_end: Optional[str] = None
+    status: str = 'pending'
+    created_at: Optional[str] = None
+    completed_at: Optional[str] = None
+    row_version: int = 0
+    enrichment_status: Optional[str] = None
+
+    def __post_init__(self):
+        self.estimated_duration = duration_to_minutes(self.estimated_duration)
+
+    @classmethod
+    def from_row(cls, row) -> 'Task':
+        return _from_row(cls, row)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class FixedSchedule:
+    """固定日程行"""
+    id: int
+    title: str
+    day_of_week: Optional[int] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    recurrence: Optional[str] = 'weekly'
+    location: Optional[str] = None
+    source: Optional[str] = 'manual'
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+    row_version: int = 0
+
+    @classmethod
+    def from_row(cls, row) -> 'FixedSchedule':
+        return _from_row(cls, row)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class FixedOccurrence:
+    """固定日程在某一天的一次发生（fixed_occurrences 缓存表的行）"""
+    schedule_id: int
+    date: str
+    start_time: str
+    end_time: str
+    title: str
+    location: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'FixedOccurrence':
+        return _from_row(cls, row)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class UserPreferences:
+    """用户偏好（单行，id 固定为 1）"""
+    id: int = 1
+    work_start_time: str = '09:00'
+    work_end_time: str = '18:00'
+    break_duration: int = 15
+    focus_time_preference: Optional[str] = None
+    enable_main_chat: int = 1
+    sleep_reminder_time: str = '22:00'
+    auto_reschedule_on_drag: int = 0
+    do_not_disturb_start: Optional[str] = None
+    do_not_disturb_end: Optional[str] = None
+    row_version: int = 0
+
+    def __post_init__(self):
+        # 早先部分更新偏好时可能写入了 NULL：有默认值的字段按默认值处理
+        for f in fields(self):
+            if getattr(self, f.name) is None and f.default is not None:
+                setattr(self, f.name, f.default)
+        self.break_duration = duration_to_minutes(self.break_duration, default=15)
+
+    @classmethod
+    def from_row(cls, row) -> 'UserPreferences':
+        return _from_row(cls, row)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+@dataclass
+class ChatMessage:
+    """对话历史行"""
+    id: int
+    role: str
+    content: str
+    timestamp: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row) -> 'ChatMessage':
+        return _from_row(cls, row)
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
@@ -0,0 +1,181 @@
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MINUTES_PER_DAY = 24 * 60
+INVALID = np.iinfo(np.int64).min  # 无法解析的时间
+
+
+@lru_cache(maxsize=4096)
+def time_to_minutes(time_str: str) -> int:
+    """'09:30' -> 570（结果缓存，同一时间字符串只解析一次）"""
+    h, m = map(int, time_str.split(':'))
+    return h * 60 + m
+
+
+class OccupancyGrid:
+    """
+    按分钟的占用位图：days × 1440 的 uint8 数组，1 表示已占用
+
+    固定日程取 [start_date, start_date + days) 内展开好的具体发生，已排期任务
+    按 ISO 时间换算；两者都用"起止分钟差分 + 累加"一次标记（跨午夜的自然落到第二天）；
+    空档、冲突、利用率查询都是数组运算，查一周或一个月不需要逐个时段循环。
+    """
+
+    def __init__(self, start_date: date, days: int):
+        self.start_date = start_date
+        self.days = days
+        self.grid = np.zeros((days, MINUTES_PER_DAY), dtype=np.uint8)
+
+    @classmethod
+    def from_database(cls, db, start_date: date, days: int,
+                      include_tasks: bool = True) -> 'OccupancyGrid':
+        """用 [start_date, start_date + days) 内的固定日程和已排期的待办任务构建"""
+        grid = cls(start_date, days)
+        end_date = start_date + timedelta(days=days)
+        grid.mark_occurrences([(o.date, o.start_time, o.end_time) for o in
+                               db.get_fixed_occurrences(start_date.isoformat(), end_date.isoformat())])
+        if include_tasks:
+            tasks = db.get_tasks_scheduled_between(start_date.isoformat(), end_date.isoformat())
+            grid.mark_datetimes([(t.scheduled_start, t.scheduled_end) for t in tasks])
+        return grid
+
+    # ========== 构建 ==========
+
+    def mark_occurrences(self, occurrences: Iterable[Tuple[str, str, str]]):
+        """标记某天的时段 [('YYYY-MM-DD', 'HH:MM', 'HH:MM')]（固定日程展开后的发生）"""
+        rows = [((date.fromisoformat(day) - self.start_date).days,
+                 time_to_minutes(start), time_to_minutes(end))
+                for day, start, end in occurrences if start and end]
+        if not rows:
+            return
+        days, starts, ends = (np.array(column, dtype=np.int64) for column in zip(*rows))
+        self.grid |= self._mark_flat(days * MINUTES_PER_DAY + starts,
+                                     days * MINUTES_PER_DAY + ends,
+                                     self.days * MINUTES_PER_DAY).reshape(self.grid.shape)
+
+    def mark_datetimes(self, slots: Iterable[Tuple[Optional[str], Optional[str]]]):
+        """标记具体时段 [(ISO 开始, ISO 结束)]，无法解析的跳过"""
+        pairs = [(start, end) for start, end in slots if start and end]
+        if not pairs:
+            return
+        starts = self._minute_offsets([start for start, _ in pairs])
+        ends = self._minute_offsets([end for _, end in pairs])
+        valid = (starts != INVALID) & (ends != INVALID)
+        self.grid |= self._mark_flat(starts[valid], ends[valid],
+                                     self.days * MINUTES_PER_DAY).reshape(self.grid.shape)
+
+    def mark_outside(self, work_start: str, work_end: str):
+        """把每天工作时间以外的分钟标记为占用"""
+        self.grid[:, :time_to_minutes(work_start)] = 1
+        self.grid[:, time_to_minutes(work_end):] = 1
+
+    # ========== 查询 ==========
+
+    def overlaps(self, day: int, start: int, end: int) -> bool:
+        """第 day 天 [start, end) 是否与已占用时段重叠"""
+        return bool(self.grid[day, max(start, 0):min(end, MINUTES_PER_DAY)].any())
+
+    def overlaps_many(self, days: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+        """批量冲突检查：前缀和相减，每个区间 O(1)"""
+        prefix = np.concatenate(([0], np.cumsum(self.grid.ravel(), dtype=np.int64)))
+        base = np.asarray(days) * MINUTES_PER_DAY
+        return (prefix[base + np.asarray(ends)] - prefix[base + np.asarray(starts)]) > 0
+
+    def busy_runs(self) -> List[Tuple[int, int]]:
+        """连续占用段 [(起, 止)]，以 start_date 0 点起的分钟数表示"""
+        return self._runs(self.grid.ravel())
+
+    def free_slots(self, min_duration: int = 1) -> List[Tuple[int, int, int]]:
+        """长度 ≥ min_duration 的空档 [(第几天, 起始分钟, 结束分钟)]，不跨天"""
+        return self._free_slots(self.grid, min_duration)
+
+    def utilization(self, work_start: str = '00:00', work_end: str = '24:00') -> np.ndarray:
+        """每天工作时间内的占用比例"""
+        start = time_to_minutes(work_start)
+        end = time_to_minutes(work_end)
+        if end <= start:
+            return np.zeros(self.days)
+        return self.grid[:, start:end].mean(axis=1)
+
+    def summary(self, work_start: str, work_end: str, min_duration: int = 30) -> Dict:
+        """按天汇总：占用分钟数、利用率、工作时间内 ≥ min_duration 的空档"""
+        usage = self.utilization(work_start, work_end)
+        busy_minutes = self.grid[:, time_to_minutes(work_start):time_to_minutes(work_end)].sum(axis=1)
+
+        # 只在工作时间内找空档
+        window = self.grid.copy()
+        window[:, :time_to_minutes(work_start)] = 1
+        window[:, time_to_minutes(work_end):] = 1
+
+        days = []
+        slots_by_day = {}
+        for day, start, end in self._free_slots(window, min_duration):
+            slots_by_day.setdefault(day, []).append({
+                'start': f'{start // 60:02d}:{start % 60:02d}',
+                'end': f'{end // 60:02d}:{end % 60:02d}'
+            })
+        for day in range(self.days):
+            days.append({
+                'date': (self.start_date + timedelta(days=day)).isoformat(),
+                'busy_minutes': int(busy_minutes[day]),
+                'utilization': round(float(usage[day]), 4),
+                'free_slots': slots_by_day.get(day, [])
+            })
+        return {'days': days}
+
+    # ========== 工具 ==========
+
+    @classmethod
+    def _free_slots(cls, grid: np.ndarray, min_duration: int) -> List[Tuple[int, int, int]]:
+        # 每天末尾补一个占用列，空档不会跨到第二天
+        days = grid.shape[0]
+        padded = np.ones((days, MINUTES_PER_DAY + 1), dtype=np.uint8)
+        padded[:, :MINUTES_PER_DAY] = grid
+        starts, ends = cls._run_bounds(1 - padded.ravel())
+        keep = (ends - starts) >= min_duration
+        starts, ends = starts[keep], ends[keep]
+        days, minutes = np.divmod(starts, MINUTES_PER_DAY + 1)
+        return list(zip(days.tolist(), minutes.tolist(), (minutes + ends - starts).tolist()))
+
+    def _minute_offsets(self, values: List[str]) -> np.ndarray:
+        """ISO 时间字符串 -> 相对 start_date 0 点的分钟数；解析失败记为 int64 最小值"""
+        origin = np.datetime64(self.start_date.isoformat(), 'm')
+        try:
+            parsed = np.array(values, dtype='datetime64[m]')
+        except ValueError:
+            parsed = np.array([self._parse_one(v) for v in values], dtype='datetime64[m]')
+        offsets = (parsed - origin).astype(np.int64)
+        offsets[np.isnat(parsed)] = INVALID
+        return offsets
+
+    @staticmethod
+    def _parse_one(value: str):
+        try:
+            return np.datetime64(datetime.fromisoformat(value).replace(tzinfo=None), 'm')
+        except ValueError:
+            return np.datetime64('NaT')
+
+    @staticmethod
+    def _mark_flat(starts: np.ndarray, ends: np.ndarray, total: int) -> np.ndarray:
+        """一维区间标记：起点 +1、终点 -1，累加后 > 0 即占用"""
+        starts = np.clip(starts, 0, total)
+        ends = np.clip(ends, 0, total)
+        keep = ends > starts
+        delta = np.zeros(total + 1, dtype=np.int32)
+        np.add.at(delta, starts[keep], 1)
+        np.add.at(delta, ends[keep], -1)
+        return (np.cumsum(delta[:-1]) > 0).astype(np.uint8)
+
+    @staticmethod
+    def _run_bounds(flags: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """一维 0/1 数组中连续为 1 的段：(起点数组, 终点数组)"""
+        edges = np.diff(np.concatenate(([0], flags.astype(np.int8), [0])))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    @classmethod
+    def _runs(cls, flags: np.ndarray) -> List[Tuple[int, int]]:
+        starts, ends = cls._run_bounds(flags)
+        return list(zip(starts.tolist(), ends.tolist()))
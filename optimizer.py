@@ -0,0 +1,168 @@
+import random
+import time
+from typing import Dict, List, Optional, Tuple
+
+# 目标函数权重，单位都折算成"分钟"
+PRIORITY_WEIGHTS = {'high': 3, 'medium': 2, 'low': 1}
+START_WEIGHT = 0.1          # 每分钟开始时间 × 优先级权重：重要的任务尽量靠前
+LATE_WEIGHT = 1.0           # 每分钟超过截止时间
+SWITCH_COST = 20            # 相邻任务分类不同，切换一次
+FOCUS_MINUTES = 90          # 连续工作超过这个时长仍没有休息……
+FATIGUE_WEIGHT = 0.5        # ……每多一分钟的代价
+UNSCHEDULED_WEIGHT = 2.0    # 当天放不下的任务：每分钟时长 × 优先级权重
+
+
+class LocalOptimizer:
+    """
+    本地排期优化器：贪心初始解 + 限时局部搜索
+
+    解由"任务顺序 + 每个任务前是否休息"表示，解码时按顺序依次放进
+    当天空档（不早于上一个任务结束，选择休息时再空出 break_minutes）。
+    目标函数见模块顶部的权重：截止时间、优先级加权的开始时间、分类切换、
+    长时间连续工作、放不下的任务。搜索在 budget_ms 内随机做交换/移动/
+    切换休息，只接受不变差的解，超时立即返回目前最好的排期。
+    """
+
+    def __init__(self, problem, seed: int = 0):
+        """
+        Args:
+            problem: engine.Problem，时长、权重、分类、截止时间都已解析成分钟
+            seed: 随机种子，同样的输入和种子得到同样的搜索过程
+        """
+        self.problem = problem
+        self.break_minutes = problem.break_minutes
+        self.rng = random.Random(seed)
+
+        self.durations = problem.durations
+        self.weights = problem.weights
+        self.categories = problem.categories
+        self.deadlines = problem.deadlines
+        self.work_start = problem.earliest
+        self.gaps = self._free_gaps(problem.earliest, problem.work_end, problem.busy)
+
+    # ========== 对外接口 ==========
+
+    def optimize(self, budget_ms: float = 150, initial_order: List[int] = None) -> Dict:
+        """
+        在 budget_ms 毫秒内搜索，返回最好的排期
+
+        Args:
+            initial_order: 初始解的任务顺序（任务下标），默认按下标顺序
+
+        Returns:
+            {'placements': [(任务下标, 开始分钟)], 'unscheduled': [任务下标],
+             'cost': float, 'iterations': int}
+        """
+        deadline = time.perf_counter() + budget_ms / 1000
+        n = len(self.durations)
+
+        order = list(initial_order) if initial_order is not None else list(range(n))
+        rests = [False] * n
+        cost = self._cost(order, rests)
+        best = (cost, order[:], rests[:])
+
+        iterations = 0
+        while n > 0 and time.perf_counter() < deadline:
+            iterations += 1
+            new_order, new_rests = self._neighbor(order, rests)
+            new_cost = self._cost(new_order, new_rests)
+            if new_cost <= cost:
+                order, rests, cost = new_order, new_rests, new_cost
+                if cost < best[0]:
+                    best = (cost, order[:], rests[:])
+
+        cost, order, rests = best
+        placements = self._decode(order, rests)
+        return {
+            'placements': [(i, start) for i, start in placements if start is not None],
+            'unscheduled': [i for i, start in placements if start is None],
+            'cost': round(cost, 2),
+            'iterations': iterations
+        }
+
+    # ========== 解码与目标函数 ==========
+
+    def _decode(self, order: List[int], rests: List[bool]) -> List[Tuple[int, Optional[int]]]:
+        """按顺序把任务放进空档，返回 [(任务下标, 开始分钟或 None)]"""
+        placements = []
+        cursor = self.work_start
+        gap_index = 0
+        previous_placed = False
+        for position, i in enumerate(order):
+            duration = self.durations[i]
+            earliest = cursor + (self.break_minutes if rests[position] and previous_placed else 0)
+            start = None
+            for j in range(gap_index, len(self.gaps)):
+                gap_start, gap_end = self.gaps[j]
+                candidate = max(gap_start, earliest)
+                if candidate + duration <= gap_end:
+                    start, gap_index = candidate, j
+                    break
+            placements.append((i, start))
+            if start is not None:
+                cursor = start + duration
+                previous_placed = True
+        return placements
+
+    def _cost(self, order: List[int], rests: List[bool]) -> float:
+        cost = 0.0
+        previous_end = None
+        previous_category = None
+        run = 0  # 当前连续工作时长
+        for i, start in self._decode(order, rests):
+            duration = self.durations[i]
+            weight = self.weights[i]
+            if start is None:
+                cost += UNSCHEDULED_WEIGHT * weight * max(duration, 1)
+                continue
+
+            end = start + duration
+            cost += START_WEIGHT * weight * (start - self.work_start)
+            if self.deadlines[i] is not None and end > self.deadlines[i]:
+                cost += LATE_WEIGHT * (end - self.deadlines[i])
+
+            if previous_end is not None:
+                if self.categories[i] != previous_category:
+                    cost += SWITCH_COST
+                run = run + duration if start - previous_end < self.break_minutes else duration
+            else:
+                run = duration
+            if run > FOCUS_MINUTES:
+                cost += FATIGUE_WEIGHT * min(run - FOCUS_MINUTES, duration)
+
+            previous_end, previous_category = end, self.categories[i]
+        return cost
+
+    # ========== 搜索 ==========
+
+    def _neighbor(self, order: List[int], rests: List[bool]) -> Tuple[List[int], List[bool]]:
+        """随机邻域：交换两个任务 / 把一个任务移到别处 / 切换某处是否休息"""
+        n = len(order)
+        order, rests = order[:], rests[:]
+        move = self.rng.random()
+        if n > 1 and move < 0.4:
+            a, b = self.rng.sample(range(n), 2)
+            order[a], order[b] = order[b], order[a]
+        elif n > 1 and move < 0.8:
+            a, b = self.rng.sample(range(n), 2)
+            order.insert(b, order.pop(a))
+        else:
+            a = self.rng.randrange(n)
+            rests[a] = not rests[a]
+        return order, rests
+
+    # ========== 工具 ==========
+
+    def _free_gaps(self, start: int, end: int, busy: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """工作窗口扣掉已占用时段后的空档（有序、不重叠）"""
+        gaps = []
+        cursor = start
+        for busy_start, busy_end in sorted(busy):
+            if busy_start > cursor:
+                gaps.append((cursor, min(busy_start, end)))
+            cursor = max(cursor, busy_end)
+            if cursor >= end:
+                break
+        if cursor < end:
+            gaps.append((cursor, end))
+        return [(s, e) for s, e in gaps if s < e]
@@ -0,0 +1,86 @@
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Union
+
+# 全项目统一的星期编号：0=周日，1=周一 … 6=周六
+# （与前端 Date.getDay()、OCR 解析、AI 提示词一致；Python 的 weekday() 是 0=周一，不能直接比较）
+WEEKDAY_NAMES = ['周日', '周一', '周二', '周三', '周四', '周五', '周六']
+
+RECURRENCES = ('weekly', 'biweekly', 'once')
+
+# 没有 start_date 的隔周日程从这一周（1970-01-04 是周日）起算单双周
+BIWEEKLY_ANCHOR = date(1970, 1, 4)
+
+
+def day_of_week(day: date) -> int:
+    """日期 -> 星期编号（0=周日）"""
+    return (day.weekday() + 1) % 7
+
+
+def to_date(value: Union[date, str, None]) -> Optional[date]:
+    """'YYYY-MM-DD' / ISO 时间字符串 / date -> date，空值返回 None"""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+def _week_start(day: date) -> date:
+    """所在周的周日"""
+    return day - timedelta(days=day_of_week(day))
+
+
+def occurs_on(schedule, day: date, exceptions: Iterable[str] = ()) -> bool:
+    """
+    固定日程在 day 这一天是否发生
+
+    规则：
+      weekly    每周 day_of_week 这天（未知的 recurrence 也按每周处理）
+      biweekly  隔周：与 start_date 所在周相差偶数周
+      once      只在 start_date 当天
+    start_date / end_date（含）限定学期等有效期，exceptions 中的日期（放假、调课）跳过。
+    """
+    start = to_date(schedule.start_date)
+    end = to_date(schedule.end_date)
+    if (start and day < start) or (end and day > end):
+        return False
+    if day.isoformat() in exceptions:
+        return False
+
+    recurrence = (schedule.recurrence or 'weekly').lower()
+    if recurrence == 'once':
+        return start == day
+    if schedule.day_of_week is None or int(schedule.day_of_week) != day_of_week(day):
+        return False
+    if recurrence == 'biweekly':
+        weeks = (_week_start(day) - _week_start(start or BIWEEKLY_ANCHOR)).days // 7
+        return weeks % 2 == 0
+    return True
+
+
+def expand(schedules: Iterable, exceptions: Dict[int, Set[str]],
+           start: date, end: date) -> List[Dict]:
+    """
+    把固定日程展开成 [start, end) 内的具体发生
+
+    Returns:
+        [{'schedule_id', 'date', 'start_time', 'end_time', 'title', 'location'}]，
+        按日期、开始时间排序
+    """
+    schedules = [s for s in schedules if s.start_time and s.end_time]
+    occurrences = []
+    day = start
+    while day < end:
+        for schedule in schedules:
+            if occurs_on(schedule, day, exceptions.get(schedule.id, ())):
+                occurrences.append({
+                    'schedule_id': schedule.id,
+                    'date': day.isoformat(),
+                    'start_time': schedule.start_time,
+                    'end_time': schedule.end_time,
+                    'title': schedule.title,
+                    'location': schedule.location
+                })
+        day += timedelta(days=1)
+    occurrences.sort(key=lambda o: (o['date'], o['start_time']))
+    return occurrences
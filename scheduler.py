@@ -1,18 +1,28 @@
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
-import requests
 import json
 
+from models import Task, FixedOccurrence, UserPreferences
+from intervals import FreeIntervals
+from engine import Problem, place_in_order, solve
+from occupancy import OccupancyGrid
+from llm import LLMClient, LLMError
+
 class Scheduler:
-    def __init__(self, db):
+    def __init__(self, db, llm: LLMClient = None):
         self.db = db
+        self.llm = llm or LLMClient()
     
-    def greedy_schedule(self, target_date: str = None) -> List[Dict]:
+    def greedy_schedule(self, target_date: str = None, strategy: str = 'greedy') -> List[Dict]:
         """
-        贪心算法自动排期
+        当天自动排期（默认贪心：优先级高、截止早的先排）
+        
+        贪心策略直接消费数据库按索引顺序流式返回的未排期任务，当天排满就停止读取；
+        其他策略需要看到全部任务，一次加载后交给 engine 求解。
         
         Args:
             target_date: 目标日期 YYYY-MM-DD，默认今天
+            strategy: 排期策略，见 engine.STRATEGIES
         
         Returns:
             排期后的任务列表
@@ -20,65 +30,203 @@ class Scheduler:
         if not target_date:
             target_date = datetime.now().strftime('%Y-%m-%d')
         
-        # 获取待排期任务
-        all_tasks = self.db.get_all_tasks(status='pending')
-        tasks = [t for t in all_tasks if not t['scheduled_start']]
+        prefs = self.db.get_user_preferences()
+        work_start = self._time_to_minutes(prefs.work_start_time)
+        work_end = self._time_to_minutes(prefs.work_end_time)
+        busy = self._get_busy_slots(target_date)
+        
+        if strategy == 'greedy':
+            free = FreeIntervals(work_start, work_end, busy)
+            scheduled_tasks = [
+                {**task.to_dict(), **self._slot_change(task.id, target_date, start, end)}
+                for task, start, end in place_in_order(
+                    self.db.iter_unscheduled_tasks(max_duration=free.longest), free, work_start)
+            ]
+        else:
+            tasks = self.db.get_pending_unscheduled_tasks()
+            if not tasks:
+                return []
+            problem = Problem(tasks, busy, work_start, work_end, day=target_date)
+            solution = solve(problem, strategy)
+            scheduled_tasks = [{**tasks[i].to_dict(), **problem.slot(i, start)}
+                               for i, start in solution.placements]
+        
+        # 一次事务批量写回
+        self.db.update_task_schedules(scheduled_tasks)
+        
+        return scheduled_tasks
+    
+    def horizon_schedule(self, days: int = 7, start_date: str = None) -> Dict:
+        """
+        多日排期：数据只加载一次，在 days 天的日历上单遍放置所有待排期任务
+        
+        固定日程按重复规则展开到每一天，连同已排期任务和非工作时间一起
+        作为日历级排期问题的已占用时段；用 EDF 策略按截止日期优先（同截止日期按优先级）
+        依次放进最早的空档，结果一次事务批量写回。从今天开始时不会排到已过去的时间。
+        
+        Args:
+            days: 排期天数
+            start_date: 起始日期 YYYY-MM-DD，默认今天
         
+        Returns:
+            {'scheduled': List[Dict], 'unscheduled': List[int]}（后者为放不下的任务 id）
+        """
+        now = datetime.now()
+        if start_date:
+            start = datetime.strptime(start_date, '%Y-%m-%d')
+        else:
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        
+        tasks = self.db.get_pending_unscheduled_tasks()
         if not tasks:
+            return {'scheduled': [], 'unscheduled': []}
+        
+        prefs = self.db.get_user_preferences()
+        
+        # 固定日程按重复规则展开到每一天，连同已排期任务、非工作时间一起算成占用位图，
+        # 合并后的连续占用段作为日历级排期问题的已占用时段
+        grid = OccupancyGrid.from_database(self.db, start.date(), days)
+        grid.mark_outside(prefs.work_start_time, prefs.work_end_time)
+        elapsed = (now - start).total_seconds()
+        
+        problem = Problem(tasks, grid.busy_runs(), 0, days * 24 * 60,
+                          day=start.strftime('%Y-%m-%d'),
+                          earliest=max(int(-(-elapsed // 60)), 0))  # 向上取整到分钟
+        
+        # 截止日期优先，其次优先级
+        solution = solve(problem, 'edf')
+        scheduled_tasks = [{**tasks[i].to_dict(), **problem.slot(i, slot_start)}
+                           for i, slot_start in solution.placements]
+        unscheduled = [problem.ids[i] for i in solution.unscheduled]
+        
+        # 一次事务批量写回
+        self.db.update_task_schedules(scheduled_tasks)
+        
+        scheduled_tasks.sort(key=lambda t: t['scheduled_start'])
+        return {'scheduled': scheduled_tasks, 'unscheduled': unscheduled}
+    
+    def reschedule_after_change(self, task_id: int, resize: bool = False) -> List[Dict]:
+        """
+        增量重排：某个任务的时间或时长改变后，只重排当天受影响的任务
+        
+        被修改的任务固定在新位置；当天结束时间不晚于它开始时间的任务原样保留，
+        其余任务按原开始时间依次检查，原时段仍空闲就不动，冲突才顺延到之后
+        第一个放得下的空档，当天放不下的退回待排期。只写回并返回真正变化的任务。
+        
+        Args:
+            task_id: 被修改的任务
+            resize: 为 True 时按 estimated_duration 重新计算该任务的结束时间
+        
+        Returns:
+            变化的任务 [{'id', 'scheduled_start', 'scheduled_end'}]，退回待排期的两项为 None
+        """
+        task = self.db.get_task(task_id)
+        start_dt = self._parse_slot(task.scheduled_start) if task else None
+        if start_dt is None:
             return []
         
-        # 按优先级和截止日期排序
-        priority_map = {'high': 3, 'medium': 2, 'low': 1}
-        tasks.sort(key=lambda t: (
-            -priority_map.get(t['priority'], 0),
-            t['deadline'] if t['deadline'] else '9999-12-31'
-        ))
+        day = start_dt.strftime('%Y-%m-%d')
+        pinned_start = start_dt.hour * 60 + start_dt.minute
+        end_dt = None if resize else self._parse_slot(task.scheduled_end)
+        pinned_end = (self._minutes_of(end_dt, start_dt) if end_dt
+                      else pinned_start + task.estimated_duration)
+        
+        changes = []
+        if resize:
+            changes.append(self._slot_change(task.id, day, pinned_start, pinned_end))
         
-        # 获取固定日程（今天的）
-        fixed_schedules = self.db.get_all_fixed_schedules()
-        busy_slots = self._get_busy_slots(target_date, fixed_schedules)
+        # 当天的其他任务：(开始, 结束, 任务)
+        next_day = (start_dt + timedelta(days=1)).strftime('%Y-%m-%d')
+        slots = []
+        for other in self.db.get_tasks_scheduled_between(day, next_day):
+            other_start_dt = self._parse_slot(other.scheduled_start)
+            if other.id == task.id or other_start_dt is None:
+                continue
+            other_start = other_start_dt.hour * 60 + other_start_dt.minute
+            other_end_dt = self._parse_slot(other.scheduled_end)
+            other_end = (self._minutes_of(other_end_dt, other_start_dt) if other_end_dt
+                         else other_start + other.estimated_duration)
+            slots.append((other_start, other_end, other))
         
-        # 获取用户偏好
+        # 窗口取工作时间，并放宽到包含当天已有的时段，避免把工作时间外手动安排的任务挤掉
         prefs = self.db.get_user_preferences()
-        work_start = self._time_to_minutes(prefs['work_start_time'])
-        work_end = self._time_to_minutes(prefs['work_end_time'])
+        window_start = min([self._time_to_minutes(prefs.work_start_time), pinned_start] +
+                           [s for s, _, _ in slots])
+        window_end = max([self._time_to_minutes(prefs.work_end_time), pinned_end] +
+                         [e for _, e, _ in slots])
+        free = FreeIntervals(max(window_start, 0), min(window_end, 24 * 60))
         
-        # 开始排期
-        scheduled_tasks = []
-        current_time = work_start
+        for schedule in self.db.get_fixed_occurrences_for_date(start_dt.date()):
+            free.reserve(self._time_to_minutes(schedule.start_time),
+                         self._time_to_minutes(schedule.end_time))
+        free.reserve(pinned_start, pinned_end)
         
-        for task in tasks:
-            duration = task['estimated_duration']
-            
-            # 寻找下一个可用时段
-            slot_start = self._find_next_available_slot(
-                current_time, duration, work_end, busy_slots
-            )
-            
-            if slot_start is None:
-                continue  # 今天排不下了
-            
-            slot_end = slot_start + duration
-            
-            # 更新任务时间
-            start_time = self._minutes_to_time(slot_start)
-            end_time = self._minutes_to_time(slot_end)
-            
-            self.db.update_task(
-                task['id'],
-                scheduled_start=f"{target_date}T{start_time}:00",
-                scheduled_end=f"{target_date}T{end_time}:00"
-            )
-            
-            task['scheduled_start'] = f"{target_date}T{start_time}:00"
-            task['scheduled_end'] = f"{target_date}T{end_time}:00"
-            scheduled_tasks.append(task)
+        affected = []
+        for other_start, other_end, other in slots:
+            if other_end <= pinned_start:
+                free.reserve(other_start, other_end)
+            else:
+                affected.append((other_start, other_end, other))
+        
+        for other_start, other_end, other in affected:
+            duration = other_end - other_start
+            if free.is_free(other_start, other_end):
+                new_start = other_start
+            else:
+                new_start = free.find(other_start, duration)
             
-            # 记录已占用时段
-            busy_slots.append((slot_start, slot_end))
-            current_time = slot_end
+            if new_start is None:
+                changes.append({'id': other.id, 'scheduled_start': None, 'scheduled_end': None})
+                continue
+            free.reserve(new_start, new_start + duration)
+            if new_start != other_start:
+                changes.append(self._slot_change(other.id, day, new_start, new_start + duration))
         
-        return scheduled_tasks
+        # 一次事务批量写回
+        self.db.update_task_schedules(changes)
+        
+        return changes
+    
+    def local_optimize_schedule(self, target_date: str = None, budget_ms: float = 150) -> Dict:
+        """
+        本地优化排期（不调用 AI）：贪心初始解 + 限时局部搜索，见 engine.LocalSearchStrategy
+        
+        参与优化的是未排期的待办任务和已排在 target_date 的待办任务。
+        
+        Args:
+            target_date: 目标日期 YYYY-MM-DD，默认今天
+            budget_ms: 搜索时间上限（毫秒），到时返回目前最好的排期
+        
+        Returns:
+            {'success': bool, 'message': str, 'tasks': List[Dict], 'unscheduled': List[int]}
+        """
+        if not target_date:
+            target_date = datetime.now().strftime('%Y-%m-%d')
+        
+        next_day = (datetime.strptime(target_date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+        tasks = (self.db.get_pending_unscheduled_tasks()
+                 + self.db.get_tasks_scheduled_between(target_date, next_day))
+        prefs = self.db.get_user_preferences()
+        problem = Problem(tasks, self._get_busy_slots(target_date),
+                          self._time_to_minutes(prefs.work_start_time),
+                          self._time_to_minutes(prefs.work_end_time),
+                          day=target_date, break_minutes=prefs.break_duration)
+        solution = solve(problem, 'local', budget_ms=budget_ms)
+        scheduled = [problem.slot(i, start) for i, start in solution.placements]
+        unscheduled = [problem.ids[i] for i in solution.unscheduled]
+        
+        # 放不下的任务退回待排期，与排上的一起一次事务写回
+        self.db.update_task_schedules(scheduled + [
+            {'id': task_id, 'scheduled_start': None, 'scheduled_end': None}
+            for task_id in unscheduled
+        ])
+        
+        return {
+            'success': True,
+            'message': '本地优化完成',
+            'tasks': scheduled,
+            'unscheduled': unscheduled
+        }
     
     def ai_optimize_schedule(self, target_date: str = None, api_key: str = None) -> Dict:
         """
@@ -102,57 +250,30 @@ class Scheduler:
         
         # 获取数据
         tasks = self.db.get_all_tasks(status='pending')
-        fixed_schedules = self.db.get_all_fixed_schedules()
+        fixed_schedules = self.db.get_fixed_occurrences_for_date(target_date)
         prefs = self.db.get_user_preferences()
         
         # 构建prompt
         prompt = self._build_ai_prompt(target_date, tasks, fixed_schedules, prefs)
         
         try:
-            # 调用DeepSeek API
-            response = requests.post(
-                'https://api.deepseek.com/v1/chat/completions',
-                headers={
-                    'Authorization': f'Bearer {api_key}',
-                    'Content-Type': 'application/json'
+            # 调用DeepSeek API（共享连接池，限流/5xx 自动重试）
+            ai_response = self.llm.chat([
+                {
+                    'role': 'system',
+                    'content': '你是一个智能日程规划助手，擅长合理安排任务时间。'
                 },
-                json={
-                    'model': 'deepseek-chat',
-                    'messages': [
-                        {
-                            'role': 'system',
-                            'content': '你是一个智能日程规划助手，擅长合理安排任务时间。'
-                        },
-                        {
-                            'role': 'user',
-                            'content': prompt
-                        }
-                    ],
-                    'temperature': 0.7
-                },
-                timeout=10
-            )
-            
-            if response.status_code != 200:
-                return {
-                    'success': False,
-                    'message': f'API调用失败: {response.status_code}'
+                {
+                    'role': 'user',
+                    'content': prompt
                 }
-            
-            result = response.json()
-            ai_response = result['choices'][0]['message']['content']
+            ], temperature=0.7, endpoint='schedule', api_key=api_key)
             
             # 解析AI返回的JSON
             schedule_data = json.loads(ai_response)
             
             # 更新数据库
-            for task_schedule in schedule_data.get('tasks', []):
-                task_id = task_schedule['id']
-                self.db.update_task(
-                    task_id,
-                    scheduled_start=task_schedule['scheduled_start'],
-                    scheduled_end=task_schedule['scheduled_end']
-                )
+            self.db.update_task_schedules(schedule_data.get('tasks', []))
             
             return {
                 'success': True,
@@ -160,46 +281,49 @@ class Scheduler:
                 'tasks': schedule_data.get('tasks', [])
             }
         
+        except LLMError as e:
+            return {
+                'success': False,
+                'message': f'API调用失败: {str(e)}'
+            }
         except Exception as e:
             return {
                 'success': False,
                 'message': f'AI优化失败: {str(e)}'
             }
     
-    def _get_busy_slots(self, target_date: str, fixed_schedules: List[Dict]) -> List[tuple]:
-        """获取已占用时段（分钟单位）"""
-        busy = []
-        weekday = datetime.strptime(target_date, '%Y-%m-%d').weekday()
-        
-        for schedule in fixed_schedules:
-            if schedule['day_of_week'] == weekday:
-                start = self._time_to_minutes(schedule['start_time'])
-                end = self._time_to_minutes(schedule['end_time'])
-                busy.append((start, end))
-        
-        return sorted(busy)
+    def _get_busy_slots(self, target_date: str) -> List[tuple]:
+        """获取当天固定日程占用的时段（分钟单位）"""
+        return sorted((self._time_to_minutes(o.start_time), self._time_to_minutes(o.end_time))
+                      for o in self.db.get_fixed_occurrences_for_date(target_date))
     
-    def _find_next_available_slot(self, start_time: int, duration: int, 
-                                   end_limit: int, busy_slots: List[tuple]) -> Optional[int]:
-        """寻找下一个可用时段"""
-        current = start_time
-        
-        while current + duration <= end_limit:
-            # 检查是否与busy_slots冲突
-            conflict = False
-            for busy_start, busy_end in busy_slots:
-                if not (current + duration <= busy_start or current >= busy_end):
-                    conflict = True
-                    current = busy_end  # 跳到忙碌时段后
-                    break
-            
-            if not conflict:
-                return current
-        
-        return None
+    def _parse_slot(self, value: Optional[str]) -> Optional[datetime]:
+        """解析 scheduled_start/scheduled_end；早期只存了 'HH:MM' 的数据无法定位日期，返回 None"""
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    
+    def _minutes_of(self, value: datetime, day_start: datetime) -> int:
+        """当天的分钟数；跨到第二天的结束时间记为超过 1440"""
+        days = (value.date() - day_start.date()).days
+        return days * 24 * 60 + value.hour * 60 + value.minute
+    
+    def _slot_change(self, task_id: int, day: str, start: int, end: int) -> Dict:
+        """把当天的分钟区间转成排期字段（结束时间可以跨到第二天）"""
+        base = datetime.strptime(day, '%Y-%m-%d')
+        return {
+            'id': task_id,
+            'scheduled_start': (base + timedelta(minutes=start)).strftime('%Y-%m-%dT%H:%M:%S'),
+            'scheduled_end': (base + timedelta(minutes=end)).strftime('%Y-%m-%dT%H:%M:%S')
+        }
     
     def _time_to_minutes(self, time_str: str) -> int:
-        """时间字符串转分钟数 '09:30' -> 570"""
+        """时间字符串转分钟数 '09:30' -> 570；不是字符串时抛 TypeError，格式不对时抛 ValueError"""
+        if not isinstance(time_str, str):
+            raise TypeError(f'时间需为 HH:MM 字符串: {time_str!r}')
         h, m = map(int, time_str.split(':'))
         return h * 60 + m
     
@@ -209,28 +333,26 @@ class Scheduler:
         m = minutes % 60
         return f"{h:02d}:{m:02d}"
     
-    def _build_ai_prompt(self, target_date: str, tasks: List[Dict], 
-                        fixed_schedules: List[Dict], prefs: Dict) -> str:
+    def _build_ai_prompt(self, target_date: str, tasks: List[Task], 
+                        fixed_schedules: List[FixedOccurrence], prefs: UserPreferences) -> str:
         """构建AI排期的prompt"""
         prompt = f"""
 请为以下任务安排{target_date}的日程。
 
 **固定日程（不可占用）：**
 """
-        weekday = datetime.strptime(target_date, '%Y-%m-%d').weekday()
         for schedule in fixed_schedules:
-            if schedule['day_of_week'] == weekday:
-                prompt += f"- {schedule['start_time']}-{schedule['end_time']}: {schedule['title']}\n"
+            prompt += f"- {schedule.start_time}-{schedule.end_time}: {schedule.title}\n"
         
         prompt += f"""
-**可工作时间：** {prefs['work_start_time']}-{prefs['work_end_time']}
+**可工作时间：** {prefs.work_start_time}-{prefs.work_end_time}
 
 **待安排任务：**
 """
         for task in tasks:
-            prompt += f"- ID:{task['id']} | {task['content']} | 优先级:{task['priority']} | 预计时长:{task['estimated_duration']}分钟"
-            if task['deadline']:
-                prompt += f" | 截止:{task['deadline']}"
+            prompt += f"- ID:{task.id} | {task.content} | 优先级:{task.priority} | 预计时长:{task.estimated_duration}分钟"
+            if task.deadline:
+                prompt += f" | 截止:{task.deadline}"
             prompt += "\n"
         
         prompt += """
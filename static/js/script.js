@@ -3,6 +3,7 @@ let currentModule = 'todo';
 let currentView = 'day';
 let currentDate = new Date();
 let allTasks = [];
+let taskSyncVersion = 0;
 let allFixedSchedules = [];
 let ocrRecognizedSchedules = [];
 
@@ -27,10 +28,11 @@ function initApp() {
     updateCurrentTimeLine();
     setInterval(updateCurrentTimeLine, 60000); // ÿӸ
     
-    // Զˢ
-    setInterval(() => {
-        loadTasks();
-        renderTimeline();
+    // Զˢ£ֻȡб仯ػ棩
+    setInterval(async () => {
+        if (await syncTasks()) {
+            renderTimeline();
+        }
     }, 30000); // ÿ30ˢ
     
     // ʼԻ
@@ -323,6 +325,7 @@ async function loadTasks() {
         
         if (data.success) {
             allTasks = data.tasks;
+            taskSyncVersion = data.version;
             renderTaskList();
         }
     } catch (error) {
@@ -330,6 +333,29 @@ async function loadTasks() {
     }
 }
 
+// ͬ񣬷Ƿб仯
+async function syncTasks() {
+    try {
+        const response = await fetch(`/api/tasks?since=${taskSyncVersion}`);
+        const data = await response.json();
+        
+        if (!data.success) return false;
+        taskSyncVersion = data.version;
+        if (data.tasks.length === 0 && data.deleted.length === 0) return false;
+        
+        const changed = new Set(data.tasks.map(task => task.id));
+        const deleted = new Set(data.deleted);
+        allTasks = allTasks
+            .filter(task => !deleted.has(task.id) && !changed.has(task.id))
+            .concat(data.tasks);
+        renderTaskList();
+        return true;
+    } catch (error) {
+        console.error('ͬʧ:', error);
+        return false;
+    }
+}
+
 // 
 async function addTask() {
     const input = document.getElementById('taskInput');
@@ -947,14 +973,17 @@ async function clearSchedule() {
         // ȡڵ
         const scheduledTasks = allTasks.filter(t => t.scheduled_start);
         
-        // 
-        for (const task of scheduledTasks) {
-            await fetch(`/api/tasks/${task.id}`, {
-                method: 'PUT',
+        // һ
+        if (scheduledTasks.length > 0) {
+            await fetch('/api/tasks/batch', {
+                method: 'PATCH',
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({
-                    scheduled_start: null,
-                    scheduled_end: null
+                    updates: scheduledTasks.map(task => ({
+                        id: task.id,
+                        scheduled_start: null,
+                        scheduled_end: null
+                    }))
                 })
             });
         }
@@ -0,0 +1,339 @@
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+# 置信度不低于这个值时直接采用规则解析结果，不调用 LLM
+CONFIDENCE_THRESHOLD = float(os.getenv('PARSE_CONFIDENCE', '0.7'))
+# 按天统计保留的天数
+STATS_DAYS = 7
+
+_CN_DIGITS = {'零': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4,
+              '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+# 周一=0 … 周日=6（与 date.weekday() 一致，中文里一周从周一开始）
+_CN_WEEKDAYS = {'一': 0, '二': 1, '三': 2, '四': 3, '五': 4, '六': 5, '日': 6, '天': 6}
+_EN_WEEKDAYS = {name: i for i, name in enumerate(
+    ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'))}
+
+_NUM = r'(?:\d+(?:\.\d+)?|[零一二两三四五六七八九十]+)'
+_BEFORE = r'(?:之前|以前|前|截止|为止)?'
+
+# 时间：下午3点、15:00、3点半、晚上8点20、3pm；时段词里的今晚/明早/明晚同时决定日期
+TIME = re.compile(
+    r'(?P<period>凌晨|早上|早晨|上午|中午|下午|傍晚|晚上|今晚|明早|明晚)?\s*'
+    r'(?:(?P<h>' + _NUM + r')\s*(?:点|时)\s*(?P<m>\d{1,2}\s*分?|半|一刻|三刻)?'
+    r'|(?P<h2>\d{1,2})\s*[:：]\s*(?P<m2>\d{2})'
+    r'|(?P<h3>\d{1,2})(?::(?P<m3>\d{2}))?\s*(?P<ampm>am|pm))' + _BEFORE,
+    re.IGNORECASE)
+# 绝对日期：2026-10-20、10/20、10月20日（"1-2h" 这样的时长范围不算）
+ABSOLUTE_DATE = re.compile(
+    r'(?:(?P<y>\d{4})\s*[-/年]\s*)?(?P<mo>\d{1,2})\s*[-/月]\s*(?P<d>\d{1,2})'
+    r'(?!\s*(?:小时|钟头|个|分钟|h|m)(?![a-z]))\s*[日号]?' + _BEFORE, re.IGNORECASE)
+# 相对日期：今天、明天、后天、大后天、3天后、tomorrow
+RELATIVE_DAY = re.compile(
+    r'(?P<word>今天|今日|明天|明日|大后天|后天|today|tonight|tomorrow)' + _BEFORE
+    + r'|(?P<n>' + _NUM + r')\s*天(?:后|之后|以后|内)'
+    + r'|in\s+(?P<en>\d+)\s+days?',
+    re.IGNORECASE)
+# 星期：周五前、下周三、本周日、next friday
+WEEKDAY = re.compile(
+    r'(?P<prefix>下下|下个?|本|这个?)?\s*(?:周|星期|礼拜)(?P<d>[一二三四五六日天])' + _BEFORE
+    + r'|(?:(?P<en_prefix>next|this)\s+)?(?P<en>monday|tuesday|wednesday|thursday|friday|saturday|sunday)',
+    re.IGNORECASE)
+MONTH_END = re.compile(r'(?P<next>下个?)?月底' + _BEFORE)
+# 时长：2h、1.5小时、一个半小时、半小时、30m、45分钟、1h30m、90 min；范围（1-2h）取上限
+DURATION = re.compile(
+    r'(?:\d+(?:\.\d+)?\s*[-~到至]\s*)?(?P<h>' + _NUM + r')\s*(?P<half>个半)?\s*个?\s*(?:小时|钟头|hours?|hrs?|h)(?![a-z])(?P<half2>半)?'
+    r'(?:\s*(?P<hm>\d{1,2})\s*(?:分钟|分|minutes?|mins?|m)(?![a-z]))?'
+    r'|(?P<half_only>半)\s*个?\s*(?:小时|钟头)'
+    r'|(?P<m>' + _NUM + r')\s*(?:分钟|minutes?|mins?|m)(?![a-z])',
+    re.IGNORECASE)
+# 优先级：先判断“不急”，避免被“急”命中
+PRIORITY_LOW = re.compile(r'不急|不着急|有空|闲时|随便|可选|optional|someday|low\s+priority', re.IGNORECASE)
+PRIORITY_HIGH = re.compile(r'紧急|很急|加急|急|重要|马上|立刻|尽快|务必|asap|urgent|important|!{2,}|！{2,}',
+                           re.IGNORECASE)
+CATEGORIES = [
+    ('学习', re.compile(r'作业|复习|预习|考试|课|论文|背单词|单词|学习|阅读|读书|实验|刷题|study|homework|exam|lecture',
+                       re.IGNORECASE)),
+    ('工作', re.compile(r'报告|周报|日报|月报|会议|开会|邮件|客户|方案|汇报|需求|上线|代码|bug|评审|合同|PPT|文档|'
+                       r'report|meeting|email|review|deploy', re.IGNORECASE)),
+    ('生活', re.compile(r'买|购物|做饭|洗|打扫|收拾|缴费|交费|取快递|快递|健身|跑步|运动|医院|看病|体检|理发|'
+                       r'超市|菜|遛狗|shopping|gym|laundry|grocer', re.IGNORECASE)),
+]
+# 含糊、需要理解语义的说法交给 LLM
+AMBIGUOUS = re.compile(r'还是|或者|如果|看情况|不确定|大概|也许|可能|[?？]|\bor\b|\bmaybe\b', re.IGNORECASE)
+_PUNCT = re.compile(r'^[\s，,。.;；:：、!！\-—~]+|[\s，,。.;；:：、!！\-—~]+$')
+_SPACES = re.compile(r'\s+')
+
+
+def cn_number(text: str) -> float:
+    """'3' / '1.5' / '十五' / '两' / '二十' -> 数值"""
+    if re.fullmatch(r'\d+(?:\.\d+)?', text):
+        return float(text)
+    if '十' in text:
+        tens, _, ones = text.partition('十')
+        return (_CN_DIGITS.get(tens, 1) if tens else 1) * 10 + (_CN_DIGITS.get(ones, 0) if ones else 0)
+    value = 0
+    for char in text:
+        value = value * 10 + _CN_DIGITS.get(char, 0)
+    return value
+
+
+def week_start(day: date) -> date:
+    """所在周的周一（中文里一周从周一开始；recurrence 的周编号从周日开始，不要混用）"""
+    return day - timedelta(days=day.weekday())
+
+
+def parse(text: str, now: Optional[datetime] = None) -> Dict:
+    """
+    规则解析任务文本
+
+    Returns:
+        与 analyze_task 相同的字段（task / category / priority / estimated_duration / deadline /
+        deadline_iso），另有 confidence（0~1）和 source='rules'；
+        没识别出的字段取默认值：分类 '其他'、优先级 'medium'、时长 '60m'、截止时间 None
+    """
+    now = now or datetime.now()
+    rest = ' '.join(text.split())
+    found = {}
+
+    # 时间先于日期和时长解析："3点15分" 不会被当成 15 分钟
+    hour_minute, day = None, None
+    match = TIME.search(rest)
+    if match:
+        hour_minute = _clock(match)
+        period = match.group('period') or ''
+        if period.startswith('明'):
+            day = now.date() + timedelta(days=1)
+        elif period == '今晚':
+            day = now.date()
+        rest = _cut(rest, match)
+
+    if day is None:
+        day, rest = _parse_day(rest, now.date())
+
+    if day is not None or hour_minute is not None:
+        if day is None:
+            # 只说了几点：今天这个时间已经过了就是明天
+            day = now.date()
+            if (now.hour, now.minute) >= hour_minute:
+                day += timedelta(days=1)
+        found['deadline'] = (f'{day.isoformat()}T{hour_minute[0]:02d}:{hour_minute[1]:02d}:00'
+                             if hour_minute else day.isoformat())
+
+    match = DURATION.search(rest)
+    if match:
+        minutes = _duration_minutes(match)
+        if minutes > 0:
+            found['estimated_duration'] = minutes
+        rest = _cut(rest, match)
+
+    priority = None
+    for name, pattern in (('low', PRIORITY_LOW), ('high', PRIORITY_HIGH)):
+        match = pattern.search(rest)
+        if match:
+            priority = name
+            rest = _cut(rest, match)
+            break
+
+    category = next((name for name, pattern in CATEGORIES if pattern.search(rest)), None)
+    content = _PUNCT.sub('', _SPACES.sub(' ', rest))
+
+    duration = found.get('estimated_duration')
+    deadline = found.get('deadline')
+    return {
+        'task': content or text.strip(),
+        'category': category or '其他',
+        'priority': priority or 'medium',
+        'estimated_duration': f'{duration or 60}m',
+        'deadline': deadline,
+        'deadline_iso': deadline,
+        'confidence': _confidence(text, content, duration, deadline, category, priority),
+        'source': 'rules'
+    }
+
+
+def _confidence(text: str, content: str, duration, deadline, category, priority) -> float:
+    """
+    置信度：识别出的字段越多越高；剩下的描述太长或有含糊说法时降低
+    时长最重要（没有时只能用默认 60 分钟），其次分类、截止时间、优先级
+    """
+    if len(content) < 2:
+        return 0.0
+    score = 0.3
+    score += 0.35 if duration else 0
+    score += 0.2 if category else 0
+    score += 0.2 if deadline else 0
+    score += 0.1 if priority else 0
+    if len(content) > 20:
+        score -= 0.2
+    if AMBIGUOUS.search(text):
+        score -= 0.4
+    return round(max(0.0, min(score, 1.0)), 2)
+
+
+def _cut(text: str, match) -> str:
+    return text[:match.start()] + ' ' + text[match.end():]
+
+
+def _clock(match) -> tuple:
+    """TIME 的匹配 -> (时, 分)，按时段换算成 24 小时制"""
+    if match.group('h3'):
+        hour, minute = int(match.group('h3')), int(match.group('m3') or 0)
+        if match.group('ampm').lower() == 'pm' and hour < 12:
+            hour += 12
+        return hour % 24, minute
+    if match.group('h2'):
+        return int(match.group('h2')) % 24, min(int(match.group('m2')), 59)
+
+    hour = int(cn_number(match.group('h')))
+    text = (match.group('m') or '').replace('分', '').strip()
+    minute = {'半': 30, '一刻': 15, '三刻': 45}.get(text)
+    if minute is None:
+        minute = int(text or 0)
+    period = match.group('period') or ''
+    if period in ('下午', '傍晚', '晚上', '今晚', '明晚') and hour < 12:
+        hour += 12
+    elif period == '中午' and hour < 11:
+        hour += 12
+    return hour % 24, min(minute, 59)
+
+
+def _parse_day(text: str, today: date) -> tuple:
+    """识别日期，返回 (date 或 None, 去掉日期后的文本)"""
+    match = ABSOLUTE_DATE.search(text)
+    if match:
+        year = int(match.group('y') or today.year)
+        try:
+            day = date(year, int(match.group('mo')), int(match.group('d')))
+        except ValueError:
+            day = None
+        if day is not None:
+            # 没写年份且日期已过，指明年
+            if not match.group('y') and day < today:
+                try:
+                    day = day.replace(year=year + 1)
+                except ValueError:
+                    pass
+            return day, _cut(text, match)
+
+    match = RELATIVE_DAY.search(text)
+    if match:
+        if match.group('word'):
+            offset = {'今天': 0, '今日': 0, 'today': 0, 'tonight': 0, '明天': 1, '明日': 1,
+                      'tomorrow': 1, '后天': 2, '大后天': 3}[match.group('word').lower()]
+        else:
+            offset = int(cn_number(match.group('n') or match.group('en')))
+        return today + timedelta(days=offset), _cut(text, match)
+
+    match = WEEKDAY.search(text)
+    if match:
+        if match.group('d'):
+            weekday, prefix = _CN_WEEKDAYS[match.group('d')], match.group('prefix') or ''
+            weeks = 2 if prefix == '下下' else 1 if prefix.startswith('下') else 0
+            explicit = bool(prefix)
+        else:
+            weekday = _EN_WEEKDAYS[match.group('en').lower()]
+            en_prefix = (match.group('en_prefix') or '').lower()
+            weeks = 1 if en_prefix == 'next' else 0
+            explicit = bool(en_prefix)
+        day = week_start(today) + timedelta(days=7 * weeks + weekday)
+        if not explicit and day < today:
+            # 只说"周五"且本周五已过，指下周五
+            day += timedelta(days=7)
+        return day, _cut(text, match)
+
+    match = MONTH_END.search(text)
+    if match:
+        first = date(today.year + (today.month // 12), today.month % 12 + 1, 1)
+        if match.group('next'):
+            first = date(first.year + (first.month // 12), first.month % 12 + 1, 1)
+        return first - timedelta(days=1), _cut(text, match)
+
+    return None, text
+
+
+def _duration_minutes(match) -> int:
+    if match.group('half_only'):
+        return 30
+    if match.group('m'):
+        return int(cn_number(match.group('m')))
+    hours = cn_number(match.group('h'))
+    if match.group('half') or match.group('half2'):
+        hours += 0.5
+    return int(hours * 60) + int(match.group('hm') or 0)
+
+
+class ParserStats:
+    """
+    快速解析统计：命中率（不用调 LLM 的比例）、规则解析耗时、LLM 解析耗时，
+    以及按天估算省下的 API 调用次数和秒数（命中数 × LLM 平均耗时）
+    """
+
+    def __init__(self, days: int = STATS_DAYS):
+        self.days = days
+        self._lock = threading.Lock()
+        self._by_day = {}
+        self._totals = {'parsed': 0, 'fast_path': 0, 'parse_seconds': 0.0, 'parse_max_seconds': 0.0,
+                        'llm_calls': 0, 'llm_seconds': 0.0}
+
+    def record_parse(self, seconds: float, fast_path: bool):
+        with self._lock:
+            self._totals['parsed'] += 1
+            self._totals['fast_path'] += fast_path
+            self._totals['parse_seconds'] += seconds
+            self._totals['parse_max_seconds'] = max(self._totals['parse_max_seconds'], seconds)
+            day = self._today()
+            day['parsed'] += 1
+            day['fast_path'] += fast_path
+
+    def record_llm(self, seconds: float):
+        with self._lock:
+            self._totals['llm_calls'] += 1
+            self._totals['llm_seconds'] += seconds
+            self._today()['llm_calls'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            t = self._totals
+            avg_llm = t['llm_seconds'] / t['llm_calls'] if t['llm_calls'] else None
+            return {
+                'parsed': t['parsed'],
+                'fast_path': t['fast_path'],
+                'hit_rate': round(t['fast_path'] / t['parsed'], 3) if t['parsed'] else None,
+                'avg_parse_us': round(t['parse_seconds'] / t['parsed'] * 1e6, 1) if t['parsed'] else None,
+                'max_parse_us': round(t['parse_max_seconds'] * 1e6, 1),
+                'llm_calls': t['llm_calls'],
+                'avg_llm_ms': round(avg_llm * 1000, 1) if avg_llm is not None else None,
+                'threshold': CONFIDENCE_THRESHOLD,
+                'days': {
+                    day: dict(counts, saved_calls=counts['fast_path'],
+                              saved_seconds=round(counts['fast_path'] * avg_llm, 1)
+                              if avg_llm is not None else None)
+                    for day, counts in sorted(self._by_day.items())
+                }
+            }
+
+    def _today(self) -> Dict:
+        """今天的计数（调用方持有锁），同时丢掉超出保留天数的旧记录"""
+        key = date.today().isoformat()
+        if key not in self._by_day:
+            self._by_day[key] = {'parsed': 0, 'fast_path': 0, 'llm_calls': 0}
+            for old in sorted(self._by_day)[:-self.days]:
+                del self._by_day[old]
+        return self._by_day[key]
+
+
+stats = ParserStats()
+
+
+def quick_parse(text: str, now: Optional[datetime] = None,
+                threshold: float = CONFIDENCE_THRESHOLD) -> Dict:
+    """规则解析并计入统计；结果的 fast_path 表示置信度达到阈值、可以不调用 LLM"""
+    started = time.perf_counter()
+    result = parse(text, now)
+    result['fast_path'] = result['confidence'] >= threshold
+    stats.record_parse(time.perf_counter() - started, result['fast_path'])
+    return result
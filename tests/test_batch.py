@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from batch import BatchPlanner
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(str(tmp_path / 'tasks.db'))
+    # 09:00-18:00：一天正好放下 3 个 180 分钟的任务
+    database.update_user_preferences(work_start_time='09:00', work_end_time='18:00')
+    return database
+
+
+def upcoming(days):
+    return [(datetime.now() + timedelta(days=d)).strftime('%Y-%m-%d') for d in range(1, days + 1)]
+
+
+@pytest.mark.parametrize('strategy', ['greedy', 'edf'])
+def test_tasks_overflowing_first_day_move_to_later_days(db, strategy):
+    for i in range(8):
+        db.add_task(f'任务{i}', estimated_duration=180)
+    dates = upcoming(3)
+
+    results = BatchPlanner(db, max_workers=1).run(dates, strategy=strategy)
+
+    assert [r['date'] for r in results] == dates
+    assert [len(r['scheduled']) for r in results] == [3, 3, 2]
+    assert all(not r['unscheduled'] for r in results)
+    assert db.get_pending_unscheduled_tasks() == []
+    for r in results:
+        assert all(s['scheduled_start'].startswith(r['date']) for s in r['scheduled'])
+
+
+def test_tasks_beyond_horizon_are_reported_on_last_day(db):
+    ids = [db.add_task(f'任务{i}', estimated_duration=180) for i in range(11)]
+    results = BatchPlanner(db, max_workers=1).run(upcoming(3))
+
+    assert sum(len(r['scheduled']) for r in results) == 9
+    assert [len(r['unscheduled']) for r in results] == [0, 0, 2]
+    scheduled = {s['id'] for r in results for s in r['scheduled']}
+    assert set(results[-1]['unscheduled']) == set(ids) - scheduled
+
+
+def test_carry_over_when_day_strategy_packs_worse_than_estimate(db):
+    # 每天 09:00-15:20，11:30-12:00 有课：空档 150 + 200 分钟
+    db.update_user_preferences(work_start_time='09:00', work_end_time='15:20')
+    for day_of_week in range(7):
+        db.add_fixed_schedule('课', day_of_week, '11:30', '12:00')
+    deadline = (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')
+    # 按截止时间的预估：150 放进第一个空档，两个 100 放进第二个，全在第一天；
+    # 当天的 greedy 先放高优先级的两个 100，第一个空档被切碎，150 放不下，顺延到第二天
+    long_id = db.add_task('长任务', priority='low', estimated_duration=150, deadline=deadline)
+    db.add_task('短任务1', priority='high', estimated_duration=100)
+    db.add_task('短任务2', priority='high', estimated_duration=100)
+    dates = upcoming(2)
+
+    results = BatchPlanner(db, max_workers=1).run(dates)
+
+    assert [len(r['scheduled']) for r in results] == [2, 1]
+    assert results[1]['scheduled'][0]['id'] == long_id
+    assert results[1]['scheduled'][0]['scheduled_start'] == f'{dates[1]}T09:00:00'
+    assert all(not r['unscheduled'] for r in results)
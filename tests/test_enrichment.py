@@ -0,0 +1,32 @@
+import threading
+
+from database import Database
+from enrichment import TaskEnricher
+
+
+class BrokenStatusDatabase(Database):
+    """记录失败状态时数据库出错"""
+
+    def set_enrichment_status(self, task_id, status):
+        raise RuntimeError('database is locked')
+
+
+def test_on_done_runs_when_recording_failure_raises(tmp_path):
+    db = BrokenStatusDatabase(str(tmp_path / 'tasks.db'))
+    task = db.get_task(db.add_task('写周报', enrichment_status='pending'))
+    done, finished = [], threading.Event()
+
+    def analyze(text):
+        raise ValueError('LLM 超时')
+
+    def on_done(*args):
+        done.append(args)
+        finished.set()
+
+    enricher = TaskEnricher(db, analyze, on_done=on_done, max_workers=1)
+    assert enricher.submit(task)
+    assert finished.wait(5)
+    enricher.shutdown(wait=True)
+
+    assert done == [(task, None, 'failed')]
+    assert enricher.stats()['in_flight'] == 0
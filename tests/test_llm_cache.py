@@ -0,0 +1,33 @@
+from datetime import datetime
+
+import task_parser
+from llm_cache import rebase_deadline
+
+
+def test_week_relative_hit_on_sunday_stays_in_same_week():
+    # 周三解析、周日命中缓存：周一开始的周里两天同属一周，不平移
+    resolved_at = datetime(2026, 10, 14, 10, 0)
+    now = datetime(2026, 10, 18, 10, 0)
+    rebased = rebase_deadline('下周三开会', '2026-10-21', resolved_at, now)
+    assert rebased == '2026-10-21'
+    assert rebased == task_parser.parse('下周三开会', now)['deadline']
+
+
+def test_week_relative_hit_on_next_monday_shifts_one_week():
+    resolved_at = datetime(2026, 10, 18, 10, 0)
+    now = datetime(2026, 10, 19, 10, 0)
+    rebased = rebase_deadline('下周三开会', '2026-10-21', resolved_at, now)
+    assert rebased == '2026-10-28'
+    assert rebased == task_parser.parse('下周三开会', now)['deadline']
+
+
+def test_day_relative_keeps_time_of_day():
+    resolved_at = datetime(2026, 10, 14, 10, 0)
+    now = datetime(2026, 10, 18, 9, 0)
+    assert rebase_deadline('明天下午3点交报告', '2026-10-15T15:00:00', resolved_at, now) == '2026-10-19T15:00:00'
+
+
+def test_absolute_date_is_not_shifted():
+    resolved_at = datetime(2026, 10, 14, 10, 0)
+    now = datetime(2026, 10, 18, 10, 0)
+    assert rebase_deadline('10月21日开会', '2026-10-21', resolved_at, now) == '2026-10-21'
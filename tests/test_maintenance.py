@@ -0,0 +1,23 @@
+import sqlite3
+
+from database import Database
+
+
+def test_new_database_starts_with_incremental_auto_vacuum(tmp_path):
+    path = str(tmp_path / 't.db')
+    db = Database(path)
+    assert sqlite3.connect(path).execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    # 不需要首次完整 VACUUM
+    assert db.vacuum() == 'incremental'
+
+
+def test_existing_database_is_converted_once(tmp_path):
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE legacy (id INTEGER PRIMARY KEY)')
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    assert db.vacuum() == 'full'
+    assert db.vacuum() == 'incremental'
@@ -0,0 +1,12 @@
+from database import HOT_QUERIES, Database
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    db = Database(str(tmp_path / 't.db'))
+    assert db.full_scan_queries() == {}
+
+
+def test_every_hot_query_is_explained(tmp_path):
+    db = Database(str(tmp_path / 't.db'))
+    for name, params in HOT_QUERIES.items():
+        assert db.explain(name, params), name
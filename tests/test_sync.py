@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 't.db'))
+
+
+def iso(days=0):
+    return (datetime.now() + timedelta(days=days)).isoformat(timespec='seconds')
+
+
+def test_recent_tombstones_are_kept(db):
+    task_id = db.add_task('删掉的任务')
+    since = db.get_sync_version()
+    db.delete_task(task_id)
+
+    assert db.prune_tombstones(iso(-30)) == 0
+    changes = db.get_task_changes(since)
+    assert changes['deleted'] == [task_id]
+    assert not changes['full']
+
+
+def test_pruned_tombstones_force_full_sync_for_stale_cursors(db):
+    kept = db.add_task('留下的任务')
+    removed = db.add_task('删掉的任务')
+    stale = db.get_sync_version()
+    db.delete_task(removed)
+    fixed_id = db.add_fixed_schedule('课', 1, '08:00', '09:40')
+    db.delete_fixed_schedule(fixed_id)
+    fresh = db.get_sync_version()
+
+    # 截止时间取未来：现有墓碑都算过期
+    assert db.prune_tombstones(iso(1)) == 2
+
+    changes = db.get_task_changes(stale)
+    assert changes['full']
+    assert [t.id for t in changes['tasks']] == [kept]
+    assert changes['deleted'] == []
+    assert db.get_fixed_schedule_changes(stale)['full']
+
+    # 清理之后才同步过的客户端照常拿增量
+    later = db.add_task('新任务')
+    changes = db.get_task_changes(fresh)
+    assert not changes['full']
+    assert [t.id for t in changes['tasks']] == [later]
@@ -0,0 +1,69 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+from engine import Problem, place_in_order, solve
+from intervals import FreeIntervals
+
+
+WORK_START, WORK_END = 8 * 60, 22 * 60
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'tasks.db'))
+
+
+def random_deadline(rng, day):
+    """同一时刻的几种写法混在一起：空格分隔、带秒、带时区、只有日期、次日 0 点"""
+    value = day + timedelta(days=rng.randint(0, 2), hours=rng.choice([0, 9, 15]),
+                            minutes=rng.choice([0, 30]))
+    return rng.choice([
+        None,
+        value.strftime('%Y-%m-%d'),
+        value.strftime('%Y-%m-%d %H:%M'),
+        value.strftime('%Y-%m-%dT%H:%M'),
+        value.strftime('%Y-%m-%dT%H:%M:%S'),
+        value.strftime('%Y-%m-%dT%H:%M:%S+08:00'),
+        value.replace(hour=0, minute=0).strftime('%Y-%m-%dT%H:%M:%S'),
+    ])
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_streaming_greedy_matches_engine(db, seed):
+    rng = random.Random(seed)
+    day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for i in range(30):
+        db.add_task(f'任务{i}', priority=rng.choice(['high', 'medium', 'low']),
+                    estimated_duration=rng.choice([30, 60, 90]),
+                    deadline=random_deadline(rng, day))
+    tasks = sorted(db.get_pending_unscheduled_tasks(), key=lambda t: t.id)
+
+    problem = Problem(tasks, [], WORK_START, WORK_END, day=day.strftime('%Y-%m-%d'))
+    expected = [(tasks[i].id, start) for i, start in solve(problem, 'greedy').placements]
+
+    free = FreeIntervals(WORK_START, WORK_END, [])
+    streamed = [(task.id, start) for task, start, _ in place_in_order(
+        db.iter_unscheduled_tasks(batch_size=7, max_duration=free.longest), free, WORK_START)]
+
+    assert streamed == expected
+
+
+def test_existing_deadlines_are_normalized_on_upgrade(tmp_path):
+    path = str(tmp_path / 'old.db')
+    db = Database(path)
+    ids = [db.add_task(f'任务{i}') for i in range(4)]
+    conn = db.get_connection()
+    with conn:
+        for task_id, deadline in zip(ids, ['2025-01-02 15:30', '2025-01-02T15:30:45+08:00',
+                                           '2025-01-02', 'next week']):
+            conn.execute('UPDATE tasks SET deadline = ? WHERE id = ?', (deadline, task_id))
+        conn.execute('PRAGMA user_version = 10')
+    conn.close()
+
+    db = Database(path)
+
+    assert [db.get_task(task_id).deadline for task_id in ids] == [
+        '2025-01-02T15:30:00', '2025-01-02T15:30:00', '2025-01-02', None]